@@ -1,13 +1,262 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from typing import Optional, List, Dict
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Iterator
+import asyncio
+import copy
+import hashlib
+import itertools
 import json
 import os
-from groq import Groq
+import re
+import time
+import weakref
+from groq import Groq, AsyncGroq, DefaultHttpxClient, DefaultAsyncHttpxClient
+import httpx
+import budget_engine
+import calculators
+import model_tiers
+from cache import SemanticResponseCache, normalize_query
+from completion_cache import CompletionCache
+from context_packer import estimate_tokens, pack_context
+from llm_scheduler import LLMScheduler
+from resilience import Dependency
+from router import route_question
+from singleflight import SingleFlight
 
 load_dotenv()
 
+# "groq" (default) or "local" for the offline stand-in in local_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+
+# Every LLM call gets a timeout, jittered retries and a circuit breaker
+# (the SDK's own retries are off so they don't multiply with ours)
+llm = Dependency(
+    "groq",
+    timeout=GROQ_TIMEOUT,
+    max_retries=int(os.getenv("GROQ_MAX_RETRIES", "2")),
+)
+
+# Every LLM request waits for a slot: Groq's per-minute request and token
+# limits, priorities (interactive advice first) and fair turns between users
+scheduler = LLMScheduler(
+    requests_per_minute=float(os.getenv("LLM_RPM", "30")),
+    tokens_per_minute=float(os.getenv("LLM_TPM", "12000")),
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "8")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "60")),
+)
+
+# One pooled keep-alive connection pool per client, shared by every session
+LLM_HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10")),
+    keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+)
+
+# Completions persisted to local disk and shared by every server process,
+# so a restart answers prompts it has seen from disk (empty path disables)
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", ".completion_cache.db")
+
+def _open_completion_cache() -> Optional[CompletionCache]:
+    if not COMPLETION_CACHE_PATH:
+        return None
+    try:
+        return CompletionCache(
+            COMPLETION_CACHE_PATH,
+            ttl=float(os.getenv("COMPLETION_CACHE_TTL", str(7 * 86400))) or None,
+            max_entries=int(os.getenv("COMPLETION_CACHE_SIZE", "5000")),
+        )
+    except Exception as e:
+        print(f"[COMPLETION CACHE] Disabled, could not open {COMPLETION_CACHE_PATH}: {e}")
+        return None
+
+completion_cache = _open_completion_cache()
+
 # Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+if LLM_BACKEND == "local":
+    from local_llm import LocalChatClient
+    client = LocalChatClient(latency=float(os.getenv("LOCAL_LLM_LATENCY_MS", "0")) / 1000,
+                             token_latency=float(os.getenv("LOCAL_LLM_TOKEN_MS", "0")) / 1000,
+                             tail_rate=float(os.getenv("LOCAL_LLM_TAIL_RATE", "0")),
+                             tail_latency=float(os.getenv("LOCAL_LLM_TAIL_MS", "0")) / 1000)
+else:
+    client = Groq(api_key=os.getenv("GROQ_API_KEY"), timeout=GROQ_TIMEOUT, max_retries=0,
+                  http_client=DefaultHttpxClient(limits=LLM_HTTP_LIMITS))
+
+# Async clients hold connections bound to an event loop: one per running loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client() -> AsyncGroq:
+    if LLM_BACKEND == "local":
+        return client.as_async()
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"), timeout=GROQ_TIMEOUT, max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=LLM_HTTP_LIMITS)
+        )
+    return _async_clients[loop]
+
+
+def _request_tokens(request: Dict) -> int:
+    """Tokens a request may use, for the scheduler: prompt estimate + max_tokens"""
+    prompt = sum(estimate_tokens(m.get("content", "")) for m in request.get("messages", []))
+    return prompt + request.get("max_tokens", 1024)
+
+
+def _usage_tokens(response) -> Optional[int]:
+    return getattr(getattr(response, "usage", None), "total_tokens", None)
+
+
+def _throttle_on_rate_limit(error: Exception):
+    """On a 429, hold the scheduler for Retry-After (or a short default)"""
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) != 429 and getattr(response, "status_code", None) != 429:
+        return
+    try:
+        delay = float(response.headers.get("retry-after", 1.0))
+    except (AttributeError, TypeError, ValueError):
+        delay = 1.0
+    scheduler.throttle(delay)
+
+
+def _cached_response(request: Dict, content: str):
+    """A completion cache hit, shaped like the client's response (or stream)"""
+    if request.get("stream"):
+        delta = SimpleNamespace(content=content)
+        return iter([SimpleNamespace(model=request.get("model"),
+                                     choices=[SimpleNamespace(delta=delta, finish_reason="stop")])])
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(model=request.get("model"), usage=None,
+                           choices=[SimpleNamespace(message=message, finish_reason="stop")])
+
+
+def _recording_stream(request: Dict, stream) -> Iterator:
+    """Pass a stream through, caching its text once it finishes"""
+    parts = []
+    finished = False
+    try:
+        for chunk in stream:
+            if chunk.choices:
+                parts.append(chunk.choices[0].delta.content or "")
+                finished = finished or chunk.choices[0].finish_reason is not None
+            yield chunk
+    finally:
+        # Closing this generator early (an abandoned stream) closes the response too
+        close = getattr(stream, "close", None)
+        if close is not None and not finished:
+            close()
+    # A stream abandoned or cut short is not a complete answer
+    if finished:
+        completion_cache.set(request, "".join(parts))
+
+
+def _remember_completion(request: Dict, response):
+    if completion_cache is None:
+        return response
+    if request.get("stream"):
+        return _recording_stream(request, response)
+    content = response.choices[0].message.content if response.choices else None
+    if content is not None:
+        completion_cache.set(request, content)
+    return response
+
+
+def chat_completion(user_id=None, priority: str = "standard", **request):
+    """
+    client.chat.completions.create(**request) through the completion cache,
+    the scheduler and the groq Dependency (timeout, retries, circuit breaker)
+    """
+    cached = completion_cache.get(request) if completion_cache else None
+    if cached is not None:
+        return _cached_response(request, cached)
+    with scheduler.slot(user_id, priority, _request_tokens(request)) as slot:
+        try:
+            response = llm.call(client.chat.completions.create, **request)
+        except Exception as e:
+            _throttle_on_rate_limit(e)
+            raise
+        slot.used(_usage_tokens(response))
+    return _remember_completion(request, response)
+
+
+async def achat_completion(user_id=None, priority: str = "standard", **request):
+    """Async chat_completion (AsyncGroq); async streams are not cached"""
+    cacheable = completion_cache is not None and not request.get("stream")
+    cached = completion_cache.get(request) if cacheable else None
+    if cached is not None:
+        return _cached_response(request, cached)
+    async with scheduler.aslot(user_id, priority, _request_tokens(request)) as slot:
+        try:
+            response = await llm.acall(lambda: get_async_client().chat.completions.create(**request))
+        except Exception as e:
+            _throttle_on_rate_limit(e)
+            raise
+        slot.used(_usage_tokens(response))
+    return _remember_completion(request, response) if cacheable else response
+
+
+# Hedged requests run on their own threads beside the caller (model_tiers.py)
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "8")),
+                                     thread_name_prefix="llm-hedge")
+
+
+def _winner(attempts: Dict, primary: str):
+    """The first attempt to succeed; the primary's error if all fail"""
+    pending = set(attempts)
+    errors = {}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future
+            errors[attempts[future]] = future.exception()
+    raise errors.get(primary) or next(iter(errors.values()))
+
+
+def tiered_call(task: str, attempt, label: Optional[str] = None, discard=None):
+    """
+    attempt(tier) on the task's tier (model_tiers.TASKS). When the task is
+    hedged and the primary is slower than model_tiers.hedge_delay, attempt
+    also runs on the hedge tier and the first success wins; discard(result)
+    is called on a losing attempt's result.
+
+    Latencies are recorded under `label` (default: the task).
+    Returns (result, generation metadata: tier, model, latency_ms, hedged).
+    """
+    label = label or task
+    primary = model_tiers.TASKS[task]["tier"]
+    start = time.perf_counter()
+
+    def timed(tier):
+        began = time.perf_counter()
+        result = attempt(tier)
+        model_tiers.latencies.record(label, tier, time.perf_counter() - began)
+        return result
+
+    def metadata(tier: str, hedged: bool, delay: Optional[float] = None) -> Dict:
+        info = {"tier": tier, "model": model_tiers.model_for(task, tier),
+                "latency_ms": (time.perf_counter() - start) * 1000, "hedged": hedged}
+        if delay is not None:
+            info["hedge_delay_ms"] = delay * 1000
+        return info
+
+    delay = model_tiers.hedge_delay(task, label)
+    if delay is None:
+        return timed(primary), metadata(primary, False)
+
+    attempts = {_hedge_executor.submit(timed, primary): primary}
+    if not wait(attempts, timeout=delay).done:
+        backup = model_tiers.TASKS[task]["hedge_tier"]
+        print(f"[LLM] {task}: {primary} tier slower than {delay * 1000:.0f} ms, hedging to {backup}")
+        attempts[_hedge_executor.submit(timed, backup)] = backup
+    winner = _winner(attempts, primary)
+    if discard is not None:
+        for future in attempts:
+            if future is not winner:
+                future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+    return winner.result(), metadata(attempts[winner], len(attempts) > 1, delay)
 
 def dict_to_string(obj, level=0):
     """Convert dictionary to readable string format"""
@@ -47,33 +296,7 @@ def retrieve_relevant_context(question: str, profile_id: int, limit: int = 5) ->
     try:
         # Perform semantic vector search
         results = search_notes_semantic(question, profile_id, limit=limit)
-        
-        # Check if fallback occurred (mock similarity score)
-        retrieval_method = "vector_search"
-        if results and results[0].get("$similarity") == 0.5:
-            retrieval_method = "keyword_fallback"
-        elif not results:
-             retrieval_method = "none"
-
-        if results:
-            return {
-                "retrieved_docs": [
-                    {
-                        "text": doc.get("text", ""),
-                        "similarity_score": doc.get("$similarity", 0.0),
-                        "metadata": doc.get("metadata", {})
-                    }
-                    for doc in results
-                ],
-                "retrieval_method": retrieval_method,
-                "num_retrieved": len(results)
-            }
-        else:
-            return {
-                "retrieved_docs": [],
-                "retrieval_method": "none",
-                "num_retrieved": 0
-            }
+        return _retrieval_result(results)
     except Exception as e:
         print(f"Retrieval error: {e}")
         return {
@@ -84,21 +307,91 @@ def retrieve_relevant_context(question: str, profile_id: int, limit: int = 5) ->
         }
 
 
-def augment_prompt_with_context(question: str, profile: dict, retrieved_context: Dict) -> str:
+async def aretrieve_relevant_context(question: str, profile_id: int, limit: int = 5) -> Dict:
+    """Async retrieve_relevant_context"""
+    from profiles import asearch_notes_semantic
+
+    try:
+        results = await asearch_notes_semantic(question, profile_id, limit=limit)
+        return _retrieval_result(results)
+    except Exception as e:
+        print(f"Retrieval error: {e}")
+        return {
+            "retrieved_docs": [],
+            "retrieval_method": "error",
+            "num_retrieved": 0,
+            "error": str(e)
+        }
+
+
+def _retrieval_result(results: List[Dict]) -> Dict:
+    """Shape raw search hits into the retrieval step's result"""
+    # Method reported by the search ("vector_search", "hybrid" or "keyword_fallback")
+    retrieval_method = results[0].get("$retrieval", "vector_search") if results else "vector_search"
+    # Check if fallback occurred (mock similarity score)
+    if results and results[0].get("$similarity") == 0.5 and "$retrieval" not in results[0]:
+        retrieval_method = "keyword_fallback"
+    elif not results:
+         retrieval_method = "none"
+
+    if results:
+        return {
+            # similarity_score is a cosine score, None for keyword-only hits;
+            # hybrid results also carry their fused rank score
+            "retrieved_docs": [
+                {
+                    "text": doc.get("text", ""),
+                    "similarity_score": doc.get("$similarity"),
+                    "keyword_score": doc.get("$bm25_rel"),
+                    "rrf_score": doc.get("$rrf"),
+                    "rank": rank,
+                    "metadata": doc.get("metadata", {})
+                }
+                for rank, doc in enumerate(results, 1)
+            ],
+            "retrieval_method": retrieval_method,
+            "num_retrieved": len(results)
+        }
+    else:
+        return {
+            "retrieved_docs": [],
+            "retrieval_method": "none",
+            "num_retrieved": 0
+        }
+
+
+def augment_prompt_with_context(question: str, profile: dict, retrieved_context: Dict,
+                                profile_str: Optional[str] = None) -> str:
     """
     RAG STEP 2: AUGMENTATION
     Combine user question with retrieved context and profile
     """
-    profile_str = dict_to_string(profile)
+    return build_augmented_prompt(question, profile, retrieved_context, profile_str)[0]
+
+
+def build_augmented_prompt(question: str, profile: dict, retrieved_context: Dict,
+                           profile_str: Optional[str] = None, profile_summary: Optional[str] = None):
+    """
+    augment_prompt_with_context, also returning the context packer's stats.
+    Profile and notes are packed into token budgets (see context_packer.py);
+    profile_str, the full profile dump, is only the baseline for tokens_saved.
+    profile_summary is a profile section packed ahead of time (speculative.py).
+    """
+    if profile_str is None:
+        profile_str = dict_to_string(profile)
+    packed = pack_context(profile, retrieved_context["retrieved_docs"], full_profile=profile_str,
+                          profile_text=profile_summary)
+    profile_str = packed["profile"]
     
     # Build context from retrieved documents
     context_sections = []
-    if retrieved_context["retrieved_docs"]:
+    if packed["notes"]:
         context_sections.append("RELEVANT FINANCIAL NOTES (Retrieved from Vector Database):")
-        for i, doc in enumerate(retrieved_context["retrieved_docs"], 1):
-            similarity = doc.get("similarity_score", 0)
+        for i, doc in enumerate(packed["notes"], 1):
+            similarity = doc.get("similarity_score")
             text = doc.get("text", "")
-            context_sections.append(f"{i}. [Relevance: {similarity:.2f}] {text}")
+            relevance = f"{similarity:.2f}" if similarity is not None else "keyword match"
+            context_sections.append(f"{i}. [Relevance: {relevance}] {text}")
     else:
         context_sections.append("No relevant notes found in database.")
     
@@ -125,79 +418,269 @@ INSTRUCTIONS:
 
 Provide your financial advice:"""
     
-    return augmented_prompt
+    return augmented_prompt, packed["stats"]
+
+
+RAG_MODEL = model_tiers.model_for("advice")
+RAG_TEMPERATURE = model_tiers.TASKS["advice"]["temperature"]
+# Show the advisor's answer as it is generated (time to first token)
+RAG_STREAMING = os.getenv("RAG_STREAMING", "1") == "1"
+# With RAG_TOOLS=1 the advice model may call calculators.TOOLS; each call
+# runs locally on the profile and its result goes back to the model, for up
+# to RAG_TOOL_ROUNDS rounds before it must answer. The model needs the tool
+# results before it can reply, so the streaming pipeline answers in one chunk.
+RAG_TOOLS = os.getenv("RAG_TOOLS", "0") == "1"
+RAG_TOOL_ROUNDS = int(os.getenv("RAG_TOOL_ROUNDS", "2"))
+
+
+def _rag_request(augmented_prompt: str, tier: Optional[str] = None) -> Dict:
+    """Chat completion arguments for the generation step on `tier` (default: the advice tier)"""
+    return {
+        **model_tiers.request_options("advice", tier),
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a professional financial advisor. Provide clear, well-formatted advice. Do not use LaTeX formatting."
+            },
+            {
+                "role": "user",
+                "content": augmented_prompt
+            }
+        ],
+        "top_p": 0.9,
+    }
+
+
+def format_rag_response(text: str) -> str:
+    """Post-process LLM output for display in Streamlit"""
+    import re
+    
+    # 1. Add space between number and text if missing (e.g., $100Monthly -> $100 Monthly)
+    text = re.sub(r'\$(\d+(?:,\d{3})*(?:\.\d{2})?)([a-zA-Z])', r'$\1 \2', text)
+    
+    # 2. Add spaces around math operators
+    text = re.sub(r'(\d)([-+*/])(\d)', r'\1 \2 \3', text)
+    
+    # 3. Fix concatenated words
+    text = re.sub(r'permonth', 'per month', text)
+    text = re.sub(r'peryear', 'per year', text)
+    
+    # 4. Remove .00 decimals
+    text = re.sub(r'\$(\d+(?:,\d{3})*)\.00\b', r'$\1', text)
+
+    # 5. CRITICAL FIX FOR FONT ISSUE:
+    # Streamlit interprets $...$ as LaTeX math mode, which changes the font.
+    # We replace all literal $ with \$ to escape them.
+    text = text.replace('$', '\\$')
+    
+    return text
+
+
+def _tool_call_message(message) -> Dict:
+    """The assistant's tool-call turn, as it is sent back in `messages`"""
+    return {
+        "role": "assistant",
+        "content": message.content or "",
+        "tool_calls": [
+            {"id": call.id, "type": "function",
+             "function": {"name": call.function.name, "arguments": call.function.arguments}}
+            for call in message.tool_calls
+        ],
+    }
+
+
+def _tool_result(call, profile: dict) -> str:
+    try:
+        result = calculators.run_tool(call.function.name, call.function.arguments, profile)
+    except (ValueError, KeyError, TypeError) as e:
+        result = {"error": str(e)}
+    print(f"[RAG] Tool call {call.function.name}({call.function.arguments})")
+    return json.dumps(result)
 
 
-def generate_rag_response(augmented_prompt: str) -> str:
+def complete_with_tools(request: Dict, profile: dict, user_id=None):
+    """
+    chat_completion() offering calculators.TOOLS: tool calls are run with
+    calculators.run_tool() on `profile` and answered until the model
+    replies with text (forced after RAG_TOOL_ROUNDS rounds)
+    """
+    messages = list(request["messages"])
+    for round_ in range(RAG_TOOL_ROUNDS + 1):
+        final = round_ == RAG_TOOL_ROUNDS
+        response = chat_completion(user_id, "interactive", **{
+            **request, "messages": messages, "tools": calculators.TOOLS,
+            "tool_choice": "none" if final else "auto",
+        })
+        message = response.choices[0].message
+        if final or not getattr(message, "tool_calls", None):
+            return response
+        messages.append(_tool_call_message(message))
+        messages.extend({"role": "tool", "tool_call_id": call.id, "content": _tool_result(call, profile)}
+                        for call in message.tool_calls)
+
+
+def generate_rag_response(augmented_prompt: str, user_id=None, generation: Optional[Dict] = None,
+                          profile: Optional[dict] = None) -> str:
     """
     RAG STEP 3: GENERATION
-    Generate response using LLM with augmented context
+    Generate response using LLM with augmented context.
+    The tier, model and latency used are added to `generation` if given.
+    With RAG_TOOLS=1 and a `profile`, the model may call calculators.TOOLS.
     """
+    def attempt(tier):
+        request = _rag_request(augmented_prompt, tier)
+        if RAG_TOOLS and profile is not None:
+            return complete_with_tools(request, profile, user_id)
+        return chat_completion(user_id, "interactive", **request)
+
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a professional financial advisor. Provide clear, well-formatted advice. Do not use LaTeX formatting."
-                },
-                {
-                    "role": "user",
-                    "content": augmented_prompt
-                }
-            ],
-            temperature=0.2,
-            max_tokens=800,
-            top_p=0.9
-        )
-        
-        text = response.choices[0].message.content
-        
-        # Post-process for better formatting
-        import re
-        
-        # 1. Add space between number and text if missing (e.g., $100Monthly -> $100 Monthly)
-        text = re.sub(r'\$(\d+(?:,\d{3})*(?:\.\d{2})?)([a-zA-Z])', r'$\1 \2', text)
-        
-        # 2. Add spaces around math operators
-        text = re.sub(r'(\d)([-+*/])(\d)', r'\1 \2 \3', text)
-        
-        # 3. Fix concatenated words
-        text = re.sub(r'permonth', 'per month', text)
-        text = re.sub(r'peryear', 'per year', text)
-        
-        # 4. Remove .00 decimals
-        text = re.sub(r'\$(\d+(?:,\d{3})*)\.00\b', r'$\1', text)
-
-        # 5. CRITICAL FIX FOR FONT ISSUE:
-        # Streamlit interprets $...$ as LaTeX math mode, which changes the font.
-        # We replace all literal $ with \$ to escape them.
-        text = text.replace('$', '\\$')
-        
-        return text
-        
+        response, info = tiered_call("advice", attempt)
+        if generation is not None:
+            generation.update(info)
+        return format_rag_response(response.choices[0].message.content)
     except Exception as e:
         return f"Error generating response: {str(e)}"
 
 
-def ask_ai_with_rag(profile: dict, question: str, profile_id: int) -> Dict:
+class StreamFormatter:
     """
-    COMPLETE RAG PIPELINE
+    Applies format_rag_response to streamed text as it arrives.
+
+    None of its patterns can match across whitespace, so formatting the
+    text up to the last whitespace seen gives exactly what formatting the
+    whole response at once would; the tail after it waits for more chunks.
     """
-    # Step 1: RETRIEVAL
-    print(f"[RAG] Step 1: Retrieving relevant context for: '{question}'")
-    retrieved_context = retrieve_relevant_context(question, profile_id, limit=5)
-    print(f"[RAG] Retrieved {retrieved_context['num_retrieved']} documents using {retrieved_context['retrieval_method']}")
-    
-    # Step 2: AUGMENTATION
-    print(f"[RAG] Step 2: Augmenting prompt with retrieved context")
-    augmented_prompt = augment_prompt_with_context(question, profile, retrieved_context)
-    
-    # Step 3: GENERATION
-    print(f"[RAG] Step 3: Generating response with LLM")
-    response = generate_rag_response(augmented_prompt)
-    
-    # Return full pipeline information
+
+    _LAST_SPACE = re.compile(r"\s(?=\S*$)")
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        match = self._LAST_SPACE.search(self._pending)
+        if not match:
+            return ""
+        ready, self._pending = self._pending[:match.end()], self._pending[match.end():]
+        return format_rag_response(ready)
+
+    def finish(self) -> str:
+        ready, self._pending = self._pending, ""
+        return format_rag_response(ready) if ready else ""
+
+
+def _open_rag_stream(augmented_prompt: str, user_id, tier: str):
+    """Open a generation stream and read up to its first text: (chunks read, stream)"""
+    stream = chat_completion(user_id, "interactive", stream=True, **_rag_request(augmented_prompt, tier))
+    head = []
+    for chunk in stream:
+        head.append(chunk)
+        if chunk.choices and (chunk.choices[0].delta.content or chunk.choices[0].finish_reason):
+            break
+    return head, stream
+
+
+def _close_rag_stream(opened):
+    close = getattr(opened[1], "close", None)
+    if close is not None:
+        close()
+
+
+def stream_rag_response(augmented_prompt: str, user_id=None, generation: Optional[Dict] = None) -> Iterator[str]:
+    """
+    RAG STEP 3: GENERATION (streaming)
+    Yields formatted text as the model produces it. Retries and timeouts
+    cover opening the stream; an error mid-stream ends it with the error text.
+    Hedging races the tiers to the first token; the tier, model and that
+    latency are added to `generation` if given.
+    """
+    try:
+        (head, stream), info = tiered_call(
+            "advice", lambda tier: _open_rag_stream(augmented_prompt, user_id, tier),
+            label="advice_first_token", discard=_close_rag_stream)
+    except Exception as e:
+        yield f"Error generating response: {str(e)}"
+        return
+    if generation is not None:
+        generation.update(info)
+    stream = itertools.chain(head, stream)
+
+    formatter = StreamFormatter()
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = formatter.feed(chunk.choices[0].delta.content or "")
+            if text:
+                yield text
+    except Exception as e:
+        yield formatter.finish() + "\n\n"
+        yield f"Error generating response: {str(e)}"
+        return
+    tail = formatter.finish()
+    if tail:
+        yield tail
+
+
+async def agenerate_rag_response(augmented_prompt: str, user_id=None, generation: Optional[Dict] = None) -> str:
+    """Async generate_rag_response (AsyncGroq); not hedged"""
+    try:
+        start = time.perf_counter()
+        response = await achat_completion(user_id, "interactive", **_rag_request(augmented_prompt))
+        tier = model_tiers.TASKS["advice"]["tier"]
+        latency = time.perf_counter() - start
+        model_tiers.latencies.record("advice", tier, latency)
+        if generation is not None:
+            generation.update({"tier": tier, "model": RAG_MODEL, "latency_ms": latency * 1000, "hedged": False})
+        return format_rag_response(response.choices[0].message.content)
+    except Exception as e:
+        return f"Error generating response: {str(e)}"
+
+
+# Answers are reused while the profile, the notes and the question are unchanged;
+# near-duplicate questions match by embedding similarity
+RAG_CACHE = os.getenv("RAG_CACHE", "1") == "1"
+rag_responses = SemanticResponseCache(
+    maxsize=int(os.getenv("RAG_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("RAG_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("RAG_CACHE_SIMILARITY", "0.95")),
+)
+# The same question asked concurrently (several tabs, double clicks) runs once
+rag_flights = SingleFlight("ask_ai_with_rag")
+
+
+def _rag_cache_fingerprint(profile: dict, profile_id: int) -> str:
+    """Everything besides the question that the answer depends on"""
+    from profiles import notes_version
+
+    payload = json.dumps(profile, sort_keys=True, default=str)
+    key = f"{RAG_MODEL}|{RAG_TEMPERATURE}|{notes_version(profile_id)}|{payload}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _cached_rag_result(profile_id: int, fingerprint: str, question: str, vector) -> Optional[Dict]:
+    if not RAG_CACHE:
+        return None
+    hit = rag_responses.get(profile_id, fingerprint, question, vector)
+    if hit is None:
+        return None
+    result, match, similarity = hit
+    print(f"[RAG] Answer served from cache ({match} match, similarity {similarity:.3f})")
+    result = copy.deepcopy(result)
+    result["rag_pipeline"]["cache"] = {"hit": True, "match": match, "similarity": similarity}
+    return result
+
+
+def _store_rag_result(profile_id: int, fingerprint: str, question: str, vector, result: Dict):
+    result["rag_pipeline"]["cache"] = {"hit": False}
+    # Failed generations are retried on the next ask, never cached
+    if RAG_CACHE and not result["response"].startswith("Error generating response"):
+        rag_responses.set(profile_id, fingerprint, question, copy.deepcopy(result), vector)
+
+
+def _rag_result(response, retrieved_context: Dict, augmented_prompt: str,
+                packing: Optional[Dict] = None) -> Dict:
+    """Full pipeline information returned with the answer"""
     return {
         "response": response,
         "rag_pipeline": {
@@ -208,32 +691,323 @@ def ask_ai_with_rag(profile: dict, question: str, profile_id: int) -> Dict:
             },
             "augmentation": {
                 "context_length": len(augmented_prompt),
-                "has_context": len(retrieved_context["retrieved_docs"]) > 0
+                "has_context": (packing["notes_used"] if packing else len(retrieved_context["retrieved_docs"])) > 0,
+                "tokens_saved": (packing or {}).get("tokens_saved", 0),
+                "packing": packing or {},
             },
             "generation": {
-                "model": "llama-3.3-70b-versatile",
-                "temperature": 0.2
+                "tier": model_tiers.TASKS["advice"]["tier"],
+                "model": RAG_MODEL,
+                "temperature": RAG_TEMPERATURE
             }
         }
     }
 
 
-def get_budget(profile, goals):
+# Calculation questions the router is confident about are answered by
+# calculators.py, skipping retrieval and the LLM (set ROUTER=0 to disable)
+ROUTER = os.getenv("ROUTER", "1") == "1"
+# With ROUTER_LLM=1, questions the router is unsure about (confidence from
+# ROUTER_LLM_MIN_CONFIDENCE up to its threshold) are put to the routing
+# model tier with prompts/conditional_router.txt; "Yes" sends them to the calculator
+ROUTER_LLM = os.getenv("ROUTER_LLM", "0") == "1"
+ROUTER_LLM_MIN_CONFIDENCE = float(os.getenv("ROUTER_LLM_MIN_CONFIDENCE", "0.4"))
+ROUTER_PROMPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "conditional_router.txt")
+
+
+def _llm_route_check(question: str, user_id=None) -> Dict:
+    """Ask the routing tier whether the question needs calculations"""
+    with open(ROUTER_PROMPT, encoding="utf-8") as f:
+        prompt = f.read().format(question=question)
+    start = time.perf_counter()
+    response = chat_completion(user_id, "interactive", messages=[{"role": "user", "content": prompt}],
+                               **model_tiers.request_options("routing"))
+    latency = time.perf_counter() - start
+    tier = model_tiers.TASKS["routing"]["tier"]
+    model_tiers.latencies.record("routing", tier, latency)
+    answer = (response.choices[0].message.content or "").strip().lower()
+    return {"calculation": answer.startswith("yes"), "tier": tier,
+            "model": model_tiers.model_for("routing"), "latency_ms": latency * 1000}
+
+
+def _route_question(profile: dict, question: str, user_id=None):
+    """
+    Step 0: ROUTING
+    Returns (routing metadata, calculator result or None)
     """
-    Uses Groq to calculate optimal budget allocation
+    if not ROUTER:
+        return {"route": "llm", "intent": None, "confidence": None, "latency_ms": 0.0}, None
+    routing = route_question(question)
+    if (ROUTER_LLM and routing["route"] != "calculator" and routing["intent"]
+            and routing["confidence"] >= ROUTER_LLM_MIN_CONFIDENCE):
+        try:
+            check = _llm_route_check(question, user_id)
+        except Exception as e:
+            print(f"[RAG] Routing check failed, using the LLM: {e}")
+        else:
+            routing = {**routing, "llm_check": check}
+            if check["calculation"]:
+                routing["route"] = "calculator"
+    if routing["route"] != "calculator":
+        return routing, None
+
+    start = time.perf_counter()
+    answer = calculators.answer(routing["intent"], profile, question)
+    if answer is None:
+        # The profile lacks what the calculation needs: let the LLM handle it
+        return {**routing, "route": "llm", "calculator_declined": True}, None
+    print(f"[RAG] Routed to calculator '{routing['intent']}' (confidence {routing['confidence']:.2f})")
+    return routing, {
+        "response": format_rag_response(answer),
+        "rag_pipeline": {
+            "routing": routing,
+            "retrieval": {"method": "skipped", "num_documents": 0, "documents": []},
+            "augmentation": {"context_length": 0, "has_context": False, "tokens_saved": 0, "packing": {}},
+            "generation": {
+                "model": f"calculator:{routing['intent']}",
+                "latency_ms": (time.perf_counter() - start) * 1000,
+            },
+        },
+    }
+
+
+def _with_routing(result: Dict, routing: Dict) -> Dict:
+    result["rag_pipeline"]["routing"] = routing
+    return result
+
+
+def _prepare_rag(profile: dict, question: str, profile_id: int) -> Dict:
+    """
+    Steps 0-2 of the pipeline: cache lookup, retrieval and augmentation.
+    Returns {"cached": result} on a cache hit, otherwise what generation needs.
+    """
+    prepared = _lookup_rag(profile, question, profile_id)
+    if prepared["cached"]:
+        return prepared
+
+    # Step 1: RETRIEVAL
+    print(f"[RAG] Step 1: Retrieving relevant context for: '{question}'")
+    retrieved_context = retrieve_relevant_context(question, profile_id, limit=5)
+    return _augment_rag(prepared, profile, question, profile_id, retrieved_context)
+
+
+async def _aprepare_rag(profile: dict, question: str, profile_id: int) -> Dict:
+    """_prepare_rag() with retrieval awaited alongside formatting the profile"""
+    prepared = _lookup_rag(profile, question, profile_id)
+    if prepared["cached"]:
+        return prepared
+
+    print(f"[RAG] Step 1: Retrieving relevant context for: '{question}' (async)")
+    retrieved_context, profile_str = await asyncio.gather(
+        aretrieve_relevant_context(question, profile_id, limit=5),
+        asyncio.to_thread(dict_to_string, profile),
+    )
+    return _augment_rag(prepared, profile, question, profile_id, retrieved_context, profile_str)
+
+
+def _lookup_rag(profile: dict, question: str, profile_id: int) -> Dict:
+    """Step 0: CACHE (same profile, notes and question - or a near-duplicate)"""
+    from profiles import question_embedding
+
+    fingerprint = _rag_cache_fingerprint(profile, profile_id)
+    vector = question_embedding(question)
+    cached = _cached_rag_result(profile_id, fingerprint, question, vector)
+    return {"cached": cached, "fingerprint": fingerprint, "vector": vector}
+
+
+def _augment_rag(prepared: Dict, profile: dict, question: str, profile_id: int,
+                 retrieved_context: Dict, profile_str: Optional[str] = None) -> Dict:
+    """Step 2 once retrieval is done, after a second cache lookup if the question had no embedding yet"""
+    from profiles import question_embedding
+    from speculative import profile_summary
+
+    print(f"[RAG] Retrieved {retrieved_context['num_retrieved']} documents using {retrieved_context['retrieval_method']}")
+
+    if prepared["vector"] is None:
+        # Retrieval has embedded the question by now: try near-duplicates before the LLM
+        prepared["vector"] = question_embedding(question)
+        prepared["cached"] = _cached_rag_result(profile_id, prepared["fingerprint"], question, prepared["vector"])
+        if prepared["cached"]:
+            return prepared
+
+    # Step 2: AUGMENTATION
+    print(f"[RAG] Step 2: Augmenting prompt with retrieved context")
+    augmented_prompt, packing = build_augmented_prompt(question, profile, retrieved_context, profile_str,
+                                                       profile_summary=profile_summary(profile_id, profile))
+    prepared.update(retrieved_context=retrieved_context, augmented_prompt=augmented_prompt, packing=packing)
+    return prepared
+
+
+def _rag_flight_key(profile: dict, question: str, profile_id: int) -> tuple:
+    return profile_id, _rag_cache_fingerprint(profile, profile_id), normalize_query(question)
+
+
+def ask_ai_with_rag(profile: dict, question: str, profile_id: int) -> Dict:
     """
+    COMPLETE RAG PIPELINE
+
+    Identical concurrent calls (same profile, notes and question) share one run.
+    """
+    return rag_flights.do(_rag_flight_key(profile, question, profile_id),
+                          _ask_ai_with_rag, profile, question, profile_id)
+
+
+def _ask_ai_with_rag(profile: dict, question: str, profile_id: int) -> Dict:
+    routing, routed = _route_question(profile, question, profile_id)
+    if routed:
+        return routed
+
+    prepared = _prepare_rag(profile, question, profile_id)
+    if prepared["cached"]:
+        return _with_routing(prepared["cached"], routing)
+    
+    # Step 3: GENERATION
+    print(f"[RAG] Step 3: Generating response with LLM")
+    generation = {}
+    response = generate_rag_response(prepared["augmented_prompt"], profile_id, generation, profile)
+    
+    # Return full pipeline information
+    result = _with_routing(_rag_result(response, prepared["retrieved_context"], prepared["augmented_prompt"],
+                                       prepared["packing"]), routing)
+    result["rag_pipeline"]["generation"].update(generation)
+    _store_rag_result(profile_id, prepared["fingerprint"], question, prepared["vector"], result)
+    return result
+
+
+def ask_ai_with_rag_stream(profile: dict, question: str, profile_id: int) -> Dict:
+    """
+    COMPLETE RAG PIPELINE (streaming)
+
+    Retrieval and augmentation run before returning; the answer is
+    result["stream"], an iterator of formatted chunks for st.write_stream.
+    Once it is exhausted, result["response"] holds the full text and
+    rag_pipeline.generation the time to first token. Calculator answers
+    come back complete, without a stream.
+
+    Identical concurrent calls share one run with each other and with
+    ask_ai_with_rag(): the first streams the answer, the others wait until
+    it is complete and get it without a stream.
+    """
+    if RAG_TOOLS:
+        result = ask_ai_with_rag(profile, question, profile_id)
+        result["stream"] = iter([result["response"]])
+        return result
+    flight, land = rag_flights.begin(_rag_flight_key(profile, question, profile_id))
+    if land is None:
+        return rag_flights.follow(flight)
     try:
-        profile_str = dict_to_string(profile)
-        goals_str = ", ".join(goals) if isinstance(goals, list) else str(goals)
-        
-        monthly_income = profile.get("monthly_income", 5000)
-        
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": f"""You are a financial planning expert calculating optimal budget allocation.
+        return _ask_ai_with_rag_stream(profile, question, profile_id, land)
+    except BaseException as e:
+        land(error=e)
+        raise
+
+
+def _ask_ai_with_rag_stream(profile: dict, question: str, profile_id: int, land) -> Dict:
+    """ask_ai_with_rag_stream() for the flight's leader; land(result) publishes the complete answer"""
+    routing, routed = _route_question(profile, question, profile_id)
+    if routed:
+        return land(routed)
+
+    prepared = _prepare_rag(profile, question, profile_id)
+    if prepared["cached"]:
+        result = land(_with_routing(prepared["cached"], routing))
+        result["stream"] = iter([result["response"]])
+        return result
+
+    result = _with_routing(_rag_result(None, prepared["retrieved_context"], prepared["augmented_prompt"],
+                                       prepared["packing"]), routing)
+
+    def stream():
+        print(f"[RAG] Step 3: Generating response with LLM (streaming)")
+        start = time.perf_counter()
+        parts = []
+        try:
+            for text in stream_rag_response(prepared["augmented_prompt"], profile_id,
+                                            result["rag_pipeline"]["generation"]):
+                if not parts:
+                    result["rag_pipeline"]["generation"]["time_to_first_token"] = time.perf_counter() - start
+                parts.append(text)
+                yield text
+        except GeneratorExit:
+            land(error=RuntimeError("The streamed answer was closed before it was complete"))
+            raise
+        except Exception as e:
+            land(error=e)
+            raise
+        result["rag_pipeline"]["generation"]["total_time"] = time.perf_counter() - start
+        result["response"] = "".join(parts)
+        complete = {key: value for key, value in result.items() if key != "stream"}
+        if not any(part.startswith("Error generating response") for part in parts):
+            _store_rag_result(profile_id, prepared["fingerprint"], question, prepared["vector"], complete)
+        land(copy.deepcopy(complete))
+
+    result["stream"] = stream()
+    # Waiting callers get an error rather than hanging if the stream is dropped unfinished
+    weakref.finalize(result["stream"], land, error=RuntimeError("The streamed answer was abandoned"))
+    return result
+
+
+async def ask_ai_with_rag_async(profile: dict, question: str, profile_id: int) -> Dict:
+    """
+    COMPLETE RAG PIPELINE (async)
+
+    Retrieval runs concurrently with formatting the profile we already hold;
+    generation awaits both without blocking the event loop. Shares runs
+    with identical concurrent ask_ai_with_rag calls.
+    """
+    return await rag_flights.ado(_rag_flight_key(profile, question, profile_id),
+                                 _ask_ai_with_rag_async, profile, question, profile_id)
+
+
+async def _ask_ai_with_rag_async(profile: dict, question: str, profile_id: int) -> Dict:
+    if ROUTER_LLM:
+        # The routing check is a blocking LLM call
+        routing, routed = await asyncio.to_thread(_route_question, profile, question, profile_id)
+    else:
+        routing, routed = _route_question(profile, question, profile_id)
+    if routed:
+        return routed
+
+    prepared = await _aprepare_rag(profile, question, profile_id)
+    if prepared["cached"]:
+        return _with_routing(prepared["cached"], routing)
+
+    print(f"[RAG] Step 3: Generating response with LLM")
+    generation = {}
+    response = await agenerate_rag_response(prepared["augmented_prompt"], profile_id, generation)
+
+    result = _with_routing(_rag_result(response, prepared["retrieved_context"], prepared["augmented_prompt"],
+                                       prepared["packing"]), routing)
+    result["rag_pipeline"]["generation"].update(generation)
+    _store_rag_result(profile_id, prepared["fingerprint"], question, prepared["vector"], result)
+    return result
+
+
+# Budgets are solved locally (budget_engine); set BUDGET_LLM_REFINE=1 to have
+# the LLM suggest one first, which the engine then fits to the rules
+BUDGET_LLM_REFINE = os.getenv("BUDGET_LLM_REFINE", "0") == "1"
+# Identical concurrent budget requests share one computation
+budget_flights = SingleFlight("get_budget")
+
+
+def generate_budget(profile, goals, user_id=None, priority: str = "standard") -> Dict:
+    """
+    Uses Groq to calculate optimal budget allocation.
+    Raises if the LLM call fails or its reply contains no JSON object.
+    """
+    profile_str = dict_to_string(profile)
+    goals_str = ", ".join(goals) if isinstance(goals, list) else str(goals)
+    
+    monthly_income = profile.get("monthly_income", 5000)
+    
+    response = chat_completion(
+        user_id,
+        priority,
+        **model_tiers.request_options("budget"),
+        messages=[
+            {
+                "role": "system", 
+                "content": f"""You are a financial planning expert calculating optimal budget allocation.
 
 USER'S PROFILE:
 {profile_str}
@@ -256,44 +1030,47 @@ CRITICAL: Return ONLY valid JSON with NO additional text, explanations, or markd
 
 Return format (replace with calculated numbers, MUST sum to ${monthly_income}):
 {{"housing": 1500, "food": 500, "transportation": 300, "savings": 1000, "entertainment": 200, "miscellaneous": 500}}"""
-                }
-            ],
-            temperature=0.2,
-            max_tokens=500
-        )
-        
-        # Extract JSON from response
-        import re
-        json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
-        if json_match:
-            budget = json.loads(json_match.group())
-            
-            # Verify the budget adds up correctly
-            total = sum(budget.values())
-            if abs(total - monthly_income) > 10:
-                print(f"⚠️ Warning: Budget doesn't add up. Total: ${total}, Income: ${monthly_income}")
-            
-            return budget
-        else:
-            # Fallback default values
-            income = profile.get("monthly_income", 5000)
-            return {
-                "housing": int(income * 0.30),
-                "food": int(income * 0.12),
-                "transportation": int(income * 0.10),
-                "savings": int(income * 0.20),
-                "entertainment": int(income * 0.08),
-                "miscellaneous": int(income * 0.20)
             }
-            
+        ],
+    )
+    
+    # Extract JSON from response
+    json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
+    if not json_match:
+        raise ValueError("No JSON object in the budget response")
+    budget = json.loads(json_match.group())
+    
+    # Verify the budget adds up correctly
+    total = sum(budget.values())
+    if abs(total - monthly_income) > 10:
+        print(f"⚠️ Warning: Budget doesn't add up. Total: ${total}, Income: ${monthly_income}")
+    
+    return budget
+
+
+def compute_budget(profile, goals, user_id=None, priority: str = "standard") -> Dict[str, int]:
+    """
+    Budget from the local engine; with BUDGET_LLM_REFINE=1 the LLM's
+    suggestion is made to satisfy the same rules instead (raises if the
+    LLM call fails)
+    """
+    if not BUDGET_LLM_REFINE:
+        return budget_engine.allocate(profile, goals)
+    return budget_engine.refine(profile, generate_budget(profile, goals, user_id, priority))
+
+
+def get_budget(profile, goals, user_id=None, priority: str = "standard"):
+    """
+    Calculates optimal budget allocation (see budget_engine.py).
+    Concurrent calls for the same profile and goals share one computation.
+    """
+    key = json.dumps([profile, goals], sort_keys=True, default=str)
+    return budget_flights.do(key, _get_budget, profile, goals, user_id, priority)
+
+
+def _get_budget(profile, goals, user_id=None, priority: str = "standard"):
+    try:
+        return compute_budget(profile, goals, user_id, priority)
     except Exception as e:
         print(f"Error getting budget: {e}")
-        income = profile.get("monthly_income", 5000)
-        return {
-            "housing": int(income * 0.30),
-            "food": int(income * 0.12),
-            "transportation": int(income * 0.10),
-            "savings": int(income * 0.20),
-            "entertainment": int(income * 0.08),
-            "miscellaneous": int(income * 0.20)
-        }
+        return budget_engine.allocate(profile, goals)
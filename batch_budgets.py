@@ -0,0 +1,217 @@
+"""
+Recompute AI budgets for every profile in the store
+
+    python batch_budgets.py
+    python batch_budgets.py --concurrency 8 --ids 1 2 3
+    python batch_budgets.py --dry-run
+
+Profiles are read from the financial_profiles collection a page at a time
+(ordered by id), budgets are computed by ai.compute_budget (the local
+engine, or the LLM plus the engine with BUDGET_LLM_REFINE=1) through a
+bounded worker pool at the scheduler's "batch" priority (interactive
+sessions keep going first), validated, and written back in groups of
+concurrent $set updates.
+
+Interrupted runs resume from a checkpoint file (.budget_batch.checkpoint.json
+by default) holding the highest id below which every profile is done;
+pass --restart to start over. Failed profiles are listed in the report and
+count as done for the checkpoint: retry them with --ids. Exit status is 1
+if any profile failed.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+import argparse
+import json
+import os
+import sys
+import time
+
+from budget_engine import CATEGORIES as BUDGET_CATEGORIES
+
+# Largest acceptable gap between the budget total and the monthly income
+BUDGET_TOLERANCE = 10
+
+PROFILE_PROJECTION = {"id": True, "general": True, "goals": True}
+
+
+def iter_profiles(page_size: int = 100, after_id=None, ids: Optional[List] = None) -> Iterator[dict]:
+    """Stream profiles in id order, one limited query per page"""
+    from db import personal_data_collection
+
+    while True:
+        filter = {}
+        if after_id is not None:
+            filter["id"] = {"$gt": after_id}
+        if ids is not None:
+            filter = {"$and": [filter, {"id": {"$in": ids}}]} if filter else {"id": {"$in": ids}}
+        page = list(personal_data_collection.find(
+            filter, projection=PROFILE_PROJECTION, sort={"id": 1}, limit=page_size
+        ))
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
+
+
+def validate_budget(budget, income) -> Dict[str, int]:
+    """Whole-dollar budget with exactly the expected categories that sums to the income"""
+    if not isinstance(budget, dict):
+        raise ValueError("budget is not an object")
+    missing = [key for key in BUDGET_CATEGORIES if key not in budget]
+    extra = [key for key in budget if key not in BUDGET_CATEGORIES]
+    if missing or extra:
+        raise ValueError(f"unexpected categories (missing {missing}, extra {extra})")
+    cleaned = {}
+    for key in BUDGET_CATEGORIES:
+        value = budget[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{key} is not a non-negative amount: {value!r}")
+        cleaned[key] = int(round(value))
+    total = sum(cleaned.values())
+    if abs(total - income) > BUDGET_TOLERANCE:
+        raise ValueError(f"budget totals ${total}, income is ${income}")
+    return cleaned
+
+
+def _generate(profile: dict) -> Dict[str, int]:
+    from ai import compute_budget
+
+    general = profile.get("general") or {}
+    budget = compute_budget(general, profile.get("goals"), profile["id"], priority="batch")
+    return validate_budget(budget, general.get("monthly_income", 5000))
+
+
+def _write_budgets(results: List[tuple], concurrency: int) -> List[dict]:
+    """$set each profile's budget, `concurrency` updates in flight; returns failures"""
+    from db import personal_data_collection
+    from profiles import profile_versions
+
+    def write(item):
+        profile_id, budget = item
+        personal_data_collection.update_one({"id": profile_id}, {"$set": {"budget": budget}})
+        # Sessions holding a cached copy re-read the profile
+        profile_versions.bump(profile_id)
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(write, item): item[0] for item in results}
+        for future, profile_id in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failures.append({"id": profile_id, "error": f"write failed: {e}"})
+    return failures
+
+
+def regenerate_budgets(concurrency: int = 4, page_size: int = 100, write_batch: int = 50,
+                       ids: Optional[List] = None, checkpoint_path: Optional[str] = None,
+                       dry_run: bool = False) -> dict:
+    """
+    Generate, validate and store a new budget for every profile (or `ids`).
+
+    At most `concurrency` budgets are generated at once and profiles are
+    read only as workers free up. Validated budgets are written back
+    `write_batch` at a time. With `checkpoint_path`, progress is saved
+    after each write so a rerun skips finished profiles.
+    """
+    start = time.perf_counter()
+    after_id = None
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            after_id = json.load(f).get("after_id")
+        print(f"[BATCH] Resuming after profile {after_id}")
+
+    report = {"profiles": 0, "updated": 0, "failed": [], "resumed_after": after_id}
+    order: List = []           # ids in the order they were read
+    finished: Dict = {}        # id -> True once generated (or failed)
+    pending_writes: List[tuple] = []
+    watermark = after_id       # every profile up to here is done
+
+    def flush():
+        nonlocal watermark
+        if pending_writes and not dry_run:
+            failures = _write_budgets(pending_writes, concurrency)
+            report["failed"].extend(failures)
+            report["updated"] += len(pending_writes) - len(failures)
+        elif dry_run:
+            report["updated"] += len(pending_writes)
+        pending_writes.clear()
+        while order and order[0] in finished:
+            watermark = order.pop(0)
+            finished.pop(watermark)
+        if checkpoint_path and not dry_run:
+            with open(checkpoint_path, "w") as f:
+                json.dump({"after_id": watermark}, f)
+
+    def collect(done):
+        for future in done:
+            profile_id = in_flight.pop(future)
+            try:
+                pending_writes.append((profile_id, future.result()))
+            except Exception as e:
+                report["failed"].append({"id": profile_id, "error": str(e)})
+            finished[profile_id] = True
+        if len(pending_writes) >= write_batch:
+            flush()
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for profile in iter_profiles(page_size, after_id, ids):
+            # Bounded: wait for a worker before reading further profiles
+            while len(in_flight) >= concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            report["profiles"] += 1
+            order.append(profile["id"])
+            in_flight[pool.submit(_generate, profile)] = profile["id"]
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+    flush()
+
+    report["last_id"] = watermark
+    report["elapsed"] = time.perf_counter() - start
+    report["profiles_per_sec"] = report["profiles"] / report["elapsed"] if report["elapsed"] else 0.0
+    print(f"[BATCH] {report['updated']} budgets updated, {len(report['failed'])} failed "
+          f"in {report['elapsed']:.2f}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate AI budgets for stored profiles")
+    parser.add_argument("--ids", type=int, nargs="+", help="only these profile ids")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--write-batch", type=int, default=50)
+    parser.add_argument("--checkpoint", default=".budget_batch.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="generate and validate, write nothing")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    report = regenerate_budgets(
+        concurrency=args.concurrency,
+        page_size=args.page_size,
+        write_batch=args.write_batch,
+        ids=args.ids,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run,
+    )
+
+    print(f"Profiles read:  {report['profiles']} (resumed after id {report['resumed_after']})")
+    print(f"Updated:        {report['updated']}")
+    print(f"Failed:         {len(report['failed'])}")
+    for failure in report["failed"][:20]:
+        print(f"  profile {failure['id']}: {failure['error']}")
+    print(f"Throughput:     {report['profiles_per_sec']:.1f} profiles/s")
+
+    if report["failed"]:
+        sys.exit(1)
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""
+Performance benchmarks for the financial advisor
+
+Run one benchmark by name:
+
+    python benchmark.py import      # cold `import profiles` time and network activity
+    python benchmark.py bulk_notes  # add_note loop vs add_notes_bulk on the local store
+    python benchmark.py session     # sequential vs concurrent session bootstrap
+    python benchmark.py faults      # retries and circuit breaking against a flaky store
+    python benchmark.py embedding   # add_note latency and background embedding throughput
+    python benchmark.py scheduler   # LLM request scheduling under a requests-per-minute limit
+    python benchmark.py budgets     # batch budget regeneration throughput by worker count
+    python benchmark.py budget_engine  # local budget solver vs the LLM path
+    python benchmark.py calculators    # vectorized calculators vs one scenario per call
+    python benchmark.py monte_carlo    # goal simulation time by path count, pool and cache
+    python benchmark.py completion_cache  # cold vs warm-restart LLM calls through the disk cache
+    python benchmark.py speculative    # "Generate with AI" wait with and without speculative budgets
+    python benchmark.py singleflight   # identical concurrent budget, question and profile requests
+    python benchmark.py hedging        # advice latency percentiles with and without hedged requests
+
+Benchmarks that touch storage run against the in-memory SQLite backend,
+with a simulated per-call round trip where noted.
+"""
+from contextlib import redirect_stdout
+import io
+import os
+import subprocess
+import sys
+import time
+
+
+def use_local_store(latency_ms: float = 0.0, failure_rate: float = 0.0):
+    """Point db.py at a throwaway in-memory store (call before importing it)"""
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ["STORAGE_LATENCY_MS"] = str(latency_ms)
+    os.environ["STORAGE_FAILURE_RATE"] = str(failure_rate)
+    os.environ["WRITE_BEHIND_JOURNAL"] = ""
+
+
+IMPORT_PROBE = r"""
+import socket, time
+
+attempts = []
+_connect = socket.socket.connect
+
+def guarded_connect(self, address):
+    attempts.append(address)
+    raise OSError(f"network access during import: {address}")
+
+socket.socket.connect = guarded_connect
+socket.create_connection = lambda address, *a, **k: guarded_connect(None, address)
+start = time.perf_counter()
+import profiles
+elapsed = time.perf_counter() - start
+print(f"{elapsed * 1000:.1f} {len(attempts)}")
+"""
+
+COMPLETION_PROBE = r"""
+import sys, time
+import ai
+
+start = time.perf_counter()
+for i in range(int(sys.argv[1])):
+    ai.generate_rag_response(f"Question {i}: how should I plan my budget?")
+elapsed = time.perf_counter() - start
+stats = ai.completion_cache.stats()
+print(f"{elapsed * 1000:.1f} {stats['hits']} {stats['misses']}")
+"""
+
+
+def bench_import(runs: int = 5):
+    """Time a cold `import profiles` in fresh interpreters with network connects blocked"""
+    print("=" * 60)
+    print("BENCHMARK: import profiles (cold interpreter)")
+    print("=" * 60)
+
+    timings = []
+    for run in range(1, runs + 1):
+        proc = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"❌ Run {run} failed:\n{proc.stderr.strip()}")
+            return
+        elapsed_ms, attempts = proc.stdout.strip().splitlines()[-1].split()
+        timings.append(float(elapsed_ms))
+        print(f"Run {run}: {float(elapsed_ms):8.1f} ms, network connects attempted: {attempts}")
+        if int(attempts):
+            print("❌ Importing profiles touched the network")
+            return
+
+    timings.sort()
+    print("-" * 60)
+    print(f"min {timings[0]:.1f} ms | median {timings[len(timings) // 2]:.1f} ms | max {timings[-1]:.1f} ms")
+    print("✅ No network I/O during import")
+
+
+def bench_bulk_notes(rows: int = 500, latency_ms: float = 20.0):
+    """Compare one-by-one add_note with chunked add_notes_bulk"""
+    use_local_store(latency_ms)
+    from form_submit import add_note, add_notes_bulk
+
+    print("=" * 60)
+    print(f"BENCHMARK: note ingestion, {rows} notes (local store, {latency_ms:.0f} ms per call)")
+    print("=" * 60)
+
+    notes = [f"Journal entry {i}: spent ${i % 200} on groceries and saved ${i % 50}" for i in range(rows)]
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        for note in notes:
+            add_note(note, 1)
+    serial = time.perf_counter() - start
+    print(f"add_note loop:   {serial:6.2f}s  ({rows / serial:8.0f} notes/s)")
+
+    for chunk_size, concurrency in [(20, 1), (20, 4), (100, 4)]:
+        with redirect_stdout(io.StringIO()):
+            report = add_notes_bulk(2, notes, chunk_size=chunk_size, concurrency=concurrency,
+                                    source=f"bench-{chunk_size}-{concurrency}")
+        print(f"add_notes_bulk chunk={chunk_size:<3} concurrency={concurrency}: "
+              f"{report['elapsed']:6.2f}s  ({report['rows_per_sec']:8.0f} notes/s, "
+              f"{len(report['failed'])} failed)")
+
+
+def bench_session(runs: int = 20, latency_ms: float = 50.0):
+    """Session bootstrap: get_profile then get_notes_page vs load_session (asyncio.gather)"""
+    use_local_store(latency_ms)
+    import asyncio
+    import profiles
+
+    print("=" * 60)
+    print(f"BENCHMARK: session bootstrap ({latency_ms:.0f} ms per store call)")
+    print("=" * 60)
+
+    profiles.create_profile(1)
+    sequential, concurrent = [], []
+    for _ in range(runs):
+        profiles.profile_cache.clear()
+        start = time.perf_counter()
+        profiles.get_profile(1)
+        profiles.get_notes_page(1)
+        sequential.append(time.perf_counter() - start)
+
+        profiles.profile_cache.clear()
+        start = time.perf_counter()
+        asyncio.run(profiles.load_session(1))
+        concurrent.append(time.perf_counter() - start)
+
+    for label, timings in (("sequential", sequential), ("load_session", concurrent)):
+        timings.sort()
+        print(f"{label:<13} median {timings[len(timings) // 2] * 1000:7.1f} ms | "
+              f"max {timings[-1] * 1000:7.1f} ms")
+
+
+def bench_faults(calls: int = 200, failure_rate: float = 0.2, latency_ms: float = 5.0):
+    """Profile reads against a store failing at `failure_rate`, then a full outage"""
+    use_local_store(latency_ms, failure_rate)
+    import db
+    import profiles
+    import resilience
+
+    print("=" * 60)
+    print(f"BENCHMARK: profile reads, {failure_rate:.0%} injected failures, {latency_ms:.0f} ms per call")
+    print("=" * 60)
+
+    db.store.max_retries = 3
+    with redirect_stdout(io.StringIO()):
+        while True:
+            try:
+                profiles.create_profile(1)
+                break
+            except Exception:
+                pass
+
+    def run(label: str):
+        ok, timings = 0, []
+        for _ in range(calls):
+            profiles.profile_cache.clear()
+            start = time.perf_counter()
+            try:
+                profiles.get_profile(1)
+                ok += 1
+            except Exception:
+                pass
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{label:<10} success {ok / calls:6.1%} | median {timings[len(timings) // 2] * 1000:6.1f} ms | "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.1f} ms")
+
+    run("flaky")
+    print(f"           store metrics: {resilience.metrics()['store']}")
+
+    # Full outage: the breaker opens and later calls fail fast instead of waiting
+    profiles.personal_data_collection.resolve().collection.failure_rate = 1.0
+    run("outage")
+    print(f"           store metrics: {resilience.metrics()['store']}")
+
+
+def bench_embedding(notes: int = 50, backlog: int = 1000, latency_ms: float = 20.0):
+    """add_note latency with background embedding, then how fast an imported backlog drains"""
+    use_local_store(latency_ms)
+    os.environ["ASYNC_EMBEDDING"] = "1"
+    from form_submit import add_note, add_notes_bulk
+    import profiles
+
+    print("=" * 60)
+    print(f"BENCHMARK: background note embedding ({latency_ms:.0f} ms per store call)")
+    print("=" * 60)
+
+    timings = []
+    with redirect_stdout(io.StringIO()):
+        for i in range(notes):
+            start = time.perf_counter()
+            add_note(f"Paid ${i * 10} towards the car loan", 1)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"add_note        median {timings[len(timings) // 2] * 1000:6.1f} ms | "
+          f"max {timings[-1] * 1000:6.1f} ms  (one store round trip: {latency_ms:.0f} ms)")
+
+    pipeline = profiles.get_embedding_pipeline()
+    pipeline.flush()
+    with redirect_stdout(io.StringIO()):
+        add_notes_bulk(2, (f"Journal entry {i}: groceries ${i % 200}" for i in range(backlog)),
+                       chunk_size=100, source="bench-embedding")
+    start = time.perf_counter()
+    pipeline.flush()
+    elapsed = time.perf_counter() - start
+    print(f"backlog drain   {backlog} notes in {elapsed:.2f}s ({backlog / elapsed:6.0f} notes/s)")
+    print(f"                pipeline: {profiles.embedding_stats()}")
+
+
+def bench_scheduler(budget_calls: int = 40, questions: int = 4, rpm: float = 600, latency_ms: float = 50.0):
+    """
+    One user floods budget generation while three users ask questions, all
+    against the local LLM under an `rpm` limit: interactive requests should
+    jump the queue and each user should get turns
+    """
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "LLM_RPM": str(rpm), "LLM_TPM": "0"})
+    from concurrent.futures import ThreadPoolExecutor
+    import ai
+
+    print("=" * 60)
+    print(f"BENCHMARK: LLM scheduler ({rpm:.0f} requests/min, {latency_ms:.0f} ms per completion)")
+    print("=" * 60)
+
+    # Start with an empty bucket so the limit applies from the first request
+    ai.scheduler.requests.level = 0
+    latencies = {"budget": [], "advice": []}
+
+    def timed(kind, fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        latencies[kind].append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=budget_calls + 3 * questions) as pool, redirect_stdout(io.StringIO()):
+        for _ in range(budget_calls):
+            pool.submit(timed, "budget", ai.get_budget, {"monthly_income": 5000}, ["save"], 1)
+        time.sleep(0.5)
+        for i in range(questions):
+            for user in (2, 3, 4):
+                pool.submit(timed, "advice", ai.generate_rag_response,
+                            f"USER'S QUESTION: question {i}\n", user)
+    for kind, timings in latencies.items():
+        timings.sort()
+        print(f"{kind:<7} {len(timings):3d} calls | median {timings[len(timings) // 2]:5.2f}s | "
+              f"max {timings[-1]:5.2f}s")
+    print(f"        scheduler: {ai.scheduler.metrics()}")
+
+
+def bench_budgets(profiles_count: int = 200, latency_ms: float = 100.0, store_latency_ms: float = 5.0):
+    """batch_budgets.regenerate_budgets over `profiles_count` profiles with the local LLM"""
+    use_local_store(store_latency_ms)
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "BUDGET_LLM_REFINE": "1",
+                       "LLM_RPM": "0", "LLM_TPM": "0", "LLM_MAX_IN_FLIGHT": "0"})
+    import batch_budgets
+    import profiles
+
+    print("=" * 60)
+    print(f"BENCHMARK: batch budgets, {profiles_count} profiles "
+          f"({latency_ms:.0f} ms per completion, {store_latency_ms:.0f} ms per store call)")
+    print("=" * 60)
+
+    with redirect_stdout(io.StringIO()):
+        for i in range(1, profiles_count + 1):
+            profiles.create_profile(i)
+    for concurrency in (1, 4, 16):
+        with redirect_stdout(io.StringIO()):
+            report = batch_budgets.regenerate_budgets(concurrency=concurrency)
+        print(f"concurrency={concurrency:<3} {report['elapsed']:6.2f}s  "
+              f"({report['profiles_per_sec']:6.1f} profiles/s, {report['updated']} updated, "
+              f"{len(report['failed'])} failed)")
+
+
+def bench_budget_engine(profiles_count: int = 100000, calls: int = 200, latency_ms: float = 100.0):
+    """budget_engine.allocate_many over many profiles, and get_budget with and without the LLM"""
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "LLM_RPM": "0", "LLM_TPM": "0"})
+    import numpy as np
+    import ai
+    import budget_engine
+
+    print("=" * 60)
+    print(f"BENCHMARK: budget engine ({profiles_count} profiles; local LLM at {latency_ms:.0f} ms)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(0)
+    incomes = rng.uniform(1000, 20000, profiles_count)
+    start = time.perf_counter()
+    budgets = budget_engine.allocate_many(
+        incomes, rng.uniform(0, 50000, profiles_count), rng.uniform(0, 100000, profiles_count),
+        rng.integers(0, 5, profiles_count), rng.random((profiles_count, len(budget_engine.GOALS))) < 0.3,
+    )
+    elapsed = time.perf_counter() - start
+    exact = (budgets.sum(axis=1) == np.round(incomes)).mean()
+    print(f"allocate_many   {elapsed * 1000:7.1f} ms ({elapsed / profiles_count * 1e6:.2f} us/profile, "
+          f"{exact:.0%} sum exactly to income)")
+
+    general = {"monthly_income": 5000, "current_savings": 4000, "debt_amount": 12000, "dependents": 1}
+    for label, refine in (("get_budget", False), ("get_budget+LLM", True)):
+        ai.BUDGET_LLM_REFINE = refine
+        runs = calls if not refine else max(1, calls // 20)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for _ in range(runs):
+                ai.get_budget(general, ["Pay Off Debt"])
+        print(f"{label:<15} {(time.perf_counter() - start) / runs * 1000:9.3f} ms per call")
+
+
+def bench_calculators(scenarios: int = 10000):
+    """Scenario grids through the vectorized calculators vs one call per scenario"""
+    import numpy as np
+    import calculators
+
+    print("=" * 60)
+    print(f"BENCHMARK: calculators ({scenarios} scenarios)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(0)
+    balances = rng.uniform(1000, 50000, scenarios)
+    rates = rng.uniform(0.02, 0.25, scenarios)
+    payments = balances * rates / 12 + rng.uniform(50, 1000, scenarios)
+
+    cases = {
+        "payoff_months": lambda b, r, m: calculators.payoff_months(b, r, m),
+        "future_value": lambda b, r, m: calculators.future_value(b, m, r, 10),
+        "months_to_target": lambda b, r, m: calculators.months_to_target(2 * b, b, m, r),
+    }
+    for name, run in cases.items():
+        start = time.perf_counter()
+        vectorized = run(balances, rates, payments)
+        batch = time.perf_counter() - start
+        start = time.perf_counter()
+        looped = [float(run(b, r, m)) for b, r, m in zip(balances, rates, payments)]
+        loop = time.perf_counter() - start
+        assert np.allclose(vectorized, looped)
+        print(f"{name:<17} {batch * 1000:7.2f} ms vectorized, {loop * 1000:8.1f} ms looped "
+              f"({loop / batch:.0f}x)")
+
+    debts = min(scenarios, 1000)
+    budgets = rng.uniform(600, 3000, debts)
+    start = time.perf_counter()
+    results = calculators.compare_payoff_strategies([2000, 8000, 15000, 500], [0.06, 0.24, 0.05, 0.19],
+                                                    [50, 150, 200, 25], budgets)
+    elapsed = time.perf_counter() - start
+    print(f"avalanche+snowball {elapsed * 1000:6.1f} ms for {debts} budgets "
+          f"(avalanche saves ${np.nanmean(results['interest_saved_by_avalanche']):,.0f} on average)")
+
+
+def bench_monte_carlo(paths=(20000, 100000, 400000), workers: int = 4):
+    """monte_carlo.simulate in-process vs the process pool, and cached_goal_probabilities"""
+    use_local_store()
+    import monte_carlo
+    import profiles
+
+    print("=" * 60)
+    print(f"BENCHMARK: Monte Carlo goals (35-year horizon; pool of {workers})")
+    print("=" * 60)
+
+    monte_carlo.simulate(10000, 1000, 1, 0.07, 0.15, 1000, workers=workers)  # start the pool
+    for count in paths:
+        timings = []
+        for pool_workers in (0, workers):
+            start = time.perf_counter()
+            monte_carlo.simulate(10000, 1000, 35, 0.07, 0.15, count, workers=pool_workers)
+            timings.append(time.perf_counter() - start)
+        parallel = "" if count >= monte_carlo.MONTE_CARLO_PARALLEL_PATHS else " (below split threshold)"
+        print(f"{count:>7} paths  {timings[0] * 1000:7.1f} ms in-process, {timings[1] * 1000:7.1f} ms pooled{parallel}")
+
+    profile = profiles.get_values(1)
+    profile["goals"] = list(monte_carlo.SIMULATED_GOALS)
+    for label in ("first view", "cached view"):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            monte_carlo.cached_goal_probabilities(1, profile)
+        print(f"{label:<12} {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+
+def bench_completion_cache(prompts: int = 20, latency_ms: float = 200.0):
+    """The same prompts in two fresh server processes sharing one completion cache file"""
+    import tempfile
+
+    print("=" * 60)
+    print(f"BENCHMARK: completion cache ({prompts} prompts, local LLM at {latency_ms:.0f} ms)")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, LLM_BACKEND="local", LOCAL_LLM_LATENCY_MS=str(latency_ms),
+                   LLM_RPM="0", LLM_TPM="0", STORAGE_BACKEND="memory", WRITE_BEHIND_JOURNAL="",
+                   COMPLETION_CACHE_PATH=os.path.join(directory, "completions.db"))
+        for label in ("cold start", "warm restart"):
+            proc = subprocess.run([sys.executable, "-c", COMPLETION_PROBE, str(prompts)],
+                                  capture_output=True, text=True, env=env)
+            if proc.returncode != 0:
+                print(f"❌ {label} failed:\n{proc.stderr.strip()}")
+                return
+            elapsed_ms, hits, misses = proc.stdout.strip().splitlines()[-1].split()
+            print(f"{label:<13} {float(elapsed_ms):8.1f} ms ({hits} hits, {misses} misses)")
+
+
+def bench_speculative(clicks: int = 5, think_ms: float = 500.0, latency_ms: float = 800.0):
+    """
+    Time from the "Generate with AI" click to a budget (LLM refine on), with
+    the user reading the page for `think_ms` after it loads
+    """
+    use_local_store()
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "LLM_RPM": "0", "LLM_TPM": "0", "BUDGET_LLM_REFINE": "1"})
+    import profiles
+    import speculative
+
+    print("=" * 60)
+    print(f"BENCHMARK: speculative budgets (LLM at {latency_ms:.0f} ms, click {think_ms:.0f} ms after load)")
+    print("=" * 60)
+
+    with redirect_stdout(io.StringIO()):
+        _, profile = profiles.create_profile(1)
+    for label, speculate in (("on click", False), ("speculative", True)):
+        waits = []
+        for click in range(clicks):
+            profile["general"]["monthly_income"] = 4000 + 100 * click + (50 if speculate else 0)
+            with redirect_stdout(io.StringIO()):
+                if speculate:
+                    speculative.speculate_profile(1, profile)
+                time.sleep(think_ms / 1000)
+                start = time.perf_counter()
+                speculative.budget_for(1, profile)
+            waits.append(time.perf_counter() - start)
+        print(f"{label:<12} {sum(waits) / len(waits) * 1000:7.1f} ms average wait after the click")
+    print(speculative.speculation.stats())
+
+
+def bench_singleflight(sessions: int = 16, latency_ms: float = 300.0, store_latency_ms: float = 50.0):
+    """`sessions` threads making the same get_budget, ask_ai_with_rag and get_profile call at once"""
+    use_local_store(store_latency_ms)
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "LLM_RPM": "0", "LLM_TPM": "0", "BUDGET_LLM_REFINE": "1", "RAG_CACHE": "0"})
+    from concurrent.futures import ThreadPoolExecutor
+    import ai
+    import profiles
+
+    print("=" * 60)
+    print(f"BENCHMARK: single-flight ({sessions} concurrent sessions, LLM at {latency_ms:.0f} ms, "
+          f"store at {store_latency_ms:.0f} ms)")
+    print("=" * 60)
+
+    with redirect_stdout(io.StringIO()):
+        _, profile = profiles.create_profile(1)
+    calls = {
+        "get_budget": (ai.budget_flights, lambda: ai.get_budget(profile["general"], profile["goals"], 1)),
+        "ask_ai_with_rag": (ai.rag_flights, lambda: ai.ask_ai_with_rag(profile, "How do I retire early?", 1)),
+        # The app's default path (RAG_STREAMING=1): the stream is read to the end, as st.write_stream does
+        "ask_ai_with_rag_stream": (ai.rag_flights, lambda: "".join(
+            ai.ask_ai_with_rag_stream(profile, "How do I retire early, streamed?", 1).get("stream", ()))),
+        "get_profile": (profiles.profile_reads, lambda: profiles.get_profile(1)),
+    }
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        for name, (flights, call) in calls.items():
+            profiles.profile_cache.clear()
+            before = flights.stats()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                list(pool.map(lambda _: call(), range(sessions)))
+            stats = {key: flights.stats()[key] - before[key] for key in ("executions", "calls", "collapsed")}
+            print(f"{name:<22} {(time.perf_counter() - start) * 1000:7.1f} ms, {stats['executions']} executions "
+                  f"for {stats['calls']} calls ({stats['collapsed']} collapsed)")
+
+
+def bench_hedging(requests: int = 200, latency_ms: float = 50.0, tail_rate: float = 0.03,
+                  tail_ms: float = 1000.0):
+    """Sequential advice generations when `tail_rate` of LLM calls take `tail_ms`, unhedged vs hedged"""
+    os.environ.update({"LLM_BACKEND": "local", "COMPLETION_CACHE_PATH": "", "LOCAL_LLM_LATENCY_MS": str(latency_ms),
+                       "LOCAL_LLM_TAIL_RATE": str(tail_rate), "LOCAL_LLM_TAIL_MS": str(tail_ms),
+                       "LLM_RPM": "0", "LLM_TPM": "0", "LLM_HEDGE_DELAY_MS": str(3 * latency_ms)})
+    import ai
+    import model_tiers
+
+    print("=" * 60)
+    print(f"BENCHMARK: hedged requests ({requests} requests, LLM at {latency_ms:.0f} ms, "
+          f"{tail_rate:.0%} at {tail_ms:.0f} ms)")
+    print("=" * 60)
+
+    for label, hedge in (("unhedged", False), ("hedged", True)):
+        model_tiers.LLM_HEDGE = hedge
+        latencies, hedged = [], 0
+        for i in range(requests):
+            generation = {}
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                ai.generate_rag_response(f"USER'S QUESTION: {label} question {i}\n", None, generation)
+            latencies.append(time.perf_counter() - start)
+            hedged += generation["hedged"]
+        latencies.sort()
+        p50, p95, p99 = (latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{label:<10} p50 {p50:7.1f} ms   p95 {p95:7.1f} ms   p99 {p99:7.1f} ms   "
+              f"max {latencies[-1] * 1000:7.1f} ms   {hedged} hedged")
+    print(model_tiers.latencies.stats())
+
+
+BENCHMARKS = {
+    "import": bench_import,
+    "bulk_notes": bench_bulk_notes,
+    "session": bench_session,
+    "faults": bench_faults,
+    "embedding": bench_embedding,
+    "scheduler": bench_scheduler,
+    "budgets": bench_budgets,
+    "budget_engine": bench_budget_engine,
+    "calculators": bench_calculators,
+    "monte_carlo": bench_monte_carlo,
+    "completion_cache": bench_completion_cache,
+    "speculative": bench_speculative,
+    "singleflight": bench_singleflight,
+    "hedging": bench_hedging,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmark.py [{'|'.join(BENCHMARKS)}]")
+        sys.exit(1)
+    start = time.perf_counter()
+    BENCHMARKS[sys.argv[1]]()
+    print(f"\nTotal: {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,186 @@
+"""
+Deterministic budget allocation
+
+Solves the budget rules from ai.get_budget's prompt exactly instead of
+asking the LLM to follow them:
+
+- every category share stays inside its range (housing 25-35% of income,
+  food and transportation 10-15%, savings at least 15%, entertainment and
+  miscellaneous 5-10%)
+- the amounts are whole dollars that add up to exactly the income
+
+Target shares start from a baseline and are adjusted for debt,
+dependents and goals; the targets are then projected onto the ranges
+with the shares summing to 1 (the closest feasible allocation), and
+dollars are rounded by the largest-remainder method.
+
+Everything works on arrays: allocate_many() solves thousands of profiles
+in one call, allocate() is the single-profile wrapper.
+"""
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+
+CATEGORIES = ("housing", "food", "transportation", "savings", "entertainment", "miscellaneous")
+
+# (min, max) share of monthly income per category
+RANGES = {
+    "housing": (0.25, 0.35),
+    "food": (0.10, 0.15),
+    "transportation": (0.10, 0.15),
+    "savings": (0.15, 0.40),
+    "entertainment": (0.05, 0.10),
+    "miscellaneous": (0.05, 0.10),
+}
+
+BASELINE = {
+    "housing": 0.32,
+    "food": 0.13,
+    "transportation": 0.13,
+    "savings": 0.24,
+    "entertainment": 0.09,
+    "miscellaneous": 0.09,
+}
+
+# Share shifts per goal picked in the profile form
+GOAL_ADJUSTMENTS = {
+    "Pay Off Debt": {"savings": 0.03, "entertainment": -0.01},
+    "Save for Retirement": {"savings": 0.03},
+    "Buy a Home": {"savings": 0.04, "housing": -0.02},
+    "Investment Growth": {"savings": 0.02, "entertainment": -0.01},
+}
+GOALS = ("Build Emergency Fund",) + tuple(GOAL_ADJUSTMENTS)
+
+# Emergency fund target, in months of income
+EMERGENCY_FUND_MONTHS = 6
+
+LOWER = np.array([RANGES[c][0] for c in CATEGORIES])
+UPPER = np.array([RANGES[c][1] for c in CATEGORIES])
+_INDEX = {c: i for i, c in enumerate(CATEGORIES)}
+
+
+def _vector(shares: Dict[str, float]) -> np.ndarray:
+    return np.array([shares.get(c, 0.0) for c in CATEGORIES])
+
+
+def target_shares(incomes, savings, debts, dependents, goal_flags) -> np.ndarray:
+    """
+    Desired share per category before the ranges are enforced, shape (n, 6).
+
+    goal_flags is an (n, len(GOALS)) boolean array in GOALS order.
+    """
+    incomes = np.maximum(np.asarray(incomes, dtype=float), 1.0)
+    savings = np.asarray(savings, dtype=float)
+    debts = np.asarray(debts, dtype=float)
+    dependents = np.asarray(dependents, dtype=float)
+    goal_flags = np.asarray(goal_flags, dtype=bool).reshape(len(incomes), len(GOALS))
+
+    targets = np.tile(_vector(BASELINE), (len(incomes), 1))
+
+    # Dependents: more food and housing, less entertainment
+    targets[:, _INDEX["food"]] += 0.01 * dependents
+    targets[:, _INDEX["housing"]] += 0.01 * dependents
+    targets[:, _INDEX["entertainment"]] -= 0.005 * dependents
+
+    # Debt, relative to a year of income: repayments come out of savings'
+    # share, funded by discretionary spending
+    pressure = np.clip(debts / (12 * incomes), 0.0, 1.0)
+    targets[:, _INDEX["savings"]] += 0.10 * pressure
+    targets[:, _INDEX["entertainment"]] -= 0.03 * pressure
+    targets[:, _INDEX["miscellaneous"]] -= 0.02 * pressure
+
+    # Emergency fund: save harder the further savings are from the target
+    shortfall = np.clip(1 - savings / (EMERGENCY_FUND_MONTHS * incomes), 0.0, 1.0)
+    targets[:, _INDEX["savings"]] += 0.05 * shortfall * goal_flags[:, 0]
+
+    for g, goal in enumerate(GOALS[1:], 1):
+        targets += np.outer(goal_flags[:, g], _vector(GOAL_ADJUSTMENTS[goal]))
+    return targets
+
+
+def project_shares(targets, lower: np.ndarray = LOWER, upper: np.ndarray = UPPER) -> np.ndarray:
+    """
+    Closest shares to `targets` (n, 6) with lower <= share <= upper and each
+    row summing to 1: shares = clip(targets + t, lower, upper) for the
+    per-row shift t that makes the sum exactly 1.
+
+    The sum is piecewise linear in t with breakpoints where a category
+    hits a bound, so t is found exactly from the breakpoints, not iterated.
+    """
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    breaks = np.sort(np.concatenate([lower - targets, upper - targets], axis=1), axis=1)
+    sums = np.clip(targets[:, None, :] + breaks[:, :, None], lower, upper).sum(axis=2)
+
+    # First breakpoint where the sum reaches 1; interpolate from the one before
+    k = np.argmax(sums >= 1 - 1e-12, axis=1)
+    rows = np.arange(len(targets))
+    prev = np.maximum(k - 1, 0)
+    b0, b1 = breaks[rows, prev], breaks[rows, k]
+    s0, s1 = sums[rows, prev], sums[rows, k]
+    slope = np.where(s1 > s0, (b1 - b0) / np.where(s1 > s0, s1 - s0, 1.0), 0.0)
+    shift = np.where(k > 0, b0 + (1 - s0) * slope, b1)
+    return np.clip(targets + shift[:, None], lower, upper)
+
+
+def largest_remainder(amounts, totals) -> np.ndarray:
+    """Round each row of `amounts` to integers that sum to its integer total"""
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=float))
+    totals = np.asarray(totals, dtype=np.int64)
+    floors = np.floor(amounts).astype(np.int64)
+    short = totals - floors.sum(axis=1)
+    # Rank of each remainder within its row, largest first
+    order = np.argsort(-(amounts - floors), axis=1, kind="stable")
+    ranks = np.argsort(order, axis=1)
+    return floors + (ranks < short[:, None])
+
+
+def allocate_many(incomes, savings=0, debts=0, dependents=0, goal_flags=None,
+                  targets: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Whole-dollar budgets, shape (n, 6) in CATEGORIES order, for n profiles.
+    Scalars broadcast; `targets` overrides the computed target shares.
+    """
+    incomes = np.atleast_1d(np.asarray(incomes, dtype=float))
+    n = len(incomes)
+    if targets is None:
+        if goal_flags is None:
+            goal_flags = np.zeros((n, len(GOALS)), dtype=bool)
+        targets = target_shares(incomes, np.broadcast_to(savings, n), np.broadcast_to(debts, n),
+                                np.broadcast_to(dependents, n), goal_flags)
+    shares = project_shares(targets)
+    totals = np.round(incomes).astype(np.int64)
+    return largest_remainder(shares * totals[:, None], totals)
+
+
+def goal_flags(goals: Optional[Iterable[str]]) -> List[bool]:
+    goals = set(goals or [])
+    return [goal in goals for goal in GOALS]
+
+
+def _profile_inputs(general: dict) -> tuple:
+    general = general or {}
+    return (
+        float(general.get("monthly_income") or 0),
+        float(general.get("current_savings") or 0),
+        float(general.get("debt_amount") or 0),
+        float(general.get("dependents") or 0),
+    )
+
+
+def allocate(general: dict, goals: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Budget for one profile's `general` section and goals"""
+    income, savings, debt, dependents = _profile_inputs(general)
+    amounts = allocate_many([income], savings, debt, dependents, [goal_flags(goals)])[0]
+    return {category: int(amount) for category, amount in zip(CATEGORIES, amounts)}
+
+
+def refine(general: dict, budget: Dict[str, float]) -> Dict[str, int]:
+    """
+    Make an LLM-suggested budget satisfy the rules: its shares become the
+    targets, so it is changed only as much as the ranges and the exact
+    total require
+    """
+    income = _profile_inputs(general)[0]
+    targets = np.array([[float(budget.get(c, 0) or 0) / max(income, 1.0) for c in CATEGORIES]])
+    amounts = allocate_many([income], targets=targets)[0]
+    return {category: int(amount) for category, amount in zip(CATEGORIES, amounts)}
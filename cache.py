@@ -0,0 +1,298 @@
+"""
+Process-wide in-memory caches shared by every Streamlit session
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+import atexit
+import json
+import math
+import os
+import re
+import threading
+import time
+
+
+class LRUTTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Each entry may carry a version; a lookup with a newer expected version
+    treats the entry as a miss, so a reader never sees data older than the
+    last write it knows about.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, version: Optional[int] = None, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, entry_version, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            if version is not None and entry_version != version:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, version, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """(key, value) pairs, least recently used first"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class VersionCounter:
+    """Monotonic per-key version numbers, bumped on every write"""
+
+    def __init__(self):
+        self._versions: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> int:
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def bump(self, key: Hashable) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a question: case and whitespace folded, punctuation stripped"""
+    text = _PUNCTUATION_RE.sub("", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    Query embeddings keyed by (embedding model, normalized question text).
+
+    Backed by an LRUTTLCache without TTL (an embedding never goes stale for
+    its model). With `path`, entries are loaded from a JSON file on first
+    use and written back every `save_every` new entries and at exit.
+    """
+
+    def __init__(self, maxsize: int = 2048, path: Optional[str] = None, save_every: int = 50):
+        self.path = path
+        self.save_every = save_every
+        self._cache = LRUTTLCache(maxsize=maxsize, ttl=None)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._unsaved = 0
+
+    @staticmethod
+    def _key(text: str, model: str) -> str:
+        return f"{model}|{normalize_query(text)}"
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        self._load()
+        return self._cache.get(self._key(text, model))
+
+    def set(self, text: str, model: str, vector: List[float]):
+        self._load()
+        self._cache.set(self._key(text, model), [float(x) for x in vector])
+        with self._lock:
+            self._unsaved += 1
+            due = self.path and self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path:
+                return
+            atexit.register(self.save)
+            if not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[CACHE] Could not read query embeddings from {self.path}: {e}")
+                return
+        for key, vector in entries:
+            self._cache.set(key, vector)
+
+    def save(self):
+        """Write the cached embeddings to `path` atomically"""
+        if not self.path:
+            return
+        with self._lock:
+            self._unsaved = 0
+        entries = self._cache.items()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[CACHE] Could not write query embeddings to {self.path}: {e}")
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SemanticResponseCache:
+    """
+    Answers keyed by owner (a profile id), a fingerprint of everything the
+    answer depends on besides the question, and the normalized question.
+
+    A lookup with a question embedding also matches earlier questions of
+    the same owner and fingerprint whose embeddings are at least
+    `threshold` cosine-similar. Entries under an owner's previous
+    fingerprints are dropped on its next lookup.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = 3600.0, threshold: float = 0.95):
+        self.threshold = threshold
+        self._entries = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        # owner -> fingerprint -> {normalized question: embedding or None}
+        self._questions: Dict[Hashable, Dict[str, Dict[str, Optional[List[float]]]]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, owner: Hashable, fingerprint: str, question: str,
+            vector: Optional[List[float]] = None):
+        """(value, "exact" or "semantic", similarity) for a cached answer, or None"""
+        normalized = normalize_query(question)
+        with self._lock:
+            fingerprints = self._questions.get(owner, {})
+            for stale in [f for f in fingerprints if f != fingerprint]:
+                for stale_question in fingerprints.pop(stale):
+                    self._entries.pop((owner, stale, stale_question))
+                self.invalidations += 1
+            candidates = dict(fingerprints.get(fingerprint, {}))
+
+        value = self._entries.get((owner, fingerprint, normalized))
+        if value is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return value, "exact", 1.0
+
+        if vector is not None:
+            ranked = sorted(
+                ((cosine_similarity(vector, candidate_vector), candidate)
+                 for candidate, candidate_vector in candidates.items()
+                 if candidate != normalized and candidate_vector is not None),
+                reverse=True,
+            )
+            for similarity, candidate in ranked:
+                if similarity < self.threshold:
+                    break
+                value = self._entries.get((owner, fingerprint, candidate))
+                if value is not None:
+                    with self._lock:
+                        self.semantic_hits += 1
+                    return value, "semantic", similarity
+                self._forget(owner, fingerprint, candidate)  # evicted or expired
+        return None
+
+    def _forget(self, owner: Hashable, fingerprint: str, normalized: str):
+        with self._lock:
+            self._questions.get(owner, {}).get(fingerprint, {}).pop(normalized, None)
+
+    def set(self, owner: Hashable, fingerprint: str, question: str, value: Any,
+            vector: Optional[List[float]] = None):
+        """Store a freshly computed answer (counted as a miss)"""
+        normalized = normalize_query(question)
+        with self._lock:
+            self.misses += 1
+            questions = self._questions.setdefault(owner, {}).setdefault(fingerprint, {})
+            questions[normalized] = [float(x) for x in vector] if vector is not None else None
+        self._entries.set((owner, fingerprint, normalized), value)
+
+    def invalidate(self, owner: Hashable):
+        """Forget every answer for `owner`"""
+        with self._lock:
+            fingerprints = self._questions.pop(owner, {})
+            if fingerprints:
+                self.invalidations += 1
+        for fingerprint, questions in fingerprints.items():
+            for question in questions:
+                self._entries.pop((owner, fingerprint, question))
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries.stats()
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "size": entries["size"],
+                "maxsize": entries["maxsize"],
+                "ttl": entries["ttl"],
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": entries["evictions"],
+                "invalidations": self.invalidations,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,456 @@
+"""
+Deterministic answers for calculation questions
+
+router.py sends a question here when it is confident the question needs
+arithmetic on the profile rather than advice. Each answer function takes
+the stored profile and the question and returns markdown, or None when
+the profile lacks what the calculation needs (the question then goes to
+the LLM as usual).
+
+Rates, horizons and amounts written in the question ("at 7%", "in 10
+years", "$300 a month") override the defaults.
+
+The formulas underneath are NumPy functions that accept arrays, so a
+single call compares many rates, payments or horizons: amortization
+schedules, avalanche vs snowball debt payoff, time to an emergency-fund
+target, compound growth and savings-rate projections. TOOLS describes
+them as JSON function schemas for LLM tool calling and run_tool()
+executes a call, filling unspecified arguments from the profile's
+general and budget sections.
+"""
+from typing import Callable, Dict, List, Optional
+import json
+import math
+import re
+
+import numpy as np
+
+
+DEFAULT_RETURN = 0.06          # annual, for savings projections
+DEFAULT_DEBT_RATE = 0.18       # annual, when the question gives none
+DEFAULT_YEARS = 10
+EMERGENCY_FUND_MONTHS = 6
+
+_YEARS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:years?|yrs?)\b")
+_RATE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_AMOUNT_RE = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)")
+
+
+def _years(question: str, default: float = DEFAULT_YEARS) -> float:
+    match = _YEARS_RE.search(question.lower())
+    return float(match.group(1)) if match else default
+
+
+def _rate(question: str, default: float) -> float:
+    match = _RATE_RE.search(question)
+    return float(match.group(1)) / 100 if match else default
+
+
+def _amount(question: str) -> Optional[float]:
+    match = _AMOUNT_RE.search(question)
+    return float(match.group(1).replace(",", "")) if match else None
+
+
+def _money(value: float) -> str:
+    return f"${value:,.0f}"
+
+
+def _duration(months: float) -> str:
+    if math.isinf(months):
+        return "never at the current rate"
+    months = math.ceil(months)
+    years, rest = divmod(months, 12)
+    if not years:
+        return f"{rest} month{'s' * (rest != 1)}"
+    return f"{years} year{'s' * (years != 1)}" + (f" {rest} month{'s' * (rest != 1)}" if rest else "")
+
+
+# ---------------------------------------------------------------------------
+# Formulas
+#
+# Every argument may be a scalar or an array; arrays broadcast against each
+# other, so one call evaluates many scenarios (rates x horizons x payments).
+# Annual rates are fractions (0.06 = 6%), compounded monthly.
+# ---------------------------------------------------------------------------
+
+def _arrays(*values) -> List[np.ndarray]:
+    return np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values])
+
+
+def payment_for(principal, annual_rate, months) -> np.ndarray:
+    """Level monthly payment that repays `principal` in `months`"""
+    p, r, n = _arrays(principal, np.asarray(annual_rate, dtype=float) / 12, months)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(r > 0, p * r / -np.expm1(-n * np.log1p(r)), p / n)
+
+
+def payoff_months(balance, annual_rate, payment) -> np.ndarray:
+    """Months to repay `balance` at `payment` per month (inf if it never is)"""
+    b, r, m = _arrays(balance, np.asarray(annual_rate, dtype=float) / 12, payment)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months = np.where(r > 0, -np.log1p(-r * b / m) / np.log1p(r), b / m)
+    # A payment that doesn't cover the interest never clears the balance
+    months = np.where(m <= b * r, np.inf, months)
+    return np.where(b <= 0, 0.0, months)
+
+
+def amortization_schedule(principal, annual_rate, months=None, payment=None) -> Dict[str, np.ndarray]:
+    """
+    Month-by-month payment, interest, principal and remaining balance.
+
+    Give `months` (the payment is derived) or `payment`. Scenarios run
+    along the first axis: each array is shape (scenarios, longest term),
+    with zeros after a scenario is paid off.
+    """
+    if payment is None:
+        payment = payment_for(principal, annual_rate, months)
+    p, r, m = (np.atleast_1d(a) for a in _arrays(principal, np.asarray(annual_rate, dtype=float) / 12, payment))
+    terms = np.ceil(payoff_months(p, r * 12, m))
+    if not np.isfinite(terms).all():
+        raise ValueError("payment does not cover the interest")
+    k = np.arange(1, int(terms.max()) + 1)
+    growth = (1 + r[:, None]) ** k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        paid = np.where(r[:, None] > 0, (growth - 1) / r[:, None], k)
+    balance = np.clip(p[:, None] * growth - m[:, None] * paid, 0.0, None)
+    balance[k > terms[:, None]] = 0.0
+    previous = np.concatenate([p[:, None], balance[:, :-1]], axis=1)
+    interest = np.where(previous > 0, previous * r[:, None], 0.0)
+    principal_paid = previous - balance
+    return {
+        "payment": interest + principal_paid,
+        "interest": interest,
+        "principal": principal_paid,
+        "balance": balance,
+    }
+
+
+def months_to_target(target, current, monthly, annual_rate=0.0) -> np.ndarray:
+    """Months of saving `monthly` (earning `annual_rate`) to grow `current` to `target`"""
+    t, c, m, r = _arrays(target, current, monthly, np.asarray(annual_rate, dtype=float) / 12)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months = np.where(r > 0, np.log((t * r + m) / (c * r + m)) / np.log1p(r), (t - c) / m)
+    months = np.where(np.isnan(months) | (months < 0) | (m + c * r <= 0), np.inf, months)
+    return np.where(c >= t, 0.0, months)
+
+
+def future_value(current, monthly, annual_rate, years) -> np.ndarray:
+    """Balance after `years` of monthly contributions, compounded monthly"""
+    c, m, r, y = _arrays(current, monthly, np.asarray(annual_rate, dtype=float) / 12, years)
+    n = np.round(y * 12)
+    growth = (1 + r) ** n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(r > 0, (growth - 1) / r, n)
+    return c * growth + m * annuity
+
+
+def savings_projection(income, savings_rate, current=0.0, annual_return=DEFAULT_RETURN,
+                       years=DEFAULT_YEARS, income_growth=0.0) -> np.ndarray:
+    """
+    Year-end balances, shape (scenarios, years + 1), saving `savings_rate`
+    of a monthly `income` that grows by `income_growth` each year
+    """
+    inc, rate, c, r, g = (np.atleast_1d(a) for a in _arrays(income, savings_rate, current, annual_return, income_growth))
+    balances = [c]
+    for _ in range(int(years)):
+        balances.append(future_value(balances[-1], inc * rate, r, 1))
+        inc = inc * (1 + g)
+    return np.stack(balances, axis=1)
+
+
+def debt_payoff(balances, annual_rates, minimums, monthly_budget, strategy: str = "avalanche",
+                max_months: int = 600) -> Dict[str, np.ndarray]:
+    """
+    Pay several debts from one monthly budget: minimums on every debt, the
+    rest to the highest rate first ("avalanche") or the smallest balance
+    first ("snowball").
+
+    Debts run along the last axis; `monthly_budget` may be an array of
+    scenarios. Returns months to debt-free, total interest and the month
+    each debt is cleared (inf if the budget never clears it).
+    """
+    budget = np.atleast_1d(np.asarray(monthly_budget, dtype=float))
+    b = np.broadcast_to(np.asarray(balances, dtype=float), (len(budget), np.size(balances))).copy()
+    r = np.broadcast_to(np.asarray(annual_rates, dtype=float) / 12, b.shape)
+    mins = np.broadcast_to(np.asarray(minimums, dtype=float), b.shape)
+    if strategy == "avalanche":
+        order = np.argsort(-r, axis=1, kind="stable")
+    elif strategy == "snowball":
+        order = np.argsort(b, axis=1, kind="stable")
+    else:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected 'avalanche' or 'snowball'")
+    rows = np.arange(len(b))[:, None]
+
+    interest = np.zeros(len(b))
+    cleared = np.where(b <= 0, 0.0, np.inf)
+    for month in range(1, max_months + 1):
+        if not (b > 0).any():
+            break
+        accrued = b * r
+        interest += accrued.sum(axis=1)
+        b += accrued
+        paid = np.minimum(mins, b)
+        extra = np.clip(budget - paid.sum(axis=1), 0.0, None)
+        # Extra money goes down the priority order until it runs out
+        remaining = (b - paid)[rows, order]
+        before = np.cumsum(remaining, axis=1) - remaining
+        paid[rows, order] += np.clip(extra[:, None] - before, 0.0, remaining)
+        b -= paid
+        b[b < 0.005] = 0.0
+        cleared = np.where((b <= 0) & np.isinf(cleared), month, cleared)
+    return {
+        "months": cleared.max(axis=1),
+        "total_interest": np.where(np.isinf(cleared.max(axis=1)), np.inf, interest),
+        "cleared_month": cleared,
+    }
+
+
+def compare_payoff_strategies(balances, annual_rates, minimums, monthly_budget) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    debt_payoff() under both strategies, plus the interest avalanche saves
+    (NaN where either strategy never pays the debts off)
+    """
+    results = {strategy: debt_payoff(balances, annual_rates, minimums, monthly_budget, strategy)
+               for strategy in ("avalanche", "snowball")}
+    snowball = results["snowball"]["total_interest"]
+    avalanche = results["avalanche"]["total_interest"]
+    results["interest_saved_by_avalanche"] = np.subtract(
+        snowball, avalanche, out=np.full_like(snowball, np.nan),
+        where=np.isfinite(snowball) & np.isfinite(avalanche),
+    )
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Answers
+# ---------------------------------------------------------------------------
+
+def _finances(profile: dict) -> Optional[Dict[str, float]]:
+    general = profile.get("general") or {}
+    budget = profile.get("budget") or {}
+    income = float(general.get("monthly_income") or 0)
+    if income <= 0:
+        return None
+    saving = float(budget.get("savings") or 0)
+    return {
+        "income": income,
+        "saving": saving,
+        "expenses": max(income - saving, 0.0),
+        "savings": float(general.get("current_savings") or 0),
+        "debt": float(general.get("debt_amount") or 0),
+    }
+
+
+def answer_emergency_fund(profile: dict, question: str) -> Optional[str]:
+    f = _finances(profile)
+    if f is None:
+        return None
+    monthly = _amount(question) or f["saving"]
+    target = EMERGENCY_FUND_MONTHS * f["expenses"]
+    months = float(months_to_target(target, f["savings"], monthly))
+    lines = [
+        f"**Emergency fund target:** {_money(target)} "
+        f"({EMERGENCY_FUND_MONTHS} months of your {_money(f['expenses'])} monthly expenses).",
+        f"**Saved so far:** {_money(f['savings'])}.",
+    ]
+    if months == 0:
+        lines.append("You have already reached it.")
+    else:
+        lines.append(f"**Time to target:** {_duration(months)} saving {_money(monthly)} per month.")
+    return "\n\n".join(lines)
+
+
+def answer_debt_payoff(profile: dict, question: str) -> Optional[str]:
+    f = _finances(profile)
+    if f is None or f["debt"] <= 0:
+        return None
+    payment = _amount(question) or f["saving"]
+    rate = _rate(question, DEFAULT_DEBT_RATE)
+    months = float(payoff_months(f["debt"], rate, payment))
+    lines = [f"**Debt:** {_money(f['debt'])} at {rate:.1%} APR, paying {_money(payment)} per month."]
+    if math.isinf(months):
+        lines.append(f"That payment doesn't cover the interest ({_money(f['debt'] * rate / 12)} per month).")
+    else:
+        interest = float(amortization_schedule(f["debt"], rate, payment=payment)["interest"].sum())
+        lines.append(f"**Debt-free in:** {_duration(months)}, paying about {_money(interest)} in interest.")
+    return "\n\n".join(lines)
+
+
+def answer_savings_projection(profile: dict, question: str) -> Optional[str]:
+    f = _finances(profile)
+    if f is None:
+        return None
+    years = _years(question)
+    rate = _rate(question, DEFAULT_RETURN)
+    monthly = _amount(question) or f["saving"]
+    total = float(future_value(f["savings"], monthly, rate, years))
+    contributed = f["savings"] + monthly * round(years * 12)
+    return (
+        f"**Projected savings in {years:g} years:** {_money(total)}\n\n"
+        f"Starting from {_money(f['savings'])} and adding {_money(monthly)} per month "
+        f"at {rate:.1%} a year: {_money(contributed)} contributed, "
+        f"{_money(total - contributed)} growth."
+    )
+
+
+def answer_budget_breakdown(profile: dict, question: str) -> Optional[str]:
+    import budget_engine
+
+    f = _finances(profile)
+    if f is None:
+        return None
+    budget = budget_engine.allocate(profile.get("general"), profile.get("goals"))
+    rows = "\n".join(
+        f"| {category.title()} | {_money(amount)} | {amount / f['income']:.0%} |"
+        for category, amount in budget.items()
+    )
+    return (
+        f"**Recommended monthly budget for {_money(f['income'])} income:**\n\n"
+        f"| Category | Amount | Share |\n|---|---|---|\n{rows}"
+    )
+
+
+def answer_savings_rate(profile: dict, question: str) -> Optional[str]:
+    f = _finances(profile)
+    if f is None:
+        return None
+    rate = f["saving"] / f["income"]
+    verdict = "on track" if rate >= 0.20 else "below the 20% guideline"
+    return (
+        f"**Savings rate:** {rate:.1%} ({_money(f['saving'])} of {_money(f['income'])} per month), "
+        f"{verdict}."
+    )
+
+
+ANSWERS: Dict[str, Callable[[dict, str], Optional[str]]] = {
+    "emergency_fund": answer_emergency_fund,
+    "debt_payoff": answer_debt_payoff,
+    "savings_projection": answer_savings_projection,
+    "budget_breakdown": answer_budget_breakdown,
+    "savings_rate": answer_savings_rate,
+}
+
+
+def answer(intent: str, profile: dict, question: str) -> Optional[str]:
+    """Markdown answer for a routed question, or None if it can't be computed"""
+    handler = ANSWERS.get(intent)
+    return handler(profile or {}, question) if handler else None
+
+
+# ---------------------------------------------------------------------------
+# Tools
+# ---------------------------------------------------------------------------
+
+def _number(description: str) -> Dict:
+    return {"type": "number", "description": description}
+
+
+def _numbers(description: str) -> Dict:
+    return {"type": "array", "items": {"type": "number"}, "description": description}
+
+
+def _scenarios(description: str) -> Dict:
+    """A number, or an array of numbers to compare one scenario per value"""
+    return {"oneOf": [{"type": "number"}, {"type": "array", "items": {"type": "number"}}],
+            "description": description + " (or an array to compare several)"}
+
+
+def _tool(name: str, description: str, properties: Dict, required: List[str]) -> Dict:
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+# Chat-completions "tools" definitions; omitted arguments come from the profile.
+# Arguments given as arrays broadcast together and every scenario is returned.
+TOOLS = [
+    _tool("amortization_schedule",
+          "Monthly payment, interest, principal and remaining balance of a loan",
+          {"principal": _scenarios("Loan balance in dollars (default: the profile's debt)"),
+           "annual_rate": _scenarios("Annual interest rate as a fraction, e.g. 0.18"),
+           "months": _scenarios("Term in months, to derive the payment"),
+           "payment": _scenarios("Monthly payment in dollars (default: the budget's savings)")},
+          ["annual_rate"]),
+    _tool("debt_payoff",
+          "Months and interest to clear several debts from one monthly budget, "
+          "avalanche (highest rate first) vs snowball (smallest balance first)",
+          {"balances": _numbers("Balance of each debt in dollars"),
+           "annual_rates": _numbers("Annual rate of each debt as a fraction"),
+           "minimums": _numbers("Minimum monthly payment of each debt"),
+           "monthly_budget": _scenarios("Total paid towards debt each month (default: the budget's savings)")},
+          ["balances", "annual_rates", "minimums"]),
+    _tool("emergency_fund",
+          "Months to reach an emergency fund of several months of expenses",
+          {"months_of_expenses": _scenarios(f"Target size in months of expenses (default {EMERGENCY_FUND_MONTHS})"),
+           "monthly_saving": _scenarios("Dollars saved per month (default: the budget's savings)"),
+           "annual_rate": _scenarios("Annual interest earned on the fund as a fraction (default 0)")},
+          []),
+    _tool("future_value",
+          "Balance after years of monthly contributions with compound growth",
+          {"current": _scenarios("Starting balance (default: the profile's current savings)"),
+           "monthly": _scenarios("Monthly contribution (default: the budget's savings)"),
+           "annual_rate": _scenarios(f"Annual return as a fraction (default {DEFAULT_RETURN})"),
+           "years": _scenarios(f"Horizon in years (default {DEFAULT_YEARS})")},
+          []),
+    _tool("savings_projection",
+          "Year-end balances saving a share of a growing monthly income",
+          {"savings_rate": _scenarios("Share of income saved as a fraction (default: the budget's)"),
+           "income_growth": _scenarios("Annual income growth as a fraction (default 0)"),
+           "annual_return": _scenarios(f"Annual return as a fraction (default {DEFAULT_RETURN})"),
+           "years": _number(f"Horizon in years (default {DEFAULT_YEARS})")},
+          []),
+]
+
+
+def _plain(value):
+    """numpy results -> JSON-serialisable values (inf becomes null)"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    value = np.asarray(value, dtype=float)
+    value = np.where(np.isfinite(value), np.round(value, 2), np.nan)
+    if value.ndim == 0:
+        return None if np.isnan(value) else float(value)
+    return [_plain(item) for item in value] if value.ndim > 1 else [None if np.isnan(v) else float(v) for v in value]
+
+
+def run_tool(name: str, arguments, profile: Optional[dict] = None) -> Dict:
+    """
+    Execute a TOOLS call. `arguments` is a dict or the JSON string from the
+    model's tool call; the result is a JSON-serialisable dict with one entry
+    per scenario wherever an argument was an array.
+    """
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments or "{}")
+    args = {key: value for key, value in (arguments or {}).items() if value is not None}
+    f = _finances(profile or {}) or {"income": 0.0, "saving": 0.0, "expenses": 0.0, "savings": 0.0, "debt": 0.0}
+
+    if name == "amortization_schedule":
+        schedule = amortization_schedule(args.get("principal", f["debt"]), args["annual_rate"],
+                                         args.get("months"), args.get("payment", None if "months" in args else f["saving"]))
+        return _plain({
+            **schedule,
+            "months": (schedule["payment"] > 0).sum(axis=1),
+            "total_interest": schedule["interest"].sum(axis=1),
+        })
+    if name == "debt_payoff":
+        budget = args.get("monthly_budget", f["saving"])
+        return _plain(compare_payoff_strategies(args["balances"], args["annual_rates"], args["minimums"], budget))
+    if name == "emergency_fund":
+        target = np.asarray(args.get("months_of_expenses", EMERGENCY_FUND_MONTHS), dtype=float) * f["expenses"]
+        months = months_to_target(target, f["savings"], args.get("monthly_saving", f["saving"]),
+                                  args.get("annual_rate", 0.0))
+        return _plain({"target": target, "current": f["savings"], "months": months})
+    if name == "future_value":
+        return _plain({"balance": future_value(args.get("current", f["savings"]), args.get("monthly", f["saving"]),
+                                               args.get("annual_rate", DEFAULT_RETURN), args.get("years", DEFAULT_YEARS))})
+    if name == "savings_projection":
+        rate = args.get("savings_rate", f["saving"] / f["income"] if f["income"] else 0.0)
+        balances = savings_projection(f["income"], rate, f["savings"], args.get("annual_return", DEFAULT_RETURN),
+                                      args.get("years", DEFAULT_YEARS), args.get("income_growth", 0.0))
+        return _plain({"savings_rate": rate, "year_end_balances": balances})
+    raise ValueError(f"Unknown tool {name!r}")
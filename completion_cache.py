@@ -0,0 +1,144 @@
+"""
+Disk-backed LLM completion cache shared by every server process
+
+Completions are keyed by a SHA-256 of (model, messages, temperature,
+max_tokens) and stored in one SQLite file in WAL mode, so any number of
+processes can read while one writes, and a restarted server answers
+prompts it has seen before from local disk instead of the network.
+
+Entries expire `ttl` seconds after they were written. When the file
+holds more than `max_entries`, the least recently used entries are
+deleted (checked every `prune_every` writes, and on open).
+"""
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+# A hit refreshes its access time at most this often (seconds), so reads
+# mostly stay reads
+TOUCH_INTERVAL = 60.0
+
+
+def completion_key(request: Dict) -> str:
+    """Hash of the request fields that determine the completion"""
+    material = {field: request.get(field) for field in ("model", "messages", "temperature", "max_tokens")}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path: str, ttl: Optional[float] = 7 * 86400.0, max_entries: int = 5000,
+                 prune_every: int = 100):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        # sqlite3 connections can't be shared across threads: one per thread
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, expires REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions (accessed)")
+        self.prune()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; writers from other processes are waited for, not failed
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, request: Dict) -> Optional[str]:
+        """Cached completion text for `request`, or None"""
+        key = completion_key(request)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT content, accessed FROM completions WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is not None and row[1] < now - TOUCH_INTERVAL:
+                conn.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self._error("read", e)
+            return None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row else None
+
+    def set(self, request: Dict, content: str):
+        now = time.time()
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO completions (key, model, content, created, accessed, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (completion_key(request), request.get("model"), content, now, now,
+                 now + self.ttl if self.ttl else None),
+            )
+        except sqlite3.Error as e:
+            self._error("write", e)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.prune_every == 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries, then least recently used ones over max_entries"""
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM completions WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        except sqlite3.Error as e:
+            self._error("prune", e)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM completions")
+
+    def _error(self, operation: str, error: Exception):
+        # The cache is an optimization: a locked or corrupt file means a miss
+        with self._lock:
+            self.errors += 1
+        print(f"[COMPLETION CACHE] {operation} failed: {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
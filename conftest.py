@@ -0,0 +1,19 @@
+"""
+pytest setup: the tests run against an in-memory store and the offline
+LLM stand-in, with nothing persisted to disk
+"""
+import os
+import sys
+
+os.environ.update({
+    "STORAGE_BACKEND": "memory",
+    "LLM_BACKEND": "local",
+    "COMPLETION_CACHE_PATH": "",
+    "WRITE_BEHIND_JOURNAL": "",
+    "LLM_RPM": "0",
+    "LLM_TPM": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Manual scripts that need live services, not pytest modules
+collect_ignore = ["test_ai.py", "test_connection.py", "debug_connection.py"]
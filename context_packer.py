@@ -0,0 +1,197 @@
+"""
+Token-budgeted context packing for the RAG prompt
+
+augment_prompt_with_context used to paste the full profile dump and every
+retrieved note into the prompt. The packer keeps each section inside its
+own token budget instead:
+
+- profile: empty fields and ids dropped, one line per section
+- notes: weak matches cut by a similarity floor, near-duplicates removed,
+  the rest ordered by MMR (relevance vs. redundancy), long notes truncated,
+  then added until the notes budget is spent
+
+The similarity floor applies to cosine scores only. MMR needs relevance on
+a 0..1 scale: hybrid results use their fused (RRF) score and keyword-only
+results their BM25 score, each relative to the best note.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import math
+import os
+import re
+
+
+PROFILE_TOKEN_BUDGET = int(os.getenv("CONTEXT_PROFILE_TOKENS", "300"))
+NOTES_TOKEN_BUDGET = int(os.getenv("CONTEXT_NOTES_TOKENS", "600"))
+NOTE_MAX_TOKENS = int(os.getenv("CONTEXT_NOTE_MAX_TOKENS", "120"))
+# Cosine similarity on the Data API's 0..1 scale; unrelated text sits around 0.5
+MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY", "0.55"))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: about 4 characters per token
+    for English, but never fewer tokens than 3 per 4 words
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), math.ceil(len(_WORD_RE.findall(text)) * 0.75))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut at a word boundary so the text fits in `max_tokens`"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ---------------------------------------------------------------------------
+# Profile section
+# ---------------------------------------------------------------------------
+
+def _format_value(value) -> str:
+    if isinstance(value, dict):
+        return ", ".join(f"{key}={_format_value(item)}" for key, item in value.items()
+                         if item not in (None, "", [], {}))
+    if isinstance(value, list):
+        return ", ".join(_format_value(item) for item in value)
+    return str(value)
+
+
+def format_profile(profile: dict) -> str:
+    """Compact profile: one line per top-level field, empty values and ids skipped"""
+    lines = []
+    for key, value in (profile or {}).items():
+        if key in ("_id", "id") or value in (None, "", [], {}):
+            continue
+        lines.append(f"{key}: {_format_value(value)}")
+    return "\n".join(lines)
+
+
+def pack_profile(profile: dict, budget: int = PROFILE_TOKEN_BUDGET) -> str:
+    """format_profile() trimmed to `budget` tokens (later lines go first)"""
+    lines = format_profile(profile).split("\n")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop()
+    return truncate_to_tokens("\n".join(lines), budget)
+
+
+# ---------------------------------------------------------------------------
+# Notes section
+# ---------------------------------------------------------------------------
+
+def _relevance(docs: List[Dict]) -> Callable[[Dict], float]:
+    """
+    0..1 relevance for MMR: cosine similarity when every note has one,
+    otherwise the RRF (hybrid) or BM25 (keyword) score divided by the top one
+    """
+    if any(doc.get("rrf_score") is not None for doc in docs):
+        field = "rrf_score"
+    elif all(doc.get("similarity_score") is not None for doc in docs):
+        return lambda doc: doc["similarity_score"]
+    else:
+        field = "keyword_score"
+    top = max((doc.get(field) or 0.0 for doc in docs), default=0.0)
+    return lambda doc: (doc.get(field) or 0.0) / top if top else 0.0
+
+
+def select_notes(docs: List[Dict], budget: int = NOTES_TOKEN_BUDGET,
+                 min_similarity: float = MIN_SIMILARITY,
+                 duplicate_threshold: float = DUPLICATE_THRESHOLD,
+                 mmr_lambda: float = MMR_LAMBDA,
+                 note_max_tokens: int = NOTE_MAX_TOKENS) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Retrieved notes worth their tokens, in prompt order.
+
+    Returns (notes, counts) where each note is a copy of the retrieved doc
+    with "text" possibly truncated, and counts says how many were dropped
+    at each stage.
+    """
+    counts = {"below_similarity": 0, "duplicates": 0, "over_budget": 0, "truncated": 0}
+
+    fused = any(doc.get("rrf_score") is not None for doc in docs)
+    if fused:
+        ranked = sorted(docs, key=lambda d: d.get("rrf_score") or 0.0, reverse=True)
+    else:
+        # Stable: keyword-only results (no similarity) keep their retrieval order
+        ranked = sorted(docs, key=lambda d: d.get("similarity_score") or 0.0, reverse=True)
+
+    candidates = []
+    for doc in ranked:
+        similarity = doc.get("similarity_score")
+        if similarity is not None and similarity < min_similarity:
+            counts["below_similarity"] += 1
+            continue
+        words = _words(doc.get("text", ""))
+        if any(_jaccard(words, kept_words) >= duplicate_threshold for _, kept_words in candidates):
+            counts["duplicates"] += 1
+            continue
+        candidates.append((doc, words))
+
+    # Maximal marginal relevance: next pick balances relevance against
+    # overlap with what is already selected
+    relevance = _relevance([doc for doc, _ in candidates])
+    ordered = []
+    while candidates:
+        def mmr(candidate):
+            doc, words = candidate
+            redundancy = max((_jaccard(words, chosen) for _, chosen in ordered), default=0.0)
+            return mmr_lambda * relevance(doc) - (1 - mmr_lambda) * redundancy
+        best = max(candidates, key=mmr)
+        candidates.remove(best)
+        ordered.append(best)
+
+    selected, used = [], 0
+    for doc, _ in ordered:
+        text = truncate_to_tokens(doc.get("text", ""), note_max_tokens)
+        if text != doc.get("text", ""):
+            counts["truncated"] += 1
+        tokens = estimate_tokens(text)
+        if used + tokens > budget:
+            counts["over_budget"] += 1
+            continue
+        used += tokens
+        selected.append({**doc, "text": text})
+    return selected, counts
+
+
+def pack_context(profile: dict, docs: List[Dict], full_profile: Optional[str] = None,
+                 profile_text: Optional[str] = None) -> Dict:
+    """
+    Profile and notes sections for the prompt, plus token accounting
+    against the unpacked version (full profile dump, every note in full).
+    `profile_text` is an already packed profile section.
+    """
+    if profile_text is None:
+        profile_text = pack_profile(profile)
+    notes, counts = select_notes(docs)
+    unpacked = estimate_tokens(full_profile or "") + sum(estimate_tokens(d.get("text", "")) for d in docs)
+    packed = estimate_tokens(profile_text) + sum(estimate_tokens(d["text"]) for d in notes)
+    return {
+        "profile": profile_text,
+        "notes": notes,
+        "stats": {
+            "context_tokens": packed,
+            "unpacked_tokens": unpacked,
+            "tokens_saved": max(0, unpacked - packed),
+            "notes_used": len(notes),
+            "notes_dropped": len(docs) - len(notes),
+            **counts,
+        },
+    }
@@ -1,72 +1,172 @@
-from astrapy import DataAPIClient
+"""
+Database layer: storage backend selection and lazily connected collection handles.
+
+Importing this module does no I/O. The backend is created, and collection
+existence checked (once per process), the first time a collection is used.
+Creating collections is a separate, explicit step:
+
+    python db.py bootstrap
+"""
 from dotenv import load_dotenv
-import streamlit as st
+import asyncio
 import os
+import sys
+import threading
+import weakref
+
+from resilience import Dependency, ResilientCollection, ResilientAsyncCollection
+from storage import (
+    AstraBackend,
+    SQLiteBackend,
+    PROFILES_COLLECTION,
+    NOTES_COLLECTION,
+)
 
 load_dotenv()
 
 ENDPOINT = os.getenv("ASTRA_ENDPOINT")
 TOKEN = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
 
+# "astra" (default) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "astra").lower()
+# SQLite database file, ":memory:" for a throwaway in-process store
+SQLITE_PATH = os.getenv("SQLITE_PATH", "financial_advisor.db")
+# Simulated round trip / fault rate per call on the local backend (benchmarks, resilience drills)
+STORAGE_LATENCY_MS = float(os.getenv("STORAGE_LATENCY_MS", "0"))
+STORAGE_FAILURE_RATE = float(os.getenv("STORAGE_FAILURE_RATE", "0"))
+
+# Every store call gets a timeout, jittered retries and a circuit breaker
+store = Dependency(
+    "astra" if STORAGE_BACKEND == "astra" else "store",
+    timeout=float(os.getenv("STORE_TIMEOUT", "10")),
+    max_retries=int(os.getenv("STORE_MAX_RETRIES", "2")),
+)
+
+_lock = threading.RLock()
+_backend = None
+_existing_collections = None
+_reported_missing = set()
+
+
+def create_backend(kind: str = None):
+    """Build the storage backend selected by configuration"""
+    kind = (kind or STORAGE_BACKEND).lower()
+    if kind == "astra":
+        return AstraBackend(TOKEN, ENDPOINT)
+    if kind in ("sqlite", "memory"):
+        return SQLiteBackend(
+            ":memory:" if kind == "memory" else SQLITE_PATH,
+            latency=STORAGE_LATENCY_MS / 1000,
+            failure_rate=STORAGE_FAILURE_RATE,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND '{kind}' (expected 'astra', 'sqlite' or 'memory')")
+
 
-@st.cache_resource
 def get_db():
-    client = DataAPIClient(TOKEN)
-    db = client.get_database_by_api_endpoint(ENDPOINT)
-    return db
+    """Return the process-wide storage backend, connecting on first call"""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = create_backend()
+                print(f"✓ Connected to {_backend.name} storage for Financial Advisor")
+    return _backend
+
+
+def collection_exists(name: str) -> bool:
+    """Check a collection against the cached listing (one round trip per process)"""
+    global _existing_collections
+    if _existing_collections is None:
+        with _lock:
+            if _existing_collections is None:
+                _existing_collections = set(store.call(get_db().list_collection_names))
+    return name in _existing_collections
+
+
+def warn_if_missing(name: str):
+    """Point at `python db.py bootstrap` once per collection, on backends that need it"""
+    if get_db().creates_on_demand or name in _reported_missing or collection_exists(name):
+        return
+    _reported_missing.add(name)
+    print(f"⚠️  Collection {name} not found. Run `python db.py bootstrap` to create it.")
+
 
 def ensure_collections():
-    """Ensure both collections exist with proper configuration"""
-    db = get_db()
-    
-    # Get list of existing collections
-    existing_collections = db.list_collection_names()
-    
-    # Create financial_profiles if it doesn't exist
-    if "financial_profiles" not in existing_collections:
-        try:
-            db.create_collection("financial_profiles")
-            print("✓ Created collection: financial_profiles")
-        except Exception as e:
-            print(f"Error creating financial_profiles: {e}")
-    else:
-        print("✓ Collection financial_profiles exists")
-    
-    # Create financial_notes with vector support if it doesn't exist
-    if "financial_notes" not in existing_collections:
-        try:
-            # Try with vector configuration
-            db.create_collection(
-                "financial_notes",
-                dimension=1024,
-                metric="cosine",
-                service={
-                    "provider": "nvidia",
-                    "modelName": "NV-Embed-QA"
-                }
-            )
-            print("✓ Created collection: financial_notes (with vector embeddings)")
-        except Exception as e:
-            print(f"⚠️  Error creating financial_notes with vectors: {e}")
-            print("   Trying without vector configuration...")
-            try:
-                # Fallback: create without vectors
-                db.create_collection("financial_notes")
-                print("✓ Created collection: financial_notes (without vectors)")
-                print("   Note: Vector search will not be available")
-            except Exception as e2:
-                print(f"❌ Failed to create financial_notes: {e2}")
-    else:
-        print("✓ Collection financial_notes exists")
+    """Ensure both collections exist with proper configuration (schema bootstrap)"""
+    global _existing_collections
+    get_db().ensure_collections()
+    with _lock:
+        _existing_collections = None
+
 
-# Initialize database and ensure collections exist
-db = get_db()
-ensure_collections()
+class LazyCollection:
+    """
+    Collection handle that resolves to the backend collection on first use.
 
-# Get collection references
-personal_data_collection = db.get_collection("financial_profiles")
-notes_collection = db.get_collection("financial_notes")
+    Behaves exactly like the underlying collection (find_one, find,
+    insert_one, update_one, delete_one, ...), so callers keep importing
+    module-level handles from here.
+    """
 
-print("✓ Connected to AstraDB for Financial Advisor")
-print(f"  - Profiles: financial_profiles")
-print(f"  - Notes: financial_notes")
\ No newline at end of file
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+
+    def resolve(self):
+        if self._collection is None:
+            warn_if_missing(self.name)
+            self._collection = ResilientCollection(get_db().get_collection(self.name), store)
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        state = "connected" if self._collection is not None else "not connected"
+        return f"LazyCollection({self.name!r}, {state})"
+
+
+class LazyAsyncCollection:
+    """
+    Async counterpart of LazyCollection: coroutine methods, `find` returns
+    an async-iterable cursor. Async HTTP clients are bound to an event loop,
+    so one handle is resolved per running loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._by_loop = weakref.WeakKeyDictionary()
+
+    def resolve(self):
+        loop = asyncio.get_running_loop()
+        collection = self._by_loop.get(loop)
+        if collection is None:
+            warn_if_missing(self.name)
+            collection = ResilientAsyncCollection(get_db().get_async_collection(self.name), store)
+            self._by_loop[loop] = collection
+        return collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyAsyncCollection({self.name!r})"
+
+
+# Collection references (no connection until first use)
+personal_data_collection = LazyCollection(PROFILES_COLLECTION)
+notes_collection = LazyCollection(NOTES_COLLECTION)
+
+# Async handles for concurrent loading (use inside a running event loop)
+async_personal_data_collection = LazyAsyncCollection(PROFILES_COLLECTION)
+async_notes_collection = LazyAsyncCollection(NOTES_COLLECTION)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bootstrap":
+        ensure_collections()
+        print(f"  - Profiles: {PROFILES_COLLECTION}")
+        print(f"  - Notes: {NOTES_COLLECTION}")
+    else:
+        print("Usage: python db.py bootstrap")
+        sys.exit(1)
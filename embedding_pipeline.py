@@ -0,0 +1,239 @@
+"""
+Background embedding for stored notes
+
+add_note used to wait for the store to embed the note ($vectorize) as part
+of the insert. Notes are now inserted with metadata.indexing_status
+"pending" and handed to an EmbeddingPipeline: a small pool of worker
+threads that drain a shared queue in batches and call embed_batch for
+each batch. Until a note is embedded, retrieval finds it by keywords.
+
+At interpreter exit the pipeline drains for a few seconds, before thread
+pools stop accepting work; notes still queued then stay pending in the
+store and are resumed by the next process.
+"""
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+
+from resilience import register_exit
+
+
+def is_shutdown_error(error: BaseException) -> bool:
+    """The interpreter (or an executor) is shutting down: no fault of the notes"""
+    return isinstance(error, RuntimeError) and "shutdown" in str(error)
+
+
+class EmbeddingPipeline:
+    """
+    Batched background embedding.
+
+    embed_batch(notes) embeds a list of note documents (_id, user_id,
+    text) and returns the notes that failed; raising fails the whole
+    batch. Failed notes are retried with exponential backoff, and
+    on_failed(notes) is called for notes that run out of attempts.
+    close() (run at exit) drains for up to exit_timeout seconds.
+    """
+
+    def __init__(self, embed_batch: Callable[[List[dict]], List[dict]],
+                 batch_size: int = 16, workers: int = 2, max_wait: float = 0.1,
+                 max_attempts: int = 5, base_backoff: float = 0.5, max_backoff: float = 30.0,
+                 on_failed: Optional[Callable[[List[dict]], None]] = None,
+                 resume: Optional[Callable[[], List[dict]]] = None,
+                 exit_timeout: float = 5.0):
+        self.embed_batch = embed_batch
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.on_failed = on_failed
+        self.resume = resume
+        self.exit_timeout = exit_timeout
+
+        self._queue = deque()  # (ready_at, attempts, note)
+        self._in_flight: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+        self.submitted = 0
+        self.embedded = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+
+    # --- public API --------------------------------------------------------
+
+    def submit(self, notes: List[dict]):
+        """Queue stored notes for embedding; returns immediately"""
+        if not notes:
+            return
+        with self._lock:
+            if self._closed:
+                return  # still pending in the store: the next process resumes them
+            for note in notes:
+                self._queue.append((0.0, 0, note))
+            self.submitted += len(notes)
+            self._start()
+            self._ready.notify_all()
+
+    def cancel(self, note_id) -> bool:
+        """Drop a queued note (e.g. it was deleted before being embedded)"""
+        note_id = str(note_id)
+        with self._lock:
+            for entry in list(self._queue):
+                if str(entry[2]["_id"]) == note_id:
+                    self._queue.remove(entry)
+                    self._idle.notify_all()
+                    return True
+        return False
+
+    def pending(self, user_id=None) -> List[dict]:
+        """Notes queued or being embedded, optionally for one user"""
+        with self._lock:
+            notes = [entry[2] for entry in self._queue] + list(self._in_flight.values())
+        if user_id is None:
+            return notes
+        return [note for note in notes if note.get("user_id") == user_id]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queue is drained (or timeout); True if drained"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Drain the queue (up to `timeout`, default exit_timeout), then stop
+        the workers; True if drained
+        """
+        drained = self.flush(self.exit_timeout if timeout is None else timeout)
+        with self._lock:
+            self._closed = True
+            self._ready.notify_all()
+        if not drained:
+            print(f"[EMBEDDING] Stopping with {len(self.pending())} note(s) still pending")
+        return drained
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "in_flight": len(self._in_flight),
+                "submitted": self.submitted,
+                "embedded": self.embedded,
+                "batches": self.batches,
+                "retries": self.retries,
+                "failed": self.failed,
+            }
+
+    # --- workers -----------------------------------------------------------
+
+    def _start(self):
+        """Start the workers on first use (lock held)"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"embedding-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        register_exit(self.close)
+        if self.resume:
+            threading.Thread(target=self._resume, name="embedding-resume", daemon=True).start()
+
+    def _resume(self):
+        """Re-queue notes left pending by an earlier process"""
+        try:
+            notes = self.resume()
+        except Exception as e:
+            print(f"[EMBEDDING] Could not look up pending notes: {e}")
+            return
+        with self._lock:
+            queued = {str(entry[2]["_id"]) for entry in self._queue} | set(self._in_flight)
+        notes = [note for note in notes if str(note["_id"]) not in queued]
+        if notes:
+            print(f"[EMBEDDING] Resuming {len(notes)} note(s) left pending")
+            self.submit(notes)
+
+    def _take_batch(self) -> List[tuple]:
+        """Wait for work, then up to batch_size ready notes; [] once closed (lock held)"""
+        while True:
+            if self._closed:
+                return []
+            now = time.monotonic()
+            ready = [entry for entry in self._queue if entry[0] <= now]
+            if ready:
+                # Give a trickle of single notes a moment to form a batch
+                if len(ready) < self.batch_size and self.max_wait:
+                    self._ready.wait(self.max_wait)
+                    now = time.monotonic()
+                    ready = [entry for entry in self._queue if entry[0] <= now]
+                batch = ready[:self.batch_size]
+                for entry in batch:
+                    self._queue.remove(entry)
+                    self._in_flight[str(entry[2]["_id"])] = entry[2]
+                if batch:
+                    return batch
+            wait = min((entry[0] - now for entry in self._queue), default=None)
+            self._ready.wait(wait)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                batch = self._take_batch()
+            if not batch:
+                return
+            notes = [note for _, _, note in batch]
+            try:
+                failed = self.embed_batch(notes) or []
+            except Exception as e:
+                if is_shutdown_error(e):
+                    self._abandon(batch)
+                    return
+                print(f"[EMBEDDING] Batch of {len(notes)} failed: {e}")
+                failed = notes
+            self._finish(batch, {str(note["_id"]) for note in failed})
+
+    def _abandon(self, batch: List[tuple]):
+        """Stop on shutdown without spending an attempt: the notes stay pending in the store"""
+        with self._lock:
+            self._closed = True
+            for _, _, note in batch:
+                self._in_flight.pop(str(note["_id"]), None)
+            self._queue.clear()
+            self._ready.notify_all()
+            self._idle.notify_all()
+
+    def _finish(self, batch: List[tuple], failed_ids: set):
+        gave_up = []
+        with self._lock:
+            self.batches += 1
+            for _, attempts, note in batch:
+                note_id = str(note["_id"])
+                self._in_flight.pop(note_id, None)
+                if note_id not in failed_ids:
+                    self.embedded += 1
+                elif attempts + 1 >= self.max_attempts:
+                    self.failed += 1
+                    gave_up.append(note)
+                else:
+                    self.retries += 1
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** attempts)
+                    self._queue.append((time.monotonic() + delay, attempts + 1, note))
+            self._ready.notify_all()
+            if not self._queue and not self._in_flight:
+                self._idle.notify_all()
+        if gave_up and self.on_failed:
+            try:
+                self.on_failed(gave_up)
+            except Exception as e:
+                print(f"[EMBEDDING] Could not record {len(gave_up)} failed note(s): {e}")
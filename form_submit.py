@@ -135,21 +135,42 @@
 
 
 from db import personal_data_collection, notes_collection
+from profiles import (
+    cache_profile, get_profile, save_profile_fields, index_notes, unindex_note, notes_changed,
+    prepare_note_embedding,
+)
+from write_behind import diff_paths
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Optional, Union
+import copy
+import json
+import os
+import time
+import uuid
 # 're' import removed as it's no longer needed here
 
 def update_personal_info(existing, update_type, **kwargs):
     if update_type == "goals":
         existing["goals"] = kwargs.get("goals", [])
-        update_field = {"goals": existing["goals"]}
     else:
         # This will correctly handle saving the 'budget' dict
         existing[update_type] = kwargs
-        update_field = {update_type: existing[update_type]}
- 
-    personal_data_collection.update_one(
-        {"id": existing["id"]}, {"$set": update_field}
+
+    # Diff against the last persisted state and $set only the changed fields
+    persisted = get_profile(existing["id"])
+    if persisted is None:
+        persisted = copy.deepcopy(existing)
+        persisted[update_type] = None
+    update_fields = diff_paths(
+        {update_type: persisted.get(update_type)},
+        {update_type: existing[update_type]},
     )
+    save_profile_fields(existing["id"], update_fields)
+
+    # Bump the profile version so no session reads the pre-save copy
+    persisted[update_type] = copy.deepcopy(existing[update_type])
+    cache_profile(persisted)
     return existing
 
 def add_note(note, profile_id):
@@ -158,7 +179,8 @@ def add_note(note, profile_id):
     
     This is a critical part of the RAG system:
     - Stores the note text
-    - Automatically creates vector embedding via $vectorize
+    - Queues it for vector embedding in the background (see embedding_pipeline.py);
+      keyword search finds it until the embedding lands
     - Enables semantic search for retrieval
     """
     new_note = {
@@ -171,21 +193,174 @@ def add_note(note, profile_id):
         },
     }
     
-    # Try to add vector embeddings for RAG, but don't fail if not supported
-    try:
-        new_note["$vectorize"] = note  # Enable vector embeddings for semantic search
-        print(f"[RAG] Note added with vector embeddings: '{note[:50]}...'")
-    except Exception as e:
-        print(f"[RAG] Warning: Vector embeddings not available: {e}")
-        pass
+    # Embedding happens during the insert ($vectorize) or in the background
+    prepare_note_embedding(new_note)
     
     result = notes_collection.insert_one(new_note)
+    print(f"[RAG] Note added (embedding {new_note['metadata']['indexing_status']}): '{note[:50]}...'")
     new_note["_id"] = result.inserted_id
+    notes_changed(profile_id)
+    index_notes(profile_id, [new_note])
     return new_note
 
-def delete_note(id):
+def _bulk_note_document(item: Union[str, dict], profile_id, source: str, row: int) -> dict:
+    """Build a note document for bulk import with a deterministic _id"""
+    if isinstance(item, str):
+        item = {"text": item}
+    text = str(item.get("text", "")).strip()
+    if not text:
+        raise ValueError("note has no text")
+
+    injested = item.get("injested") or item.get("date") or datetime.now(timezone.utc)
+    if isinstance(injested, str):
+        injested = datetime.fromisoformat(injested)
+    if injested.tzinfo is None:
+        injested = injested.replace(tzinfo=timezone.utc)
+
+    # Same source + row + text always maps to the same _id, so re-running
+    # an interrupted import never creates duplicates
+    note_id = uuid.uuid5(uuid.NAMESPACE_URL, f"note:{profile_id}:{source}:{row}:{text}")
+    return prepare_note_embedding({
+        "_id": str(note_id),
+        "user_id": profile_id,
+        "text": text,
+        "metadata": {
+            "injested": injested,
+            "note_type": item.get("note_type", "financial"),
+            "indexed_for_rag": True,
+            "source": source,
+        },
+    })
+
+
+def _insert_note_chunk(profile_id, chunk):
+    """
+    Insert one chunk with insert_many; if that fails, retry row by row so
+    every failure is attributed to its input row.
+    Returns (inserted, skipped, failures).
+    """
+    docs = [doc for _, doc in chunk]
+    try:
+        notes_collection.insert_many(docs, ordered=False)
+        notes_changed(profile_id)
+        index_notes(profile_id, docs)
+        return len(docs), 0, []
+    except Exception:
+        pass
+
+    inserted, skipped, failures, stored = 0, 0, [], []
+    for row, doc in chunk:
+        try:
+            existing = notes_collection.find_one(
+                {"_id": doc["_id"]}, projection={"metadata.indexing_status": True}
+            )
+            if existing:
+                skipped += 1  # already imported, possibly by this chunk's insert_many
+                if existing.get("metadata", {}).get("indexing_status") == "pending":
+                    stored.append(doc)
+                continue
+            notes_collection.insert_one(doc)
+            inserted += 1
+            stored.append(doc)
+        except Exception as e:
+            failures.append({"row": row, "error": str(e)})
+    if inserted:
+        notes_changed(profile_id)
+    index_notes(profile_id, stored)
+    return inserted, skipped, failures
+
+
+def add_notes_bulk(profile_id, notes: Iterable[Union[str, dict]], chunk_size: int = 20,
+                   concurrency: int = 4, source: str = "bulk",
+                   checkpoint_path: Optional[str] = None) -> dict:
+    """
+    Bulk note ingestion for onboarding (e.g. a journal export)
+
+    Streams `notes` (strings or dicts with "text" and optional "date"), inserts
+    them in chunks through insert_many with at most `concurrency` chunks in
+    flight, and reports per-row failures.
+
+    Resumable: with `checkpoint_path`, the first row not yet committed is
+    saved as chunks complete and skipped rows are picked up on the next run.
+    Note ids are deterministic, so re-sent rows are never duplicated.
+    """
+    start = time.perf_counter()
+    resume_from = 0
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("profile_id") == profile_id and checkpoint.get("source") == source:
+            resume_from = checkpoint.get("next_row", 0)
+            print(f"[BULK] Resuming {source} from row {resume_from}")
+
+    report = {"rows": 0, "inserted": 0, "skipped": 0, "failed": [], "resumed_from": resume_from}
+    done_chunks = {}  # first row -> row after the chunk, for the contiguous checkpoint
+    next_row = resume_from
+
+    def save_checkpoint():
+        nonlocal next_row
+        while next_row in done_chunks:
+            next_row = done_chunks.pop(next_row)
+        if checkpoint_path:
+            with open(checkpoint_path, "w") as f:
+                json.dump({"profile_id": profile_id, "source": source, "next_row": next_row}, f)
+
+    def collect(finished):
+        for future in finished:
+            first_row, end_row = in_flight.pop(future)
+            inserted, skipped, failures = future.result()
+            report["inserted"] += inserted
+            report["skipped"] += skipped
+            report["failed"].extend(failures)
+            done_chunks[first_row] = end_row
+        save_checkpoint()
+
+    in_flight = {}
+    chunk, chunk_start = [], None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def submit(chunk, chunk_start, end_row):
+            if not chunk:
+                done_chunks[chunk_start] = end_row
+                return
+            # Bounded: wait for a slot before reading further input
+            while len(in_flight) >= concurrency:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight[pool.submit(_insert_note_chunk, profile_id, chunk)] = (chunk_start, end_row)
+
+        row = -1
+        for row, item in enumerate(notes):
+            if row < resume_from:
+                continue
+            report["rows"] += 1
+            if chunk_start is None:
+                chunk_start = row
+            try:
+                chunk.append((row, _bulk_note_document(item, profile_id, source, row)))
+            except Exception as e:
+                report["failed"].append({"row": row, "error": str(e)})
+            if row + 1 - chunk_start >= chunk_size:
+                submit(chunk, chunk_start, row + 1)
+                chunk, chunk_start = [], None
+        if chunk_start is not None:
+            submit(chunk, chunk_start, row + 1)
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    report["next_row"] = next_row
+    report["elapsed"] = time.perf_counter() - start
+    report["rows_per_sec"] = report["rows"] / report["elapsed"] if report["elapsed"] else 0.0
+    print(f"[BULK] {report['inserted']} inserted, {report['skipped']} already present, "
+          f"{len(report['failed'])} failed in {report['elapsed']:.2f}s")
+    return report
+
+def delete_note(id, profile_id=None):
     """Delete a note from the vector database"""
     result = notes_collection.delete_one({"_id": id})
+    notes_changed(profile_id)
+    unindex_note(id, profile_id)
     print(f"[RAG] Note deleted from vector DB")
     return result
 
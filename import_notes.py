@@ -0,0 +1,84 @@
+"""
+Bulk-import financial notes for a profile from a JSONL or CSV file
+
+    python import_notes.py --profile-id 1 journal.jsonl
+    python import_notes.py --profile-id 1 notes.csv --concurrency 8
+
+JSONL: one note per line, either a JSON string or an object with "text"
+and optional "date" (ISO 8601). CSV: a header row with a "text" column
+(otherwise the first column is used) and an optional "date" column.
+
+Interrupted imports resume from a checkpoint file next to the input
+(<file>.checkpoint.json); pass --restart to ignore it. Restarting is
+also how failed rows are retried: rows already imported are skipped.
+"""
+from typing import Iterator
+import argparse
+import csv
+import json
+import os
+import sys
+
+
+def read_jsonl(path: str) -> Iterator:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_csv(path: str) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        text_column = "text" if "text" in (reader.fieldnames or []) else reader.fieldnames[0]
+        for record in reader:
+            item = {"text": record.get(text_column, "")}
+            if record.get("date"):
+                item["date"] = record["date"]
+            yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import financial notes")
+    parser.add_argument("path", help="JSONL or CSV file")
+    parser.add_argument("--profile-id", type=int, required=True)
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    rows = read_csv(args.path) if fmt == "csv" else read_jsonl(args.path)
+    checkpoint_path = f"{args.path}.checkpoint.json"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    from form_submit import add_notes_bulk
+
+    report = add_notes_bulk(
+        args.profile_id,
+        rows,
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        source=os.path.basename(args.path),
+        checkpoint_path=checkpoint_path,
+    )
+
+    print(f"Rows read:      {report['rows']} (resumed from row {report['resumed_from']})")
+    print(f"Inserted:       {report['inserted']}")
+    print(f"Already there:  {report['skipped']}")
+    print(f"Failed:         {len(report['failed'])}")
+    for failure in report["failed"][:20]:
+        print(f"  row {failure['row']}: {failure['error']}")
+    print(f"Throughput:     {report['rows_per_sec']:.0f} rows/s")
+
+    if report["failed"]:
+        sys.exit(1)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+if __name__ == "__main__":
+    main()
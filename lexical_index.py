@@ -0,0 +1,180 @@
+"""
+Local BM25 keyword index over financial notes
+
+Keeps an inverted index (term -> note -> term frequency) per user, built
+lazily from the note store on the user's first search and updated
+incrementally as notes are added and deleted. Used two ways:
+
+- hybrid retrieval: BM25 hits are fused with vector hits by reciprocal
+  rank fusion (rrf_fuse)
+- fallback: when vector search is unavailable, retrieval degrades to
+  BM25 instead of returning nothing
+
+Pure Python, no extra dependencies.
+"""
+from collections import Counter
+from typing import Callable, Dict, List
+import math
+import re
+import threading
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about am an and are as at be been but by can could do does for from had has
+have how i if in into is it its me my of on or our should so than that the their
+them then there these they this to was we were what when where which who why
+will with would you your
+""".split())
+
+
+def _stem(token: str) -> str:
+    """Light plural folding: emergencies -> emergency, loans -> loan"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    """Index/query terms: lowercased words, stopwords dropped, plurals folded"""
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class UserLexicalIndex:
+    """Inverted index and BM25 scoring for one user's notes"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.docs: Dict[str, dict] = {}
+        self.total_length = 0
+
+    def add(self, note_id: str, text: str, doc: dict):
+        if note_id in self.docs:
+            self.remove(note_id)
+        terms = Counter(analyze(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[note_id] = tf
+        length = sum(terms.values())
+        self.lengths[note_id] = length
+        self.total_length += length
+        self.docs[note_id] = doc
+
+    def remove(self, note_id: str) -> bool:
+        doc = self.docs.pop(note_id, None)
+        if doc is None:
+            return False
+        for term in set(analyze(doc.get("text", ""))):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(note_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(note_id)
+        return True
+
+    def search(self, query: str, k: int) -> List[tuple]:
+        """Top-k (note_id, bm25 score), best first"""
+        n = len(self.docs)
+        if n == 0:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(analyze(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for note_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[note_id] / avg_length)
+                scores[note_id] = scores.get(note_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class LexicalIndex:
+    """
+    Per-user BM25 indexes.
+
+    loader(user_id) returns that user's notes (dicts with _id and text).
+    """
+
+    def __init__(self, loader: Callable[[int], List[dict]]):
+        self.loader = loader
+        self._users: Dict[int, UserLexicalIndex] = {}
+        self._owner: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def _user(self, user_id) -> UserLexicalIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = UserLexicalIndex()
+                for note in self.loader(user_id):
+                    self._add(user_id, index, note)
+                self._users[user_id] = index
+            return index
+
+    def _add(self, user_id, index: UserLexicalIndex, note: dict):
+        if not note.get("text"):
+            return
+        note_id = str(note["_id"])
+        index.add(note_id, note["text"], {
+            "_id": note_id, "text": note["text"], "metadata": note.get("metadata", {}),
+        })
+        self._owner[note_id] = user_id
+
+    def add(self, user_id, notes: List[dict]):
+        with self._lock:
+            if user_id not in self._users:
+                return  # not built yet: the first search reads these from the store
+            index = self._users[user_id]
+            for note in notes:
+                self._add(user_id, index, note)
+
+    def remove(self, note_id) -> bool:
+        note_id = str(note_id)
+        with self._lock:
+            user_id = self._owner.pop(note_id, None)
+            if user_id is None:
+                return False
+            return self._users[user_id].remove(note_id)
+
+    def search(self, user_id, query: str, k: int = 5) -> List[dict]:
+        """
+        Top-k notes as documents with a $bm25 score and $bm25_rel, the
+        score relative to the best hit (1.0 for the top note). BM25 scores
+        are not cosine similarities, so no $similarity is set.
+        """
+        with self._lock:
+            index = self._user(user_id)
+            hits = index.search(query, k)
+            if not hits:
+                return []
+            top = hits[0][1]
+            return [
+                {**index.docs[note_id], "$bm25": score, "$bm25_rel": score / top}
+                for note_id, score in hits
+            ]
+
+
+def rrf_fuse(result_lists: List[List[dict]], limit: int, k: int = 60) -> List[dict]:
+    """
+    Reciprocal rank fusion: each list contributes 1 / (k + rank) per note.
+    Ranks, not raw scores, are combined, so BM25 and cosine scales never
+    need calibrating against each other. Earlier lists win field conflicts;
+    only vector results carry a $similarity, keyword-only hits have none.
+    """
+    fused: Dict[str, dict] = {}
+    scores: Dict[str, float] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            note_id = str(doc.get("_id"))
+            fused[note_id] = {**doc, **fused.get(note_id, {})}
+            scores[note_id] = scores.get(note_id, 0.0) + 1.0 / (k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**fused[note_id], "$rrf": scores[note_id]} for note_id in ranked]
@@ -0,0 +1,260 @@
+"""
+Process-wide scheduler for LLM requests
+
+Every session thread used to call the Groq client directly, so bursts of
+users went straight past Groq's requests-per-minute and tokens-per-minute
+limits and came back as 429s. Requests now take a slot from one
+LLMScheduler first:
+
+- token buckets for requests and (estimated) tokens per minute, refilled
+  continuously; the token bucket is corrected with the real usage once a
+  response arrives
+- priority classes: interactive advice is granted ahead of budget
+  generation, which is granted ahead of batch jobs
+- fair queuing within a class: users take turns, so one user's burst
+  cannot starve everyone else
+- a cap on requests in flight
+- throttle(seconds) pauses all grants after a 429 (Retry-After)
+
+Queue depth, wait times and grant counts are available from metrics().
+"""
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+import asyncio
+import itertools
+import threading
+import time
+
+
+PRIORITIES = ("interactive", "standard", "batch")
+
+
+class SchedulerTimeoutError(TimeoutError):
+    """A request waited longer than the scheduler's queue timeout"""
+
+
+class TokenBucket:
+    """`rate` units per minute, bursting up to `capacity` (0 = unlimited)"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.rate
+
+    def take(self, amount: float, now: float):
+        if self.rate:
+            self._refill(now)
+            self.level -= amount
+
+    def refund(self, amount: float):
+        """Give back (or, if negative, charge) the difference from an estimate"""
+        if self.rate:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class Slot:
+    """A granted request; report real token usage with used()"""
+
+    def __init__(self, scheduler: "LLMScheduler", user_id, priority: str, tokens: int, waited: float):
+        self._scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.tokens = tokens
+        self.waited = waited
+
+    def used(self, tokens: Optional[int]):
+        if tokens is not None:
+            self._scheduler._correct(tokens - self.tokens)
+            self.tokens = tokens
+
+
+class LLMScheduler:
+    """Rate-limited, prioritised, per-user fair admission for LLM requests"""
+
+    def __init__(self, requests_per_minute: float = 30, tokens_per_minute: float = 12000,
+                 max_in_flight: int = 8, queue_timeout: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+
+        # priority -> user -> waiting tickets; a user's position in the
+        # OrderedDict is their turn, and they move to the back when served
+        self._queues: Dict[str, "OrderedDict[object, deque]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+        self.granted = {p: 0 for p in PRIORITIES}
+        self.timed_out = 0
+        self.rate_limited = 0
+        self.throttled = 0
+        self._waits: deque = deque(maxlen=1000)
+
+    # --- queueing ----------------------------------------------------------
+
+    def _enqueue(self, user_id, priority: str) -> int:
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+        ticket = next(self._tickets)
+        self._queues[priority].setdefault(user_id, deque()).append(ticket)
+        return ticket
+
+    def _dequeue(self, user_id, priority: str, ticket: int):
+        users = self._queues[priority]
+        tickets = users.get(user_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del users[user_id]
+
+    def _head(self):
+        """(priority, user_id, ticket) of the request to serve next"""
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if users:
+                user_id, tickets = next(iter(users.items()))
+                return priority, user_id, tickets[0]
+        return None
+
+    def _try_grant(self, user_id, priority: str, ticket: int, tokens: int) -> float:
+        """Grant if this ticket is next and limits allow (lock held); returns 0 or seconds to wait"""
+        if self._head() != (priority, user_id, ticket):
+            return 1.0  # woken by notify when the head moves
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            return 1.0  # woken by notify when a request finishes
+        now = time.monotonic()
+        wait = max(self._paused_until - now,
+                   self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            self.rate_limited += 1
+            return wait
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self._in_flight += 1
+        self.granted[priority] += 1
+        # Served: this user goes to the back of their class
+        users = self._queues[priority]
+        users[user_id].popleft()
+        if users[user_id]:
+            users.move_to_end(user_id)
+        else:
+            del users[user_id]
+        self._changed.notify_all()
+        return 0.0
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._changed.notify_all()
+
+    def _correct(self, difference: int):
+        with self._lock:
+            self.tokens.refund(-difference)
+            self._changed.notify_all()
+
+    def _granted(self, user_id, priority: str, tokens: int, started: float) -> Slot:
+        waited = time.monotonic() - started
+        with self._lock:
+            self._waits.append(waited)
+        return Slot(self, user_id, priority, tokens, waited)
+
+    def _timed_out(self, user_id, priority: str, ticket: int):
+        self._dequeue(user_id, priority, ticket)
+        self.timed_out += 1
+        self._changed.notify_all()
+
+    # --- public API --------------------------------------------------------
+
+    @contextmanager
+    def slot(self, user_id=None, priority: str = "standard", tokens: int = 0):
+        """Block until this request may be sent; the slot is held for the with-block"""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._lock:
+            ticket = self._enqueue(user_id, priority)
+            while True:
+                wait = self._try_grant(user_id, priority, ticket, tokens)
+                if wait == 0:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timed_out(user_id, priority, ticket)
+                    raise SchedulerTimeoutError(f"LLM request queued for over {self.queue_timeout}s")
+                self._changed.wait(min(wait, remaining))
+        try:
+            yield self._granted(user_id, priority, tokens, started)
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, user_id=None, priority: str = "standard", tokens: int = 0):
+        """slot() for coroutines: waits with asyncio.sleep instead of blocking the loop"""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._lock:
+            ticket = self._enqueue(user_id, priority)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(user_id, priority, ticket, tokens)
+                    if wait == 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timed_out(user_id, priority, ticket)
+                        raise SchedulerTimeoutError(f"LLM request queued for over {self.queue_timeout}s")
+                # Condition variables can't wake a coroutine: poll briefly instead
+                await asyncio.sleep(min(wait, remaining, 0.05))
+        except asyncio.CancelledError:
+            with self._lock:
+                self._dequeue(user_id, priority, ticket)
+                self._changed.notify_all()
+            raise
+        try:
+            yield self._granted(user_id, priority, tokens, started)
+        finally:
+            self._release()
+
+    def throttle(self, seconds: float):
+        """Hold every grant for `seconds` (the provider returned 429 / Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            queued = {p: sum(len(t) for t in users.values()) for p, users in self._queues.items()}
+            waits: List[float] = sorted(self._waits)
+            return {
+                "queue_depth": sum(queued.values()),
+                "queued": queued,
+                "waiting_users": len({u for users in self._queues.values() for u in users}),
+                "in_flight": self._in_flight,
+                "granted": dict(self.granted),
+                "timed_out": self.timed_out,
+                "rate_limited": self.rate_limited,
+                "throttled": self.throttled,
+                "wait_ms_avg": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                "wait_ms_p95": 1000 * waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "wait_ms_max": 1000 * waits[-1] if waits else 0.0,
+            }
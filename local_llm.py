@@ -0,0 +1,159 @@
+"""
+Local stand-in for the Groq chat completions API
+
+Mimics `client.chat.completions.create(...)` (sync and async) with a fixed
+latency, an optional slow tail (tail_rate of calls take tail_latency
+instead) and an optional injected failure rate, so the app, benchmarks and
+resilience drills run without network access or API keys. Enable it with
+LLM_BACKEND=local.
+
+Budget prompts get a JSON allocation that sums to the stated income;
+yes/no routing prompts get "Yes" for calculation phrasing; everything
+else gets a short canned answer. stream=True returns the reply
+as delta chunks, like Groq's streaming API, token_latency seconds apart.
+"""
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+import asyncio
+import json
+import random
+import re
+import time
+
+
+BUDGET_SPLIT = {
+    "housing": 0.30,
+    "food": 0.12,
+    "transportation": 0.12,
+    "savings": 0.20,
+    "entertainment": 0.08,
+    "miscellaneous": 0.18,
+}
+
+
+def _budget_reply(prompt: str) -> str:
+    match = re.search(r"monthly_income:\s*\$?([\d.]+)", prompt)
+    income = float(match.group(1)) if match else 5000.0
+    budget = {key: int(income * share) for key, share in BUDGET_SPLIT.items()}
+    budget["miscellaneous"] += int(income) - sum(budget.values())
+    return json.dumps(budget)
+
+
+def _advice_reply(prompt: str) -> str:
+    match = re.search(r"USER'S QUESTION:\s*(.+?)\n", prompt)
+    question = match.group(1).strip() if match else "your question"
+    return (
+        f"**Answer (local stand-in):** Regarding \"{question}\", keep an emergency fund of "
+        f"3-6 months of expenses, save at least 20% of income, and pay down high-interest debt first."
+    )
+
+
+def _routing_reply(prompt: str) -> str:
+    match = re.search(r"Here is the input:\s*(.+?)\n", prompt)
+    question = (match.group(1) if match else prompt).lower()
+    calculation = re.search(r"\d|how (?:long|much|many)|calculate|\bafford\b", question)
+    return "Yes" if calculation else "No"
+
+
+def _reply(messages: List[Dict]) -> str:
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    if "Return ONLY valid JSON" in prompt:
+        return _budget_reply(prompt)
+    if 'respond with either "Yes" or "No"' in prompt:
+        return _routing_reply(prompt)
+    return _advice_reply(prompt)
+
+
+def _pieces(content: str, rng: random.Random) -> List[str]:
+    """Split a reply into token-sized pieces of 3-8 characters"""
+    pieces, i = [], 0
+    while i < len(content):
+        size = rng.randint(3, 8)
+        pieces.append(content[i:i + size])
+        i += size
+    return pieces
+
+
+def _chunk(model: str, content: Optional[str], finish_reason: Optional[str] = None):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)],
+    )
+
+
+def _completion(model: str, content: str):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content),
+                                 finish_reason="stop")],
+        usage=SimpleNamespace(completion_tokens=len(content) // 4),
+    )
+
+
+class _Completions:
+    def __init__(self, owner: "LocalChatClient"):
+        self._owner = owner
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        self._owner._simulate()
+        if stream:
+            return self._stream(model, _reply(messages))
+        return _completion(model, _reply(messages))
+
+    def _stream(self, model: str, content: str):
+        for piece in _pieces(content, self._owner._random):
+            yield _chunk(model, piece)
+            time.sleep(self._owner.token_latency)
+        yield _chunk(model, None, "stop")
+
+
+class _AsyncCompletions:
+    def __init__(self, owner: "LocalChatClient"):
+        self._owner = owner
+
+    async def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        await asyncio.sleep(self._owner._delay())
+        self._owner._maybe_fail()
+        if stream:
+            return self._stream(model, _reply(messages))
+        return _completion(model, _reply(messages))
+
+    async def _stream(self, model: str, content: str):
+        for piece in _pieces(content, self._owner._random):
+            yield _chunk(model, piece)
+            await asyncio.sleep(self._owner.token_latency)
+        yield _chunk(model, None, "stop")
+
+
+class LocalChatClient:
+    """Drop-in for groq.Groq / groq.AsyncGroq in tests, benchmarks and offline runs"""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None,
+                 token_latency: float = 0.0, tail_rate: float = 0.0, tail_latency: float = 0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.async_chat = SimpleNamespace(completions=_AsyncCompletions(self))
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise ConnectionError("Injected fault in local LLM stand-in")
+
+    def _delay(self) -> float:
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            return self.tail_latency
+        return self.latency
+
+    def _simulate(self):
+        time.sleep(self._delay())
+        self._maybe_fail()
+
+    def as_async(self):
+        """An object shaped like AsyncGroq sharing this client's settings"""
+        return SimpleNamespace(chat=self.async_chat)
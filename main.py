@@ -1,9 +1,12 @@
+import asyncio
 import streamlit as st
-from ai import ask_ai_with_rag, get_budget
+from ai import ask_ai_with_rag, ask_ai_with_rag_stream, RAG_STREAMING
 # 'get_notes' is correctly imported from profiles
-from profiles import create_profile, get_notes, get_profile 
+from profiles import create_profile, get_notes_page, load_session 
 # 'update_personal_info' is correctly imported from form_submit
 from form_submit import update_personal_info, add_note, delete_note
+from monte_carlo import cached_goal_probabilities
+from speculative import budget_for, speculate_profile
 
 # Helper functions for safe data type conversion
 def safe_int(value, default=5000):
@@ -86,6 +89,7 @@ def personal_data_form():
                         debt_amount=debt_amount,
                         dependents=dependents,
                     )
+                    speculate_profile(st.session_state.profile_id, st.session_state.profile)
                     st.success("Information saved.")
             else:
                 st.warning("Please fill in all required fields!")
@@ -108,18 +112,33 @@ def goals_form():
                     st.session_state.profile = update_personal_info(
                         profile, "goals", goals=goals
                     )
+                    speculate_profile(st.session_state.profile_id, st.session_state.profile)
                     st.success("Goals updated")
             else:
                 st.warning("Please select at least one goal.")
 
+    # Chance of reaching each goal, simulated once per profile version
+    outlook = cached_goal_probabilities(st.session_state.profile_id, st.session_state.profile)
+    if outlook:
+        st.markdown("#### 🎯 Goal Outlook")
+        for column, (goal, result) in zip(st.columns(len(outlook)), outlook.items()):
+            column.metric(
+                goal,
+                "{:.0%}".format(result["probability"]),
+                help="Chance of ${:,.0f} (today's dollars) within {:g} years across {:,} simulated markets. "
+                     "Median outcome ${:,.0f}, range ${:,.0f} - ${:,.0f}.".format(
+                         result["target"], result["years"], result["paths"],
+                         result["median"], result["p10"], result["p90"]),
+            )
+
 @st.fragment()
 def budget_allocation():
     profile = st.session_state.profile
     budget_container = st.container(border=True)
     budget_container.header("Budget Allocation")
     if budget_container.button("Generate with AI"):
-        # Pass the 'general' profile data to get_budget, which includes the correct income
-        result = get_budget(profile.get("general"), profile.get("goals"))
+        # The budget started in the background when the profile loaded (or get_budget now)
+        result = budget_for(st.session_state.profile_id, profile)
         profile["budget"] = result
         # Also update the 'budget' section in the database
         st.session_state.profile = update_personal_info(
@@ -189,24 +208,45 @@ def budget_allocation():
                 )
                 st.success("Budget saved")
 
+def load_notes_page(cursor=None, page=None):
+    """Load one page of notes into the session (cursor None = newest page)"""
+    notes, next_cursor = page or get_notes_page(st.session_state.profile_id, cursor)
+    st.session_state.notes = notes
+    st.session_state.notes_cursor = cursor
+    st.session_state.notes_next_cursor = next_cursor
+
 @st.fragment()
 def notes():
     st.subheader("Financial Notes (For RAG):")
-    for i, note in enumerate(st.session_state.notes):
+    for note in st.session_state.notes:
         cols = st.columns([5, 1])
         with cols[0]:
             st.text(note.get("text"))
         with cols[1]:
-            if st.button("Delete", key=i):
-                delete_note(note.get("_id"))
-                st.session_state.notes.pop(i)
+            if st.button("Delete", key=f"delete_{note.get('_id')}"):
+                delete_note(note.get("_id"), st.session_state.profile_id)
+                load_notes_page(st.session_state.notes_cursor)
                 st.rerun()
+
+    # Page-at-a-time navigation: the cursors of earlier pages are kept so "Newer" can go back
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if st.session_state.notes_page_stack and st.button("← Newer notes"):
+            load_notes_page(st.session_state.notes_page_stack.pop())
+            st.rerun()
+    with next_col:
+        if st.session_state.notes_next_cursor and st.button("Older notes →"):
+            st.session_state.notes_page_stack.append(st.session_state.notes_cursor)
+            load_notes_page(st.session_state.notes_next_cursor)
+            st.rerun()
     
     new_note = st.text_input("Add a financial note (e.g., 'I tend to overspend on credit cards'):")
     if st.button("Add Note"):
         if new_note:
-            note = add_note(new_note, st.session_state.profile_id)
-            st.session_state.notes.append(note)
+            add_note(new_note, st.session_state.profile_id)
+            # Newest notes come first: jump back to the first page
+            st.session_state.notes_page_stack = []
+            load_notes_page()
             st.rerun()
 
 # @st.fragment()
@@ -405,8 +445,9 @@ def ask_ai_func():
             st.warning("Please enter a question first!")
         else:
             with st.spinner("🔄 Running RAG Pipeline..."):
-                # Call the complete RAG system
-                rag_result = ask_ai_with_rag(
+                # Call the complete RAG system (streamed answers are generated while displayed)
+                rag = ask_ai_with_rag_stream if RAG_STREAMING else ask_ai_with_rag
+                rag_result = rag(
                     st.session_state.profile, 
                     user_question,
                     st.session_state.profile_id
@@ -414,7 +455,8 @@ def ask_ai_func():
                 
                 # Check the retrieval method and warn user if RAG is not working
                 method = rag_result["rag_pipeline"]["retrieval"]["method"]
-                if method != "vector_search":
+                # "skipped": answered by a calculator, no retrieval needed
+                if method not in ("vector_search", "hybrid", "skipped"):
                     st.warning(
                         f"⚠️ **Vector Search Not Active!** The app is using a '{method}' fallback. "
                         "AI answers will only be based on your profile and simple keyword matches, "
@@ -425,29 +467,9 @@ def ask_ai_func():
                 # Display RAG Pipeline Visualization
                 st.markdown("---")
                 st.markdown("### 🔄 RAG Pipeline Execution")
-                
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.metric(
-                        "📥 Retrieved Docs", 
-                        rag_result["rag_pipeline"]["retrieval"]["num_documents"],
-                        help="Number of relevant notes found in vector DB"
-                    )
-                
-                with col2:
-                    st.metric(
-                        "🔗 Context Added", 
-                        "Yes" if rag_result["rag_pipeline"]["augmentation"]["has_context"] else "No",
-                        help="Whether retrieved context was added to prompt"
-                    )
-                
-                with col3:
-                    st.metric(
-                        "🤖 Model Used", 
-                        "Llama 3.3 70B",
-                        help="LLM used for generation"
-                    )
+                # Filled in once the answer is complete: a streamed answer's
+                # generation details (model, tier, latency) only exist by then
+                pipeline_metrics = st.container()
                 
                 # Show Retrieved Documents (RAG Transparency)
                 if rag_result["rag_pipeline"]["retrieval"]["num_documents"] > 0:
@@ -455,8 +477,11 @@ def ask_ai_func():
                         st.markdown("**These notes were retrieved from the vector database based on semantic similarity:**")
                         
                         for i, doc in enumerate(rag_result["rag_pipeline"]["retrieval"]["documents"], 1):
-                            similarity = doc.get("similarity_score", 0)
+                            similarity = doc.get("similarity_score")
                             text = doc.get("text", "")
+                            # Keyword-only matches have no similarity score
+                            score_label = f"Similarity: {similarity:.2%}" if similarity is not None else "Keyword match"
+                            similarity = similarity or 0
                             
                             # Color code based on relevance
                             if similarity > 0.8:
@@ -474,7 +499,7 @@ def ask_ai_func():
                                     margin: 10px 0;
                                     background-color: #f9f9f9;
                                 ">
-                                    <strong>Note {i}</strong> (Similarity: {similarity:.2%})<br>
+                                    <strong>Note {i}</strong> ({score_label})<br>
                                     {text}
                                 </div>
                                 """,
@@ -490,8 +515,43 @@ def ask_ai_func():
                 # --- FIX: Use Streamlit container for clean formatting ---
                 with st.container(border=True):
                     # Simply pass the raw response for perfect Markdown rendering
-                    st.markdown(rag_result["response"]) 
+                    if "stream" in rag_result:
+                        st.write_stream(rag_result["stream"])
+                    else:
+                        st.markdown(rag_result["response"]) 
                 # --- END FIX ---
+
+                with pipeline_metrics:
+                    col1, col2, col3 = st.columns(3)
+                
+                    with col1:
+                        st.metric(
+                            "📥 Retrieved Docs", 
+                            rag_result["rag_pipeline"]["retrieval"]["num_documents"],
+                            help="Number of relevant notes found in vector DB"
+                        )
+                
+                    with col2:
+                        st.metric(
+                            "🔗 Context Added", 
+                            "Yes" if rag_result["rag_pipeline"]["augmentation"]["has_context"] else "No",
+                            help="Whether retrieved context was added to prompt "
+                                 f"({rag_result['rag_pipeline']['augmentation'].get('tokens_saved', 0)} tokens saved by context packing)"
+                        )
+                
+                    with col3:
+                        routing = rag_result["rag_pipeline"].get("routing", {})
+                        generation = rag_result["rag_pipeline"]["generation"]
+                        st.metric(
+                            "🤖 Model Used", 
+                            "Calculator" if routing.get("route") == "calculator" else generation.get("model"),
+                            help="LLM used for generation, or the calculator the question was routed to "
+                                 f"(router confidence {routing.get('confidence') or 0:.0%}"
+                                 + (f", {generation['tier']} tier" if generation.get("tier") else "")
+                                 + (", hedged" if generation.get("hedged") else "")
+                                 + (f", {generation['latency_ms']:.0f} ms" if generation.get("latency_ms") else "")
+                                 + ")"
+                        )
                 
                 
                 # Show full RAG pipeline details (for debugging/transparency)
@@ -532,18 +592,23 @@ def ask_ai_func():
                     st.table(budget_df_data)
 
 def forms():
+    first_notes_page = None
     if "profile" not in st.session_state:
         # --- NO CHANGE HERE: Still fine for a demo ---
         profile_id = 1 
-        profile = get_profile(profile_id)
+        # Profile and first notes page load concurrently
+        profile, first_notes_page = asyncio.run(load_session(profile_id))
         if not profile:
             profile_id, profile = create_profile(profile_id)
 
         st.session_state.profile = profile
         st.session_state.profile_id = profile_id
+        # Start the budget suggestion and profile summary before they're asked for
+        speculate_profile(profile_id, profile)
 
     if "notes" not in st.session_state:
-        st.session_state.notes = get_notes(st.session_state.profile_id)
+        st.session_state.notes_page_stack = []
+        load_notes_page(page=first_notes_page)
 
     personal_data_form()
     goals_form()
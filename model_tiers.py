@@ -0,0 +1,112 @@
+"""
+Model tiers per LLM task, and the latency record behind hedged requests
+
+Each task (advice, budget JSON, routing) uses the model of a tier with its
+own output limit: the budget JSON and yes/no routing checks don't need
+the large model. Tiers, and each task's tier and max_tokens, come from
+the environment:
+
+    LLM_MODEL_LARGE / LLM_MODEL_SMALL           models behind the tiers
+    LLM_<TASK>_TIER / LLM_<TASK>_MAX_TOKENS     per task (ADVICE, BUDGET, ROUTING)
+    LLM_ADVICE_HEDGE_TIER                       backup tier for hedged advice
+
+With LLM_HEDGE=1, a task with a hedge tier fires a backup request to it
+when the primary has been running longer than the LLM_HEDGE_PERCENTILE
+latency recently seen for the primary (LLM_HEDGE_DELAY_MS until enough
+requests have been seen); the first to finish wins.
+"""
+from collections import deque
+from typing import Dict, Optional
+import os
+import threading
+
+
+MODEL_TIERS = {
+    "large": os.getenv("LLM_MODEL_LARGE", "llama-3.3-70b-versatile"),
+    "small": os.getenv("LLM_MODEL_SMALL", "llama-3.1-8b-instant"),
+}
+
+
+def _policy(task: str, tier: str, max_tokens: int, temperature: float, hedge_tier: str = "") -> Dict:
+    prefix = f"LLM_{task.upper()}"
+    policy = {
+        "tier": os.getenv(f"{prefix}_TIER", tier),
+        "max_tokens": int(os.getenv(f"{prefix}_MAX_TOKENS", str(max_tokens))),
+        "temperature": temperature,
+        "hedge_tier": os.getenv(f"{prefix}_HEDGE_TIER", hedge_tier) or None,
+    }
+    for key in ("tier", "hedge_tier"):
+        if policy[key] is not None and policy[key] not in MODEL_TIERS:
+            raise ValueError(f"{prefix}: unknown tier {policy[key]!r}, expected one of {tuple(MODEL_TIERS)}")
+    return policy
+
+
+TASKS = {
+    "advice": _policy("advice", "large", 800, 0.2, hedge_tier="small"),
+    "budget": _policy("budget", "small", 200, 0.2),
+    "routing": _policy("routing", "small", 3, 0.0),
+}
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "3000"))
+# Latencies needed before the percentile replaces LLM_HEDGE_DELAY_MS
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+
+def model_for(task: str, tier: Optional[str] = None) -> str:
+    return MODEL_TIERS[tier or TASKS[task]["tier"]]
+
+
+def request_options(task: str, tier: Optional[str] = None) -> Dict:
+    """model, max_tokens and temperature for a chat completion of `task`"""
+    policy = TASKS[task]
+    return {
+        "model": model_for(task, tier),
+        "max_tokens": policy["max_tokens"],
+        "temperature": policy["temperature"],
+    }
+
+
+class LatencyTracker:
+    """Recent successful request latencies (seconds) per (label, tier)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, label: str, tier: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault((label, tier), deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, label: str, tier: str, percentile: float,
+                   min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get((label, tier), ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            entries = {key: sorted(samples) for key, samples in self._samples.items()}
+        return {
+            f"{label}:{tier}": {
+                "count": len(samples),
+                "p50_ms": 1000 * samples[len(samples) // 2],
+                "p95_ms": 1000 * samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+            }
+            for (label, tier), samples in entries.items() if samples
+        }
+
+
+latencies = LatencyTracker()
+
+
+def hedge_delay(task: str, label: Optional[str] = None) -> Optional[float]:
+    """Seconds to wait for the primary before the backup fires, or None if not hedged"""
+    if not LLM_HEDGE or not TASKS[task]["hedge_tier"]:
+        return None
+    observed = latencies.percentile(label or task, TASKS[task]["tier"], LLM_HEDGE_PERCENTILE)
+    return observed if observed is not None else LLM_HEDGE_DELAY_MS / 1000
@@ -0,0 +1,193 @@
+"""
+Monte Carlo estimates of reaching the profile's financial goals
+
+For each simulated goal the profile picked ("Save for Retirement", "Buy a
+Home", "Build Emergency Fund"), current savings (general.current_savings)
+plus the monthly savings in the budget (budget.savings) are grown month by
+month along tens of thousands of random return and inflation paths, all
+paths at once as NumPy arrays. The probability of the goal is the share of
+paths whose inflation-adjusted balance reaches the goal's target by its
+horizon. Each goal is simulated as if it received all of the monthly
+savings.
+
+Targets and horizons:
+
+- retirement: 25 years of expenses (the 4% rule) by RETIREMENT_AGE
+- home: a down payment of DOWN_PAYMENT of a home costing
+  HOME_PRICE_TO_INCOME years of income, in HOME_YEARS years
+- emergency fund: EMERGENCY_FUND_MONTHS of expenses within a year
+
+Runs of MONTE_CARLO_PARALLEL_PATHS paths or more are split across a
+process pool of MONTE_CARLO_WORKERS workers. Results are cached per
+profile version, so the dashboard recomputes only after the profile
+changes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+from cache import LRUTTLCache
+
+
+MONTE_CARLO_PATHS = int(os.getenv("MONTE_CARLO_PATHS", "20000"))
+MONTE_CARLO_SEED = int(os.getenv("MONTE_CARLO_SEED", "0"))
+# 0 = always simulate in this process
+MONTE_CARLO_WORKERS = int(os.getenv("MONTE_CARLO_WORKERS", str(min(os.cpu_count() or 1, 4))))
+MONTE_CARLO_PARALLEL_PATHS = int(os.getenv("MONTE_CARLO_PARALLEL_PATHS", "200000"))
+MONTE_CARLO_CACHE_SIZE = int(os.getenv("MONTE_CARLO_CACHE_SIZE", "1024"))
+
+INFLATION = 0.025
+INFLATION_VOLATILITY = 0.01
+RETIREMENT_AGE = 65
+HOME_PRICE_TO_INCOME = 4.0     # home price in years of income
+DOWN_PAYMENT = 0.20
+HOME_YEARS = 5
+EMERGENCY_FUND_MONTHS = 6
+
+# Annual expected return and volatility of the money set aside for each goal
+GOAL_ASSUMPTIONS = {
+    "Save for Retirement": {"return": 0.07, "volatility": 0.15},
+    "Buy a Home": {"return": 0.04, "volatility": 0.06},
+    "Build Emergency Fund": {"return": 0.02, "volatility": 0.0},
+}
+SIMULATED_GOALS = tuple(GOAL_ASSUMPTIONS)
+
+results_cache = LRUTTLCache(maxsize=MONTE_CARLO_CACHE_SIZE, ttl=None)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def simulate_balances(current, monthly, years: float, annual_return: float, volatility: float,
+                      paths: int, seed=None) -> np.ndarray:
+    """
+    Inflation-adjusted balance at `years` on each of `paths` random paths.
+
+    Monthly log returns and inflation are normal, drawn a year at a time;
+    contributions keep pace with inflation, so `current`, `monthly` and the result are all in
+    today's dollars. `current` and `monthly` may be arrays of length
+    `paths` (one scenario per path).
+    """
+    rng = np.random.default_rng(seed)
+    months = max(int(round(years * 12)), 1)
+    balance = np.broadcast_to(np.asarray(current, dtype=float), (paths,)).copy()
+    monthly = np.broadcast_to(np.asarray(monthly, dtype=float), (paths,))
+    # Monthly real log growth: return and inflation shocks are independent
+    # normals, so their difference is one normal
+    mean = np.log1p(annual_return) / 12 - volatility ** 2 / 24 - np.log1p(INFLATION) / 12
+    spread = np.hypot(volatility, INFLATION_VOLATILITY) / np.sqrt(12)
+    # Step a year at a time: with the year's growth g spread evenly over its
+    # months (q = g ** (1 / n) a month), the contributions made during the
+    # year are worth monthly * (1 + q + ... + q ** (n - 1)) at its end
+    for step in range(0, months, 12):
+        n = min(12, months - step)
+        log_growth = rng.normal(n * mean, np.sqrt(n) * spread, paths)
+        growth = np.exp(log_growth)
+        per_month = np.expm1(log_growth / n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            annuity = np.where(np.abs(per_month) > 1e-12, np.expm1(log_growth) / per_month, n)
+        balance *= growth
+        balance += monthly * annuity
+    return balance
+
+
+def _simulate_chunk(args) -> np.ndarray:
+    current, monthly, years, annual_return, volatility, paths, seed = args
+    return simulate_balances(current, monthly, years, annual_return, volatility, paths, seed)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process with the app's background threads is unsafe
+            _pool = ProcessPoolExecutor(max_workers=MONTE_CARLO_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def simulate(current: float, monthly: float, years: float, annual_return: float, volatility: float,
+             paths: int = MONTE_CARLO_PATHS, seed: Optional[int] = MONTE_CARLO_SEED,
+             workers: Optional[int] = None) -> np.ndarray:
+    """simulate_balances(), split across the process pool for large runs"""
+    workers = MONTE_CARLO_WORKERS if workers is None else workers
+    if workers <= 1 or paths < MONTE_CARLO_PARALLEL_PATHS:
+        return simulate_balances(current, monthly, years, annual_return, volatility, paths, seed)
+    # Independent streams per chunk, reproducible from the one seed
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(paths), workers)]
+    chunks = [(current, monthly, years, annual_return, volatility, size, s) for size, s in zip(sizes, seeds)]
+    return np.concatenate(list(_get_pool().map(_simulate_chunk, chunks)))
+
+
+def goal_targets(profile: dict) -> Dict[str, Dict[str, float]]:
+    """{goal: {"target", "years"}} for the simulated goals the profile picked"""
+    general = profile.get("general") or {}
+    budget = profile.get("budget") or {}
+    income = float(general.get("monthly_income") or 0)
+    expenses = max(income - float(budget.get("savings") or 0), 0.0)
+    age = float(general.get("age") or 30)
+
+    targets = {}
+    for goal in profile.get("goals") or []:
+        if goal == "Save for Retirement" and age < RETIREMENT_AGE:
+            targets[goal] = {"target": 25 * 12 * expenses, "years": RETIREMENT_AGE - age}
+        elif goal == "Buy a Home":
+            targets[goal] = {"target": DOWN_PAYMENT * HOME_PRICE_TO_INCOME * 12 * income, "years": HOME_YEARS}
+        elif goal == "Build Emergency Fund":
+            targets[goal] = {"target": EMERGENCY_FUND_MONTHS * expenses, "years": 1}
+    return targets
+
+
+def _summary(balances: np.ndarray, target: float, years: float) -> Dict:
+    p10, median, p90 = np.percentile(balances, [10, 50, 90])
+    return {
+        "probability": float((balances >= target).mean()),
+        "target": target,
+        "years": years,
+        "p10": float(p10),
+        "median": float(median),
+        "p90": float(p90),
+        "paths": len(balances),
+    }
+
+
+def goal_probabilities(profile: dict, paths: int = MONTE_CARLO_PATHS,
+                       workers: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    {goal: {"probability", "target", "years", "p10", "median", "p90", "paths"}}
+    for the profile's simulated goals; balances are in today's dollars
+    """
+    general = profile.get("general") or {}
+    current = float(general.get("current_savings") or 0)
+    monthly = float((profile.get("budget") or {}).get("savings") or 0)
+    results = {}
+    for goal, spec in goal_targets(profile).items():
+        assumptions = GOAL_ASSUMPTIONS[goal]
+        balances = simulate(current, monthly, spec["years"], assumptions["return"],
+                            assumptions["volatility"], paths, workers=workers)
+        results[goal] = _summary(balances, spec["target"], spec["years"])
+    return results
+
+
+def cached_goal_probabilities(profile_id, profile: dict, paths: int = MONTE_CARLO_PATHS) -> Dict[str, Dict]:
+    """goal_probabilities() computed once per profile version"""
+    from profiles import profile_version
+
+    # Read the version first: a save during the run leaves this entry stale
+    version = profile_version(profile_id)
+    results = results_cache.get((profile_id, paths), version=version)
+    if results is None:
+        start = time.perf_counter()
+        results = goal_probabilities(profile, paths)
+        print(f"[MONTE CARLO] {len(results)} goals x {paths} paths in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        results_cache.set((profile_id, paths), results, version=version)
+    return results
@@ -1,7 +1,86 @@
-from db import personal_data_collection, notes_collection
+from db import (
+    personal_data_collection,
+    notes_collection,
+    async_personal_data_collection,
+    async_notes_collection,
+)
+from cache import LRUTTLCache, QueryEmbeddingCache, VersionCounter
+from singleflight import SingleFlight
+from write_behind import WriteBehindQueue, apply_set
+import asyncio
+import copy
+import os
+import threading
 # 're' is no longer needed as the regex fallback is not supported
 # import re 
 
+# Shared across all sessions in this process, keyed by profile id
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+profile_cache = LRUTTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+profile_versions = VersionCounter()
+# Concurrent cache misses for the same profile share one store read
+profile_reads = SingleFlight("profile_reads")
+# Bumped whenever a user's notes change (None: a note of unknown owner)
+notes_versions = VersionCounter()
+
+# Profile saves are flushed to the store in the background (set WRITE_BEHIND=0 to write inline)
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "1") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+WRITE_BEHIND_JOURNAL = os.getenv("WRITE_BEHIND_JOURNAL", ".write_behind_journal.json")
+
+
+def _write_profile_fields(id, updates: dict):
+    personal_data_collection.update_one({"id": id}, {"$set": updates})
+
+
+profile_writes = WriteBehindQueue(
+    _write_profile_fields,
+    interval=WRITE_BEHIND_INTERVAL,
+    journal_path=WRITE_BEHIND_JOURNAL,
+)
+
+# Retrieval from an in-process NumPy index instead of a $vectorize query per
+# question (set LOCAL_VECTOR_INDEX=1; see vector_index.py)
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "0") == "1"
+LOCAL_VECTOR_EMBEDDER = os.getenv("LOCAL_VECTOR_EMBEDDER", "hashing")
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float16")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "")
+LOCAL_VECTOR_PERSIST_EVERY = int(os.getenv("LOCAL_VECTOR_PERSIST_EVERY", "64"))
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+# BM25 keyword hits fused with vector hits, and the fallback when vector
+# search fails (set HYBRID_RETRIEVAL=0 for vector search only)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+
+_lexical_index = None
+
+# Notes are inserted without waiting for their embedding and embedded in
+# batches in the background (set ASYNC_EMBEDDING=0 to embed during the
+# insert; see embedding_pipeline.py)
+ASYNC_EMBEDDING = os.getenv("ASYNC_EMBEDDING", "1") == "1"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+# Server-side ($vectorize) embedding requests in flight per batch
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+
+_embedding_pipeline = None
+_embedding_executor = None
+
+# Question embeddings, so a repeated question is never embedded twice
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+# Model behind the collection's $vectorize (see storage.AstraBackend)
+ASTRA_EMBEDDING_MODEL = "nvidia/NV-Embed-QA"
+
+query_embeddings = QueryEmbeddingCache(
+    maxsize=QUERY_EMBEDDING_CACHE_SIZE,
+    path=QUERY_EMBEDDING_CACHE_PATH or None,
+)
+
 def get_values(id):
     return {
         "id": id, 
@@ -29,48 +108,431 @@ def create_profile(id):
     # This function is the one main.py is trying to import
     profile_values = get_values(id)
     result = personal_data_collection.insert_one(profile_values)
+    cache_profile(profile_values)
     return id, profile_values
 
+def _cached_profile(id):
+    """(copy of the cached profile or None, version to tag a fresh read with)"""
+    version = profile_versions.get(id)
+    cached = profile_cache.get(id, version=version)
+    return (copy.deepcopy(cached) if cached is not None else None), version
+
+def _remember_profile(id, profile, version):
+    if profile is not None:
+        # Saves still queued for write-behind are part of the profile already
+        apply_set(profile, profile_writes.pending(id))
+        # Tagged with the version seen before the read: if a save lands
+        # meanwhile, this entry is already stale and will count as a miss.
+        profile_cache.set(id, copy.deepcopy(profile), version=version)
+    return profile
+
 def get_profile(id):
-    return personal_data_collection.find_one({"id": {"$eq": id}})
+    """Read-through cached profile lookup. Returns a copy safe to mutate."""
+    cached, version = _cached_profile(id)
+    if cached is not None:
+        return cached
+    # Keyed by version too: a read that began before a save can't serve readers after it
+    profile = profile_reads.do((id, version), personal_data_collection.find_one, {"id": {"$eq": id}})
+    return _remember_profile(id, profile, version)
+
+async def aget_profile(id):
+    """Async get_profile: same cache, non-blocking store read"""
+    cached, version = _cached_profile(id)
+    if cached is not None:
+        return cached
+    profile = await profile_reads.ado((id, version), async_personal_data_collection.find_one,
+                                      {"id": {"$eq": id}})
+    return _remember_profile(id, profile, version)
+
+def cache_profile(profile: dict) -> int:
+    """Record a profile write: bump its version and cache the new state"""
+    version = profile_versions.bump(profile["id"])
+    profile_cache.set(profile["id"], copy.deepcopy(profile), version=version)
+    return version
+
+def profile_version(id) -> int:
+    return profile_versions.get(id)
+
+def profile_cache_stats():
+    """Hit/miss/eviction counters for sizing PROFILE_CACHE_SIZE/TTL"""
+    return profile_cache.stats()
+
+def save_profile_fields(id, updates: dict):
+    """Persist changed dotted paths, through the write-behind queue when enabled"""
+    if not updates:
+        return
+    if WRITE_BEHIND:
+        profile_writes.submit(id, updates)
+    else:
+        _write_profile_fields(id, updates)
+
+# Only what the notes view renders: never ship embedding vectors to the app
+NOTE_DISPLAY_PROJECTION = {
+    "text": True,
+    "user_id": True,
+    "metadata.injested": True,
+    "metadata.note_type": True,
+}
+NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "20"))
+
+def notes_version(profile_id: int) -> int:
+    """Changes whenever a note is added or deleted for this user"""
+    return notes_versions.get(profile_id) + notes_versions.get(None)
+
+def notes_changed(profile_id: int = None):
+    notes_versions.bump(profile_id)
 
 def get_notes(profile_id: int):
     """Get all notes for a user (for display purposes, not RAG)"""
     try:
         # FIXED: Changed .sort("metadata.injested", -1) to .sort({"metadata.injested": -1})
-        return list(notes_collection.find({"user_id": profile_id}).sort({"metadata.injested": -1}))
+        return list(notes_collection.find(
+            {"user_id": profile_id}, projection=NOTE_DISPLAY_PROJECTION
+        ).sort({"metadata.injested": -1}))
     except Exception as e:
         print(f"Error fetching notes: {e}")
         return []
 
+def get_notes_page(profile_id: int, cursor: dict = None, page_size: int = NOTES_PAGE_SIZE):
+    """
+    One page of a user's notes, newest first
+
+    Returns (notes, next_cursor); next_cursor is None on the last page.
+    The cursor is the `metadata.injested` of the last note shown plus the
+    ids already shown at that timestamp, so pages stay stable while notes
+    are added and each page costs one indexed, limited query.
+    """
+    try:
+        notes = list(notes_collection.find(**_notes_page_query(profile_id, cursor, page_size)))
+    except Exception as e:
+        print(f"Error fetching notes: {e}")
+        return [], None
+    return _finish_notes_page(notes, cursor, page_size)
+
+async def aget_notes_page(profile_id: int, cursor: dict = None, page_size: int = NOTES_PAGE_SIZE):
+    """Async get_notes_page"""
+    try:
+        notes = [
+            note async for note in
+            async_notes_collection.find(**_notes_page_query(profile_id, cursor, page_size))
+        ]
+    except Exception as e:
+        print(f"Error fetching notes: {e}")
+        return [], None
+    return _finish_notes_page(notes, cursor, page_size)
+
+def _notes_page_query(profile_id: int, cursor: dict, page_size: int) -> dict:
+    filter = {"user_id": profile_id}
+    if cursor:
+        filter["metadata.injested"] = {"$lte": cursor["injested"]}
+        if cursor["seen_ids"]:
+            filter["_id"] = {"$nin": cursor["seen_ids"]}
+    return {
+        "filter": filter,
+        "projection": NOTE_DISPLAY_PROJECTION,
+        "sort": {"metadata.injested": -1},
+        "limit": page_size + 1,  # one extra to know whether another page exists
+    }
+
+def _finish_notes_page(notes: list, cursor: dict, page_size: int):
+    if len(notes) <= page_size:
+        return notes, None
+
+    notes = notes[:page_size]
+    last_injested = notes[-1].get("metadata", {}).get("injested")
+    seen_ids = [
+        note["_id"] for note in notes
+        if note.get("metadata", {}).get("injested") == last_injested
+    ]
+    if cursor and cursor["injested"] == last_injested:
+        seen_ids = cursor["seen_ids"] + seen_ids
+    return notes, {"injested": last_injested, "seen_ids": seen_ids}
+
+async def load_session(profile_id: int):
+    """
+    Session bootstrap: profile and first notes page are fetched concurrently,
+    so start-up latency is max(profile, notes) rather than their sum.
+
+    Returns (profile or None, (notes, next_cursor)).
+    """
+    return await asyncio.gather(
+        aget_profile(profile_id),
+        aget_notes_page(profile_id),
+    )
+
 def search_notes_semantic(query: str, profile_id: int, limit: int = 5):
     """
     RAG RETRIEVAL FUNCTION
     
-    Search financial notes using semantic similarity (vector search)
+    Search financial notes using semantic similarity (vector search), fused
+    with BM25 keyword matches. If vector search fails, keyword matches are
+    returned instead. Each hit's "$retrieval" names the method used.
     """
+    print(f"[RAG RETRIEVAL] Searching for: '{query}'")
+    try:
+        if LOCAL_VECTOR_INDEX:
+            print(f"[RAG RETRIEVAL] Method: Local vector index")
+            vector_results = _local_search(query, profile_id, limit)
+        else:
+            print(f"[RAG RETRIEVAL] Method: Vector semantic search")
+            vector_results = _vector_search(query, profile_id, limit)
+    except Exception as e:
+        print(f"[RAG RETRIEVAL] Error with vector search: {e}")
+        if not HYBRID_RETRIEVAL:
+            # Let the caller report the failure instead of passing it off as "no notes"
+            raise
+        print(f"[RAG RETRIEVAL] Falling back to keyword (BM25) search")
+        results = _tag_results(_lexical_search(query, profile_id, limit), "keyword_fallback")
+    else:
+        lexical_results = _try_lexical_search(query, profile_id, limit)
+        results = _fuse_results(vector_results, lexical_results, limit)
+    _log_search_results(results)
+    return results
+
+async def asearch_notes_semantic(query: str, profile_id: int, limit: int = 5):
+    """Async search_notes_semantic"""
+    print(f"[RAG RETRIEVAL] Searching for: '{query}' (async)")
+    lexical = asyncio.create_task(asyncio.to_thread(_try_lexical_search, query, profile_id, limit))
     try:
-        print(f"[RAG RETRIEVAL] Searching for: '{query}'")
-        print(f"[RAG RETRIEVAL] Method: Vector semantic search")
-        
-        # FIXED: Using sort={"$vectorize": query} for DataAPIClient
-        results = list(notes_collection.find(
-            filter={"user_id": profile_id},  # The filter for the user
-            sort={"$vectorize": query},      # The query string to vectorize and search for
-            limit=limit,
-            include_similarity=True         # Get similarity scores
-        ))
-        
-        print(f"[RAG RETRIEVAL] Found {len(results)} relevant documents")
-        
-        for i, doc in enumerate(results, 1):
-            score = doc.get("$similarity", 0)
-            text_preview = doc.get("text", "")[:50]
-            print(f"[RAG RETRIEVAL] Doc {i}: Similarity={score:.3f}, Text='{text_preview}...'")
-        
-        return results
-        
+        if LOCAL_VECTOR_INDEX:
+            vector_results = await asyncio.to_thread(_local_search, query, profile_id, limit)
+        else:
+            vector_results = await _avector_search(query, profile_id, limit)
     except Exception as e:
         print(f"[RAG RETRIEVAL] Error with vector search: {e}")
-        print(f"[RAG RETRIEVAL] Vector search failed. No fallback available for Data API.")
-        return []
\ No newline at end of file
+        lexical_results = await lexical
+        if lexical_results is None:
+            raise
+        print(f"[RAG RETRIEVAL] Falling back to keyword (BM25) search")
+        results = _tag_results(lexical_results[:limit], "keyword_fallback")
+    else:
+        results = _fuse_results(vector_results, await lexical, limit)
+    _log_search_results(results)
+    return results
+
+def get_lexical_index():
+    """The process-wide BM25 index, created on first use"""
+    global _lexical_index
+    with _local_index_lock:
+        if _lexical_index is None:
+            from lexical_index import LexicalIndex
+            _lexical_index = LexicalIndex(_load_index_notes)
+        return _lexical_index
+
+def _lexical_search(query: str, profile_id: int, limit: int):
+    return get_lexical_index().search(profile_id, query, k=limit)
+
+def _try_lexical_search(query: str, profile_id: int, limit: int):
+    """Keyword candidates for fusion (twice the limit; they cost no round trip), or None"""
+    if not HYBRID_RETRIEVAL:
+        return _pending_lexical_search(query, profile_id, limit)
+    try:
+        return _lexical_search(query, profile_id, limit * 2)
+    except Exception as e:
+        print(f"[RAG RETRIEVAL] Keyword search unavailable: {e}")
+        return None
+
+def _pending_lexical_search(query: str, profile_id: int, limit: int):
+    """Keyword matches among notes still waiting for their embedding, or None"""
+    pending = _embedding_pipeline.pending(profile_id) if _embedding_pipeline else []
+    if not pending:
+        return None
+    from lexical_index import LexicalIndex
+    return LexicalIndex(lambda _: pending).search(profile_id, query, k=limit)
+
+def _fuse_results(vector_results: list, lexical_results, limit: int):
+    if lexical_results is None:
+        return _tag_results(vector_results, "vector_search")
+    from lexical_index import rrf_fuse
+    return _tag_results(rrf_fuse([vector_results, lexical_results], limit), "hybrid")
+
+def _tag_results(results: list, method: str):
+    for doc in results:
+        doc["$retrieval"] = method
+    return results
+
+def _vector_search(query: str, profile_id: int, limit: int):
+    """
+    Data API vector search. On a cache miss the server embeds the question
+    ($vectorize) and returns the vector it used; on a hit that vector is
+    sent directly and no embedding is computed.
+    """
+    vector = query_embeddings.get(query, ASTRA_EMBEDDING_MODEL)
+    cursor = notes_collection.find(**_vector_search_query(query, profile_id, limit, vector))
+    results = list(cursor)
+    if vector is None:
+        _remember_query_vector(query, cursor.get_sort_vector())
+    return results
+
+async def _avector_search(query: str, profile_id: int, limit: int):
+    vector = query_embeddings.get(query, ASTRA_EMBEDDING_MODEL)
+    cursor = async_notes_collection.find(**_vector_search_query(query, profile_id, limit, vector))
+    results = await cursor.to_list()
+    if vector is None:
+        _remember_query_vector(query, await cursor.get_sort_vector())
+    return results
+
+def _remember_query_vector(query: str, vector):
+    if vector is not None:
+        query_embeddings.set(query, ASTRA_EMBEDDING_MODEL, list(vector))
+
+def _vector_search_query(query: str, profile_id: int, limit: int, vector=None) -> dict:
+    if vector is not None:
+        return {
+            "filter": {"user_id": profile_id},
+            "sort": {"$vector": vector},    # Cached embedding of the same question
+            "limit": limit,
+            "include_similarity": True,
+        }
+    # FIXED: Using sort={"$vectorize": query} for DataAPIClient
+    return {
+        "filter": {"user_id": profile_id},  # The filter for the user
+        "sort": {"$vectorize": query},      # The query string to vectorize and search for
+        "limit": limit,
+        "include_similarity": True,         # Get similarity scores
+        "include_sort_vector": True,        # Return the query vector for the cache
+    }
+
+def get_local_index():
+    """The process-wide local vector index, created on first use"""
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            from vector_index import LocalVectorIndex, create_embedder
+            _local_index = LocalVectorIndex(
+                create_embedder(LOCAL_VECTOR_EMBEDDER),
+                _load_index_notes,
+                dtype=LOCAL_VECTOR_DTYPE,
+                directory=LOCAL_VECTOR_DIR or None,
+                persist_every=LOCAL_VECTOR_PERSIST_EVERY,
+            )
+        return _local_index
+
+def _load_index_notes(profile_id: int):
+    """Everything a user's index needs, read once when it is first built"""
+    return list(notes_collection.find({"user_id": profile_id}, projection=NOTE_DISPLAY_PROJECTION))
+
+def _local_search(query: str, profile_id: int, limit: int):
+    index = get_local_index()
+    vector = query_embeddings.get(query, index.embedder.name)
+    if vector is None:
+        vector = index.embedder.embed([query])[0]
+        query_embeddings.set(query, index.embedder.name, vector)
+    results = index.search_vectors(profile_id, [vector], k=limit)[0]
+    for doc in results:
+        # Same 0..1 scale as the Data API's cosine $similarity
+        doc["$similarity"] = (1.0 + doc["$similarity"]) / 2.0
+    return results
+
+def prepare_note_embedding(note: dict) -> dict:
+    """
+    Set up embedding for a note about to be inserted: $vectorize during
+    the insert, or indexing_status "pending" for the background pipeline
+    """
+    note.setdefault("metadata", {})["indexing_status"] = "pending" if ASYNC_EMBEDDING else "embedded"
+    if not ASYNC_EMBEDDING:
+        note["$vectorize"] = note["text"]
+    return note
+
+def index_notes(profile_id: int, notes: list):
+    """Add newly stored notes to the local keyword index and queue their embedding"""
+    notes = [{k: v for k, v in note.items() if not k.startswith("$")} for note in notes]
+    if HYBRID_RETRIEVAL:
+        get_lexical_index().add(profile_id, notes)
+    if ASYNC_EMBEDDING:
+        get_embedding_pipeline().submit([note for note in notes if note.get("text")])
+    elif LOCAL_VECTOR_INDEX:
+        get_local_index().add(profile_id, notes)
+
+def unindex_note(note_id, profile_id: int = None):
+    """Drop a deleted note from the local search indexes"""
+    if _embedding_pipeline:
+        _embedding_pipeline.cancel(note_id)
+    if HYBRID_RETRIEVAL:
+        get_lexical_index().remove(note_id)
+    if LOCAL_VECTOR_INDEX:
+        get_local_index().remove(note_id, profile_id)
+
+def get_embedding_pipeline():
+    """The process-wide background embedding pipeline, created on first use"""
+    global _embedding_pipeline, _embedding_executor
+    with _local_index_lock:
+        if _embedding_pipeline is None:
+            from concurrent.futures import ThreadPoolExecutor
+            from embedding_pipeline import EmbeddingPipeline
+            _embedding_executor = ThreadPoolExecutor(
+                max_workers=EMBEDDING_CONCURRENCY, thread_name_prefix="vectorize"
+            )
+            _embedding_pipeline = EmbeddingPipeline(
+                _embed_notes,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                workers=EMBEDDING_WORKERS,
+                on_failed=_mark_embedding_failed,
+                resume=_pending_embedding_notes,
+            )
+        return _embedding_pipeline
+
+def _embed_notes(notes: list) -> list:
+    """Embed one batch of stored notes (on a pipeline worker); returns the notes that failed"""
+    from embedding_pipeline import is_shutdown_error
+    if LOCAL_VECTOR_INDEX:
+        by_user = {}
+        for note in notes:
+            by_user.setdefault(note["user_id"], []).append(note)
+        for user_id, user_notes in by_user.items():
+            get_local_index().add(user_id, user_notes)
+        _set_indexing_status(notes, "embedded")
+        return []
+
+    # Embedded by the store: one $vectorize update per note, several in flight
+    def vectorize(note):
+        try:
+            notes_collection.update_one(
+                {"_id": note["_id"]},
+                {"$set": {"$vectorize": note["text"], "metadata.indexing_status": "embedded"}},
+            )
+        except Exception as e:
+            if is_shutdown_error(e):
+                raise  # the whole batch stops without spending an attempt
+            print(f"[EMBEDDING] Could not embed note {note['_id']}: {e}")
+            return note
+    return [note for note in _embedding_executor.map(vectorize, notes) if note is not None]
+
+def _set_indexing_status(notes: list, status: str):
+    notes_collection.update_many(
+        {"_id": {"$in": [note["_id"] for note in notes]}},
+        {"$set": {"metadata.indexing_status": status}},
+    )
+
+def _mark_embedding_failed(notes: list):
+    print(f"[EMBEDDING] Giving up on {len(notes)} note(s); they stay keyword-searchable")
+    _set_indexing_status(notes, "failed")
+
+def _pending_embedding_notes():
+    return list(notes_collection.find(
+        {"metadata.indexing_status": "pending"},
+        projection={"text": True, "user_id": True, "metadata": True},
+    ))
+
+def embedding_stats():
+    """Queue depth and throughput counters of the background embedding pipeline"""
+    return _embedding_pipeline.stats() if _embedding_pipeline else {}
+
+def question_embedding(query: str):
+    """Cached embedding of `query` for the active retrieval path, if there is one"""
+    if LOCAL_VECTOR_INDEX:
+        return query_embeddings.get(query, get_local_index().embedder.name)
+    return query_embeddings.get(query, ASTRA_EMBEDDING_MODEL)
+
+def query_embedding_stats():
+    """Hit rate and size of the shared query embedding cache"""
+    return query_embeddings.stats()
+
+def _log_search_results(results):
+    print(f"[RAG RETRIEVAL] Found {len(results)} relevant documents")
+    
+    for i, doc in enumerate(results, 1):
+        score = doc.get("$similarity")
+        text_preview = doc.get("text", "")[:50]
+        score_text = f"Similarity={score:.3f}" if score is not None else f"BM25={doc.get('$bm25', 0):.3f}"
+        print(f"[RAG RETRIEVAL] Doc {i}: {score_text}, Text='{text_preview}...'")
@@ -0,0 +1,415 @@
+"""
+Shared resilience layer for calls to external dependencies (AstraDB, Groq)
+
+Each dependency gets one Dependency object, shared by every session in the
+process, that wraps calls with:
+
+- a per-call timeout
+- retries with jittered exponential backoff, for retryable errors only
+  (timeouts, connection failures, HTTP 429 and 5xx)
+- a circuit breaker that fails fast with CircuitOpenError while the
+  dependency keeps failing, then lets a trial call through after a cool-down
+
+Non-idempotent operations (inserts, updates other than $set/$unset) go
+through call_once(): an attempt that timed out may still land, so they are
+retried only on errors that show the request was never accepted (429,
+connection refused). Each dependency runs its calls on its own bounded
+thread pool, so attempts hung on one dependency can't starve another.
+
+State and counters for every dependency are available from metrics().
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import atexit
+import inspect
+import random
+import threading
+import time
+
+
+def register_exit(fn: Callable[[], Any]):
+    """
+    Run fn at interpreter exit while dependencies can still be called:
+    before concurrent.futures executors (and so Dependency.call) stop
+    accepting work. Plain atexit handlers run after that.
+    """
+    register = getattr(threading, "_register_atexit", None)
+    if register is not None:
+        try:
+            register(fn)
+            return
+        except RuntimeError:
+            pass  # already shutting down
+    atexit.register(fn)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the dependency while its circuit is open"""
+
+
+class CallTimeoutError(TimeoutError):
+    """The call did not finish within the dependency's timeout"""
+
+
+def is_unsent(error: BaseException) -> bool:
+    """Errors that show the request was rejected before it could take effect"""
+    if isinstance(error, ConnectionRefusedError):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    # httpx's ConnectError: the connection was never established
+    return type(error).__name__ == "ConnectError"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures worth retrying: timeouts, connection errors, 429 and 5xx"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # Client libraries (httpx, groq, astrapy) name their transport errors consistently
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failed calls;
+    open -> half_open once `reset_timeout` seconds have passed;
+    half_open -> closed on a successful trial call, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class Dependency:
+    """Timeout + retry + circuit breaker policy for one external dependency"""
+
+    def __init__(self, name: str, timeout: float = 10.0, max_retries: int = 2,
+                 base_delay: float = 0.2, max_delay: float = 5.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 retryable: Callable[[BaseException], bool] = is_retryable,
+                 max_workers: int = 16):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Runs sync calls so the caller can stop waiting at the timeout. A
+        # timed-out attempt keeps its worker until it returns; waiting for a
+        # free worker counts toward the timeout, so a pool full of hung
+        # attempts fails calls (and trips the breaker) instead of queueing them
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"resilience-{name}")
+        self._running = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+        }
+        _dependencies[name] = self
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries from many sessions over the window
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_attempt(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open), failing fast")
+
+    def _after_failure(self, error: BaseException, attempt: int, idempotent: bool = True) -> bool:
+        """Record a failed attempt; True if it should be retried"""
+        if isinstance(error, TimeoutError):
+            self._count("timeouts")
+        if not self.retryable(error):
+            # Caller errors (bad request, missing key) say nothing about dependency health
+            self._count("failures")
+            return False
+        if not idempotent and not is_unsent(error):
+            # The attempt may have taken effect: retrying could apply it twice
+            self.breaker.record_failure()
+            self._count("failures")
+            return False
+        if attempt >= self.max_retries or self.breaker.state == "half_open":
+            # The breaker counts failed calls, not attempts: one unlucky call
+            # with retries must not trip it on its own
+            self.breaker.record_failure()
+            self._count("failures")
+            return False
+        self._count("retries")
+        return True
+
+    def _run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn(*args, **kwargs) under this dependency's policy"""
+        return self._call(fn, args, kwargs, idempotent=True)
+
+    def call_once(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """call() for non-idempotent operations: retried only if the request was never accepted"""
+        return self._call(fn, args, kwargs, idempotent=False)
+
+    def _call(self, fn: Callable[..., Any], args: tuple, kwargs: dict, idempotent: bool) -> Any:
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._before_attempt()
+            try:
+                future = self._executor.submit(self._run, fn, *args, **kwargs)
+                try:
+                    result = future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    future.cancel()
+                    raise CallTimeoutError(f"{self.name} call timed out after {self.timeout}s")
+            except Exception as e:
+                if not self._after_failure(e, attempt, idempotent):
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._count("successes")
+            return result
+
+    async def acall(self, factory: Callable[[], Awaitable[Any]], idempotent: bool = True) -> Any:
+        """
+        Await factory() under this dependency's policy (a fresh awaitable per
+        attempt); idempotent=False retries like call_once()
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._before_attempt()
+            try:
+                try:
+                    result = await asyncio.wait_for(factory(), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    raise CallTimeoutError(f"{self.name} call timed out after {self.timeout}s")
+            except Exception as e:
+                if not self._after_failure(e, attempt, idempotent):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._count("successes")
+            return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            running = self._running
+        return {
+            "state": self.breaker.state,
+            "running": running,
+            "max_workers": self.max_workers,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            **counters,
+        }
+
+
+_dependencies: Dict[str, Dependency] = {}
+
+
+def get_dependency(name: str) -> Optional[Dependency]:
+    return _dependencies.get(name)
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """Breaker state and retry/failure counters for every dependency"""
+    return {name: dependency.metrics() for name, dependency in _dependencies.items()}
+
+
+# ---------------------------------------------------------------------------
+# Collection wrappers
+# ---------------------------------------------------------------------------
+
+class ResilientCursor:
+    """
+    Lazy find() that replays itself on retry. Cursors fetch while being
+    iterated and cannot be restarted, so each attempt builds a new one.
+    """
+
+    def __init__(self, dependency: Dependency, collection, args, kwargs):
+        self._dependency = dependency
+        self._collection = collection
+        self._args = args
+        self._kwargs = kwargs
+        self._chain = []
+        self._cursor = None
+
+    def _chained(self, method: str, *args):
+        self._chain.append((method, args))
+        return self
+
+    def sort(self, *args):
+        return self._chained("sort", *args)
+
+    def limit(self, *args):
+        return self._chained("limit", *args)
+
+    def skip(self, *args):
+        return self._chained("skip", *args)
+
+    def _fetch(self):
+        cursor = self._collection.find(*self._args, **self._kwargs)
+        for method, args in self._chain:
+            cursor = getattr(cursor, method)(*args)
+        results = list(cursor)
+        self._cursor = cursor
+        return results
+
+    def to_list(self):
+        return self._dependency.call(self._fetch)
+
+    def get_sort_vector(self):
+        """Query vector of a find(include_sort_vector=True) that has been fetched"""
+        getter = getattr(self._cursor, "get_sort_vector", None)
+        return getter() if getter else None
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+
+# Update operators for which applying a request twice equals applying it once
+_IDEMPOTENT_UPDATE_OPERATORS = {"$set", "$unset"}
+
+
+def is_idempotent(operation: str, args: tuple, kwargs: dict) -> bool:
+    """Whether a collection operation can be retried after an attempt that may have landed"""
+    if operation.startswith("insert") or operation.startswith("find_one_and_"):
+        return False
+    if operation.startswith("update"):
+        update = args[1] if len(args) > 1 else kwargs.get("update", {})
+        return set(update) <= _IDEMPOTENT_UPDATE_OPERATORS
+    return True
+
+
+class ResilientCollection:
+    """Routes every collection operation through a Dependency"""
+
+    def __init__(self, collection, dependency: Dependency):
+        self.collection = collection
+        self.dependency = dependency
+
+    def find(self, *args, **kwargs) -> ResilientCursor:
+        return ResilientCursor(self.dependency, self.collection, args, kwargs)
+
+    def __getattr__(self, attr):
+        target = getattr(self.collection, attr)
+        if not callable(target):
+            return target
+
+        def call(*args, **kwargs):
+            if is_idempotent(attr, args, kwargs):
+                return self.dependency.call(target, *args, **kwargs)
+            return self.dependency.call_once(target, *args, **kwargs)
+        return call
+
+
+class ResilientAsyncCursor:
+    def __init__(self, dependency: Dependency, collection, args, kwargs):
+        self._dependency = dependency
+        self._collection = collection
+        self._args = args
+        self._kwargs = kwargs
+        self._cursor = None
+
+    async def _fetch(self):
+        cursor = self._collection.find(*self._args, **self._kwargs)
+        results = [doc async for doc in cursor]
+        self._cursor = cursor
+        return results
+
+    async def to_list(self):
+        return await self._dependency.acall(self._fetch)
+
+    async def get_sort_vector(self):
+        getter = getattr(self._cursor, "get_sort_vector", None)
+        vector = getter() if getter else None
+        return await vector if inspect.isawaitable(vector) else vector
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+class ResilientAsyncCollection:
+    """Async counterpart of ResilientCollection"""
+
+    def __init__(self, collection, dependency: Dependency):
+        self.collection = collection
+        self.dependency = dependency
+
+    def find(self, *args, **kwargs) -> ResilientAsyncCursor:
+        return ResilientAsyncCursor(self.dependency, self.collection, args, kwargs)
+
+    def __getattr__(self, attr):
+        target = getattr(self.collection, attr)
+        if not callable(target):
+            return target
+
+        async def call(*args, **kwargs):
+            return await self.dependency.acall(lambda: target(*args, **kwargs),
+                                               idempotent=is_idempotent(attr, args, kwargs))
+        return call
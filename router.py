@@ -0,0 +1,110 @@
+"""
+In-process router between calculators and the LLM
+
+prompts/conditional_router.txt asks an LLM whether a question needs
+calculations. route_question() makes the same call locally with a small
+lexical classifier: weighted cue patterns for each calculator intent,
+for calculation phrasing ("how long", "calculate", numbers) and for
+advisory phrasing ("should I", "why", "recommend"). The weighted sum goes
+through a logistic to give a confidence; only confident calculation
+questions with a recognised intent go to calculators.py, everything else
+goes to the RAG pipeline.
+"""
+from typing import Dict, List, Tuple
+import math
+import os
+import re
+import time
+
+
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.75"))
+
+
+def _cues(patterns: List[Tuple[str, float]]) -> List[Tuple[re.Pattern, float]]:
+    return [(re.compile(pattern), weight) for pattern, weight in patterns]
+
+
+INTENTS = {
+    "emergency_fund": _cues([
+        (r"\bemergenc(?:y|ies)\b", 2.5),
+        (r"\brainy[- ]day\b", 1.5),
+        (r"\bmonths? of expenses\b", 1.5),
+    ]),
+    "debt_payoff": _cues([
+        (r"\bpay (?:it |this |them |my \w+ |off my \w+ )?(?:off|down)\b", 2.0),
+        (r"\bdebt[- ]free\b", 2.5),
+        (r"\bpayoff\b", 2.0),
+        (r"\b(?:debt|loan|credit card|mortgage)s?\b", 1.0),
+    ]),
+    "savings_projection": _cues([
+        (r"\bhow much will i have\b", 2.5),
+        (r"\bcompound(?:ing|ed)?\b", 1.5),
+        (r"\bgrow(?:s|th)?\b", 1.0),
+        (r"\b(?:in|after) \d+ (?:years?|yrs?)\b", 2.0),
+        (r"\bby (?:the time|age) \b", 1.0),
+        (r"\bproject(?:ion|ed)?\b", 1.5),
+    ]),
+    "budget_breakdown": _cues([
+        (r"\bbudget\b", 1.0),
+        (r"\bhow much should i (?:spend|put|allocate|budget)\b", 2.5),
+        (r"\bbreak ?down\b", 1.5),
+        (r"\bmy budget\b", 1.0),
+        (r"\ballocat\w*\b", 1.5),
+        (r"\b(?:housing|rent|food|groceries|transportation|entertainment)\b", 0.5),
+    ]),
+    "savings_rate": _cues([
+        (r"\bsavings? rate\b", 3.0),
+        (r"\bpercent(?:age)? of (?:my )?income\b", 1.5),
+        (r"\bhow much (?:of my income )?am i saving\b", 2.5),
+    ]),
+}
+
+CALCULATION_CUES = _cues([
+    (r"\bhow (?:much|long|many)\b", 1.0),
+    (r"\b(?:calculate|compute|estimate|work out)\b", 1.5),
+    (r"\bwhen will\b", 1.0),
+    (r"\bwhat(?: is|'s) my\b", 1.0),
+    (r"\$\s?\d|\d\s?%", 0.5),
+    (r"\b(?:months?|years?)\b", 0.5),
+])
+
+ADVICE_CUES = _cues([
+    (r"\bshould i\b(?! (?:spend|put|allocate|budget|save)\b)", 1.0),
+    (r"\b(?:better|worth it|recommend\w*|advice|advise|tips?|ideas?|strateg(?:y|ies)|best way)\b", 1.5),
+    (r"\b(?:why|explain|pros|cons)\b|\bwhat(?: is| are|'s)\b(?! my\b)", 1.5),
+    (r"\b(?:invest in|stocks?|crypto|etfs?|index funds?|insurance)\b", 1.0),
+    (r"\bor\b", 0.5),
+    # How long savings would last (runway) is not what the calculators answer
+    (r"\b(?:will|would|does|can) (?:\w+ ){0,3}last\b|\brunway\b|\blos(?:e|t|ing) (?:my|a|the|our) (?:job|income)\b", 2.5),
+])
+
+# Evidence needed before the logistic crosses 0.5
+BIAS = 2.0
+
+
+def _score(cues, text: str) -> float:
+    return sum(weight for pattern, weight in cues if pattern.search(text))
+
+
+def route_question(question: str, threshold: float = ROUTER_THRESHOLD) -> Dict:
+    """
+    {"route": "calculator" | "llm", "intent", "confidence", "latency_ms"}
+
+    confidence is the classifier's probability that the question is a
+    calculation; the route is "calculator" only at or above `threshold`
+    and with an intent the calculators handle.
+    """
+    start = time.perf_counter()
+    text = question.lower()
+    intent_scores = {intent: _score(cues, text) for intent, cues in INTENTS.items()}
+    intent = max(intent_scores, key=intent_scores.get)
+    evidence = intent_scores[intent] + _score(CALCULATION_CUES, text) - _score(ADVICE_CUES, text)
+    confidence = 1 / (1 + math.exp(-(evidence - BIAS)))
+    if intent_scores[intent] == 0:
+        intent = None
+    return {
+        "route": "calculator" if intent and confidence >= threshold else "llm",
+        "intent": intent,
+        "confidence": round(confidence, 3),
+        "latency_ms": (time.perf_counter() - start) * 1000,
+    }
@@ -0,0 +1,116 @@
+"""
+Single-flight deduplication of identical concurrent calls
+
+While a call for a key is running, further calls for the same key don't
+start their own: they wait for the running call and get its result (or
+its exception). Sync and async callers share flights, across threads and
+event loops, because a flight is a concurrent.futures.Future. begin()
+covers calls that finish after the caller returns, like a stream that is
+read later.
+
+Results handed to more than one caller are deep-copied, so sessions
+never share a mutable dict.
+"""
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import copy
+import threading
+
+
+class SingleFlight:
+    def __init__(self, name: str, copy_results: bool = True):
+        self.name = name
+        self.copy_results = copy_results
+        # key -> [future, number of callers waiting on it]
+        self._flights: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    def _join(self, key: Hashable):
+        """(future, True if this caller runs the call)"""
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight[1] += 1
+                self.collapsed += 1
+                return flight[0], False
+            future = Future()
+            self._flights[key] = [future, 0]
+            self.executions += 1
+            return future, True
+
+    def _land(self, key: Hashable, result: Any = None, error: BaseException = None) -> Any:
+        """Publish the leader's outcome; returns what the leader should return"""
+        with self._lock:
+            future, waiting = self._flights.pop(key)
+        if error is not None:
+            future.set_exception(error)
+            return None
+        future.set_result(result)
+        # Followers copy the published result; the leader gets its own copy
+        return copy.deepcopy(result) if waiting and self.copy_results else result
+
+    def _shared(self, result: Any) -> Any:
+        return copy.deepcopy(result) if self.copy_results else result
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """fn(*args, **kwargs), or the result of the identical call already running"""
+        future, leader = self._join(key)
+        if not leader:
+            return self._shared(future.result())
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, error=e)
+            raise
+        return self._land(key, result)
+
+    async def ado(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """do() for coroutine functions: followers wait without blocking their loop"""
+        future, leader = self._join(key)
+        if not leader:
+            return self._shared(await asyncio.wrap_future(future))
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, error=e)
+            raise
+        return self._land(key, result)
+
+    def begin(self, key: Hashable) -> Tuple[Future, Optional[Callable]]:
+        """
+        Join the flight for `key` without running anything: (flight, land).
+        The caller that runs the call gets land and publishes its outcome
+        with land(result) or land(error=e), returning what it should keep
+        (only the first land counts); the others get None and follow(flight).
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future, None
+        landed = threading.Lock()
+
+        def land(result: Any = None, error: BaseException = None) -> Any:
+            if landed.acquire(blocking=False):
+                return self._land(key, result, error)
+            return result
+
+        return future, land
+
+    def follow(self, future: Future) -> Any:
+        """The outcome of a flight joined with begin(), waiting for it to land"""
+        return self._shared(future.result())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "executions": self.executions,
+                "collapsed": self.collapsed,
+                "in_flight": len(self._flights),
+                "collapse_rate": self.collapsed / self.calls if self.calls else 0.0,
+            }
@@ -0,0 +1,151 @@
+"""
+Speculative background work for the current profile
+
+When a session loads a profile (and after the personal data or goals are
+saved), the budget suggestion and the compact profile summary used in
+the RAG prompt are started on a small background executor, before the
+user asks for them. "Generate with AI" then attaches to the in-flight or
+finished budget instead of starting the round trip on the click.
+
+Each task carries a key for what it was computed from: the profile
+version for the summary, a fingerprint of the general section and goals
+for the budget (saving the budget itself doesn't invalidate a budget
+suggestion). A task whose key no longer matches the profile is cancelled
+if it hasn't started, and its result is discarded either way.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+import copy
+import hashlib
+import json
+import os
+import threading
+
+SPECULATIVE = os.getenv("SPECULATIVE", "1") == "1"
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "2"))
+
+
+class SpeculativeTasks:
+    """Background futures keyed by (owner, task name), tagged with the key of their inputs"""
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._tasks: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.reused = 0
+        self.attached = 0
+        self.missed = 0
+        self.cancelled = 0
+        self.discarded = 0
+
+    def _drop(self, task_key: tuple):
+        """Forget a task (lock held): cancel it if queued, ignore its result otherwise"""
+        _, future = self._tasks.pop(task_key)
+        if future.cancel():
+            self.cancelled += 1
+        else:
+            self.discarded += 1
+
+    def start(self, owner: Hashable, name: str, key: str, fn: Callable, *args, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) in the background unless a task with the same inputs exists"""
+        task_key = (owner, name)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None:
+                task_inputs, future = task
+                failed = future.done() and not future.cancelled() and future.exception() is not None
+                if task_inputs == key and not failed:
+                    self.reused += 1
+                    return future
+                self._drop(task_key)
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._tasks[task_key] = (key, future)
+            self.started += 1
+            return future
+
+    def attach(self, owner: Hashable, name: str, key: str) -> Optional[Future]:
+        """The task's future if it was started for `key`; a stale task is dropped"""
+        task_key = (owner, name)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None and task[0] == key:
+                self.attached += 1
+                return task[1]
+            if task is not None:
+                self._drop(task_key)
+            self.missed += 1
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tasks": len(self._tasks),
+                "started": self.started,
+                "reused": self.reused,
+                "attached": self.attached,
+                "missed": self.missed,
+                "cancelled": self.cancelled,
+                "discarded": self.discarded,
+            }
+
+
+speculation = SpeculativeTasks(max_workers=SPECULATIVE_WORKERS)
+
+
+def _fingerprint(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _budget_key(profile: dict) -> str:
+    # get_budget reads only the general section and the goals
+    return _fingerprint([profile.get("general"), profile.get("goals")])
+
+
+def _summary_key(profile_id) -> str:
+    from profiles import profile_version
+
+    return f"version:{profile_version(profile_id)}"
+
+
+def _compute_budget(profile_id, profile: dict) -> Dict[str, int]:
+    from ai import get_budget
+
+    return get_budget(profile.get("general"), profile.get("goals"), profile_id)
+
+
+def _compute_summary(profile: dict) -> str:
+    from context_packer import pack_profile
+
+    return pack_profile(profile)
+
+
+def speculate_profile(profile_id, profile: dict):
+    """Start the budget suggestion and profile summary for the profile's current version"""
+    if not SPECULATIVE or not profile:
+        return
+    # The session keeps editing its copy while the tasks run
+    profile = copy.deepcopy(profile)
+    speculation.start(profile_id, "budget", _budget_key(profile), _compute_budget, profile_id, profile)
+    speculation.start(profile_id, "summary", _summary_key(profile_id), _compute_summary, profile)
+
+
+def budget_for(profile_id, profile: dict) -> Dict[str, int]:
+    """The speculative budget when it matches the profile (waiting for it if needed), else get_budget now"""
+    future = speculation.attach(profile_id, "budget", _budget_key(profile))
+    if future is not None and not future.cancelled():
+        try:
+            budget = future.result()
+            print(f"[SPECULATIVE] Budget for profile {profile_id} served from background work")
+            return budget
+        except Exception as e:
+            print(f"[SPECULATIVE] Background budget failed, computing now: {e}")
+    return _compute_budget(profile_id, profile)
+
+
+def profile_summary(profile_id, profile: dict) -> Optional[str]:
+    """The speculative profile summary if it is finished and current, else None (never waits)"""
+    future = speculation.attach(profile_id, "summary", _summary_key(profile_id))
+    if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+        return None
+    return future.result()
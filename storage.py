@@ -0,0 +1,711 @@
+"""
+Storage backends for the financial advisor.
+
+Every module talks to collections through the same small surface we already
+use against AstraDB: find_one, find (with sort/limit), insert_one,
+insert_many, update_one and delete_one. A backend hands out collections by name:
+
+- AstraBackend: the cloud AstraDB Data API (production default)
+- SQLiteBackend: an in-process SQLite store (file or ":memory:") with
+  indexes on `id` (lookups and ordered pages), `user_id` and per-user
+  note time, for single-node
+  deployments, benchmarks and CI
+
+The backend is picked by the STORAGE_BACKEND environment variable, see db.py.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+import asyncio
+import itertools
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+
+PROFILES_COLLECTION = "financial_profiles"
+NOTES_COLLECTION = "financial_notes"
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.update_info = {"n": matched_count, "nModified": modified_count}
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+
+
+class ThreadedAsyncCursor:
+    """Async view of a sync cursor: iterates it on a worker thread"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def to_list(self) -> List[dict]:
+        return await asyncio.to_thread(list, self._cursor)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+    async def get_sort_vector(self):
+        return await asyncio.to_thread(self._cursor.get_sort_vector)
+
+
+class ThreadedAsyncCollection:
+    """
+    Async facade over a sync collection. Each operation runs on a worker
+    thread, so several can be awaited concurrently with asyncio.gather.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs) -> ThreadedAsyncCursor:
+        return ThreadedAsyncCursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, attr):
+        target = getattr(self.collection, attr)
+        if not callable(target):
+            return target
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(target, *args, **kwargs)
+        return call
+
+
+class StorageBackend:
+    """Interface every storage backend implements"""
+
+    name = "base"
+    # True when get_collection creates a missing collection (no bootstrap needed)
+    creates_on_demand = False
+
+    def get_collection(self, name: str):
+        """Return a collection exposing find_one/find/insert_one/update_one/delete_one"""
+        raise NotImplementedError
+
+    def get_async_collection(self, name: str):
+        """Same operations as coroutines (find returns an async-iterable cursor)"""
+        return ThreadedAsyncCollection(self.get_collection(name))
+
+    def list_collection_names(self) -> List[str]:
+        raise NotImplementedError
+
+    def ensure_collections(self):
+        """Create the profile and note collections if they are missing"""
+        raise NotImplementedError
+
+
+# ---------------------------------------------------------------------------
+# AstraDB
+# ---------------------------------------------------------------------------
+
+class AstraBackend(StorageBackend):
+    """AstraDB Data API backend. astrapy collections already speak our interface."""
+
+    name = "astra"
+
+    def __init__(self, token: str, endpoint: str):
+        from astrapy import DataAPIClient
+
+        client = DataAPIClient(token)
+        self.db = client.get_database_by_api_endpoint(endpoint)
+
+    def get_collection(self, name: str):
+        return self.db.get_collection(name)
+
+    def get_async_collection(self, name: str):
+        # Native astrapy async client: requests share the caller's event loop
+        return self.db.get_collection(name).to_async()
+
+    def list_collection_names(self) -> List[str]:
+        return self.db.list_collection_names()
+
+    def ensure_collections(self):
+        """Ensure both collections exist with proper configuration"""
+        db = self.db
+
+        # Get list of existing collections
+        existing_collections = db.list_collection_names()
+
+        # Create financial_profiles if it doesn't exist
+        if PROFILES_COLLECTION not in existing_collections:
+            try:
+                db.create_collection(PROFILES_COLLECTION)
+                print(f"✓ Created collection: {PROFILES_COLLECTION}")
+            except Exception as e:
+                print(f"Error creating {PROFILES_COLLECTION}: {e}")
+        else:
+            print(f"✓ Collection {PROFILES_COLLECTION} exists")
+
+        # Create financial_notes with vector support if it doesn't exist
+        if NOTES_COLLECTION not in existing_collections:
+            try:
+                # Try with vector configuration
+                db.create_collection(
+                    NOTES_COLLECTION,
+                    dimension=1024,
+                    metric="cosine",
+                    service={
+                        "provider": "nvidia",
+                        "modelName": "NV-Embed-QA"
+                    }
+                )
+                print(f"✓ Created collection: {NOTES_COLLECTION} (with vector embeddings)")
+            except Exception as e:
+                print(f"⚠️  Error creating {NOTES_COLLECTION} with vectors: {e}")
+                print("   Trying without vector configuration...")
+                try:
+                    # Fallback: create without vectors
+                    db.create_collection(NOTES_COLLECTION)
+                    print(f"✓ Created collection: {NOTES_COLLECTION} (without vectors)")
+                    print("   Note: Vector search will not be available")
+                except Exception as e2:
+                    print(f"❌ Failed to create {NOTES_COLLECTION}: {e2}")
+        else:
+            print(f"✓ Collection {NOTES_COLLECTION} exists")
+
+
+# ---------------------------------------------------------------------------
+# SQLite / in-memory
+# ---------------------------------------------------------------------------
+
+# Top-level fields mirrored into indexed columns
+INDEXED_FIELDS = ("id", "user_id")
+# Document paths with a (user_id, path) expression index, so per-user
+# sorted reads and range filters on them are answered by SQLite directly
+SORTED_FIELDS = ("metadata.injested",)
+# Document paths with a collection-wide (path, _id) expression index, so
+# pages sorted on them (e.g. batch jobs walking profiles by id) are read in
+# order from the index instead of sorted in Python
+GLOBAL_SORTED_FIELDS = ("id",)
+
+
+def _encode(value):
+    """JSON encoder hook: datetimes use the Data API's {"$date": millis} form"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {"$date": int(value.timestamp() * 1000)}
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: dict):
+    """JSON object hook: turn {"$date": millis} back into aware datetimes"""
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromtimestamp(obj["$date"] / 1000, tz=timezone.utc)
+    return obj
+
+
+def _dumps(doc: dict) -> str:
+    return json.dumps(doc, default=_encode)
+
+
+def _loads(raw: str) -> dict:
+    return json.loads(raw, object_hook=_decode)
+
+
+_MISSING = object()
+
+
+def _get_path(doc: dict, path: str):
+    """Resolve a dotted path ("metadata.injested") inside a document"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    target[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        target = target.get(part)
+        if not isinstance(target, dict):
+            return
+    target.pop(parts[-1], None)
+
+
+def _compare(op: str, actual, expected) -> bool:
+    if op == "$eq":
+        return actual is not _MISSING and actual == expected
+    if op == "$ne":
+        return actual is _MISSING or actual != expected
+    if op == "$in":
+        return actual is not _MISSING and actual in expected
+    if op == "$nin":
+        return actual is _MISSING or actual not in expected
+    if op == "$exists":
+        return (actual is not _MISSING) == bool(expected)
+    if actual is _MISSING or actual is None:
+        return False
+    try:
+        if op == "$lt":
+            return actual < expected
+        if op == "$lte":
+            return actual <= expected
+        if op == "$gt":
+            return actual > expected
+        if op == "$gte":
+            return actual >= expected
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches(doc: dict, filter: Optional[dict]) -> bool:
+    """Evaluate a Data API style filter against a document"""
+    for key, condition in (filter or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator: {key}")
+        else:
+            actual = _get_path(doc, key)
+            if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+                if not all(_compare(op, actual, expected) for op, expected in condition.items()):
+                    return False
+            elif not _compare("$eq", actual, condition):
+                return False
+    return True
+
+
+def _sort_documents(docs: List[dict], sort: Optional[dict]) -> List[dict]:
+    if not sort:
+        return docs
+    if any(key in ("$vector", "$vectorize") for key in sort):
+        raise NotImplementedError(
+            "Vector sort is not supported by the SQLite backend"
+        )
+    # Apply keys from least to most significant so earlier keys win
+    for key, direction in reversed(list(sort.items())):
+        present = [d for d in docs if _get_path(d, key) not in (_MISSING, None)]
+        missing = [d for d in docs if _get_path(d, key) in (_MISSING, None)]
+        present.sort(key=lambda d: _get_path(d, key), reverse=direction < 0)
+        # Missing values sort first ascending, last descending (Data API order)
+        docs = missing + present if direction > 0 else present + missing
+    return docs
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v}
+    exclude = {k for k, v in projection.items() if not v}
+    if include:
+        projected = {}
+        if "_id" not in exclude:
+            projected["_id"] = doc.get("_id")
+        for path in include:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(projected, path, value)
+        return projected
+    projected = _loads(_dumps(doc))
+    for path in exclude:
+        _unset_path(projected, path)
+    return projected
+
+
+def _sort_expression(path: str) -> str:
+    """SQL expression for a document path; dates compare by their millis"""
+    if not all(part.isidentifier() for part in path.split(".")):
+        raise ValueError(f"Unsupported sort path: {path}")
+    return (f"COALESCE(json_extract(doc, '$.{path}.\"$date\"'), "
+            f"json_extract(doc, '$.{path}'))")
+
+
+class SQLiteCursor:
+    """Lazy result set supporting .sort()/.limit() chaining and iteration"""
+
+    def __init__(self, collection: "SQLiteCollection", filter: Optional[dict],
+                 sort: Optional[dict] = None, limit: Optional[int] = None,
+                 skip: Optional[int] = None, projection: Optional[dict] = None):
+        self._collection = collection
+        self._filter = filter or {}
+        self._sort = sort
+        self._limit = limit
+        self._skip = skip
+        self._projection = projection
+
+    def sort(self, sort: dict) -> "SQLiteCursor":
+        self._sort = sort
+        return self
+
+    def limit(self, limit: int) -> "SQLiteCursor":
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int) -> "SQLiteCursor":
+        self._skip = skip
+        return self
+
+    def to_list(self) -> List[dict]:
+        return list(self)
+
+    def get_sort_vector(self) -> Optional[List[float]]:
+        return None  # no vector search locally
+
+    def __iter__(self) -> Iterator[dict]:
+        sort_keys = list((self._sort or {}).items())
+        if len(sort_keys) == 1 and sort_keys[0][0] in SORTED_FIELDS + GLOBAL_SORTED_FIELDS:
+            # Ordered by SQLite through the expression index; stops reading
+            # as soon as the page is full
+            docs = self._collection._iter_sorted(self._filter, *sort_keys[0])
+            start = self._skip or 0
+            stop = start + self._limit if self._limit else None
+            docs = itertools.islice(docs, start, stop)
+            return (_project(doc, self._projection) for doc in docs)
+
+        docs = self._collection._select(self._filter)
+        docs = _sort_documents(docs, self._sort)
+        if self._skip:
+            docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([_project(doc, self._projection) for doc in docs])
+
+
+class SQLiteCollection:
+    """A document collection stored as JSON rows in one SQLite table"""
+
+    def __init__(self, backend: "SQLiteBackend", name: str):
+        self.backend = backend
+        self.name = name
+        self._table = '"' + name.replace('"', '""') + '"'
+
+    # --- reads -------------------------------------------------------------
+
+    def _where(self, filter: dict):
+        """SQL conditions for the parts of `filter` the indexes can answer"""
+        clauses, params = [], []
+        for field in ("_id",) + INDEXED_FIELDS:
+            condition = filter.get(field)
+            if isinstance(condition, dict) and set(condition) == {"$eq"}:
+                condition = condition["$eq"]
+            if condition is None or isinstance(condition, (dict, list)):
+                continue
+            clauses.append(f'"{field}" = ?')
+            params.append(_dumps(condition))
+
+        operators = {"$lt": "<", "$lte": "<=", "$gt": ">", "$gte": ">="}
+        for path in SORTED_FIELDS + GLOBAL_SORTED_FIELDS:
+            condition = filter.get(path)
+            if not isinstance(condition, dict):
+                continue
+            for op, value in condition.items():
+                if isinstance(value, bool):
+                    continue
+                if op in operators and isinstance(value, (datetime, int, float, str)):
+                    if isinstance(value, datetime):
+                        value = _encode(value)["$date"]
+                    clauses.append(f"{_sort_expression(path)} {operators[op]} ?")
+                    params.append(value)
+
+        sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return sql, params
+
+    def _select(self, filter: dict) -> List[dict]:
+        """Narrow rows with the indexed columns, then apply the full filter"""
+        where, params = self._where(filter)
+        with self.backend.lock:
+            rows = self.backend.conn.execute(
+                f"SELECT doc FROM {self._table}{where}", params
+            ).fetchall()
+        docs = [_loads(row[0]) for row in rows]
+        return [doc for doc in docs if matches(doc, filter)]
+
+    def _iter_sorted(self, filter: dict, path: str, direction: int,
+                     batch_size: int = 128) -> Iterator[dict]:
+        """Yield matching documents ordered by an indexed path, a batch at a time"""
+        where, params = self._where(filter)
+        order = "DESC" if direction < 0 else "ASC"
+        sql = (f"SELECT doc FROM {self._table}{where} "
+               f"ORDER BY {_sort_expression(path)} {order}, \"_id\" {order} LIMIT ? OFFSET ?")
+        offset = 0
+        while True:
+            with self.backend.lock:
+                rows = self.backend.conn.execute(sql, (*params, batch_size, offset)).fetchall()
+            for row in rows:
+                doc = _loads(row[0])
+                if matches(doc, filter):
+                    yield doc
+            if len(rows) < batch_size:
+                return
+            offset += batch_size
+
+    def find(self, filter: Optional[dict] = None, *, projection: Optional[dict] = None,
+             sort: Optional[dict] = None, limit: Optional[int] = None,
+             skip: Optional[int] = None, include_similarity: bool = False,
+             include_sort_vector: bool = False) -> SQLiteCursor:
+        return SQLiteCursor(self, filter, sort=sort, limit=limit, skip=skip,
+                            projection=projection)
+
+    def find_one(self, filter: Optional[dict] = None, *, projection: Optional[dict] = None,
+                 sort: Optional[dict] = None) -> Optional[dict]:
+        for doc in self.find(filter, projection=projection, sort=sort, limit=1):
+            return doc
+        return None
+
+    def count_documents(self, filter: Optional[dict] = None, upper_bound: Optional[int] = None) -> int:
+        return len(self._select(filter or {}))
+
+    # --- writes ------------------------------------------------------------
+
+    def _row(self, doc: dict):
+        return (
+            _dumps(doc["_id"]),
+            *(_dumps(doc[f]) if f in doc else None for f in INDEXED_FIELDS),
+            _dumps(doc),
+        )
+
+    def insert_one(self, document: dict) -> InsertOneResult:
+        doc = _loads(_dumps(document))
+        doc.pop("$vectorize", None)
+        doc.setdefault("_id", str(uuid.uuid4()))
+        columns = ", ".join(f'"{c}"' for c in ("_id",) + INDEXED_FIELDS + ("doc",))
+        placeholders = ", ".join("?" for _ in range(len(INDEXED_FIELDS) + 2))
+        with self.backend.lock:
+            try:
+                self.backend.conn.execute(
+                    f"INSERT INTO {self._table} ({columns}) VALUES ({placeholders})",
+                    self._row(doc),
+                )
+                self.backend.conn.commit()
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Document with _id {doc['_id']!r} already exists") from e
+        return InsertOneResult(doc["_id"])
+
+    def insert_many(self, documents: List[dict], *, ordered: bool = False,
+                    chunk_size: Optional[int] = None, concurrency: Optional[int] = None) -> InsertManyResult:
+        """Insert all documents in one transaction; nothing is inserted if any row fails"""
+        docs = []
+        for document in documents:
+            doc = _loads(_dumps(document))
+            doc.pop("$vectorize", None)
+            doc.setdefault("_id", str(uuid.uuid4()))
+            docs.append(doc)
+        columns = ", ".join(f'"{c}"' for c in ("_id",) + INDEXED_FIELDS + ("doc",))
+        placeholders = ", ".join("?" for _ in range(len(INDEXED_FIELDS) + 2))
+        with self.backend.lock:
+            try:
+                self.backend.conn.executemany(
+                    f"INSERT INTO {self._table} ({columns}) VALUES ({placeholders})",
+                    [self._row(doc) for doc in docs],
+                )
+                self.backend.conn.commit()
+            except sqlite3.IntegrityError as e:
+                self.backend.conn.rollback()
+                raise ValueError(f"insert_many failed, no documents inserted: {e}") from e
+        return InsertManyResult([doc["_id"] for doc in docs])
+
+    def _replace(self, doc: dict):
+        assignments = ", ".join(f'"{c}" = ?' for c in INDEXED_FIELDS + ("doc",))
+        _id, *rest = self._row(doc)
+        self.backend.conn.execute(
+            f'UPDATE {self._table} SET {assignments} WHERE "_id" = ?',
+            (*rest, _id),
+        )
+
+    def update_one(self, filter: dict, update: dict, *, upsert: bool = False) -> UpdateResult:
+        unsupported = set(update) - {"$set", "$unset", "$setOnInsert"}
+        if unsupported:
+            raise ValueError(f"Unsupported update operators: {sorted(unsupported)}")
+
+        with self.backend.lock:
+            docs = self._select(filter)
+            if not docs:
+                if not upsert:
+                    return UpdateResult(0, 0)
+                doc = {k: v for k, v in filter.items() if not k.startswith("$")
+                       and not isinstance(v, dict)}
+                for path, value in update.get("$setOnInsert", {}).items():
+                    _set_path(doc, path, value)
+                for path, value in update.get("$set", {}).items():
+                    _set_path(doc, path, value)
+                result = self.insert_one(doc)
+                return UpdateResult(0, 0, upserted_id=result.inserted_id)
+
+            modified = self._apply_update(docs[0], update)
+            if modified:
+                self.backend.conn.commit()
+        return UpdateResult(1, int(modified))
+
+    def update_many(self, filter: dict, update: dict) -> UpdateResult:
+        unsupported = set(update) - {"$set", "$unset"}
+        if unsupported:
+            raise ValueError(f"Unsupported update operators: {sorted(unsupported)}")
+
+        with self.backend.lock:
+            docs = self._select(filter)
+            modified = sum(self._apply_update(doc, update) for doc in docs)
+            if modified:
+                self.backend.conn.commit()
+        return UpdateResult(len(docs), modified)
+
+    def _apply_update(self, doc: dict, update: dict) -> bool:
+        """Apply $set/$unset to a stored document and write it back if it changed"""
+        before = _dumps(doc)
+        for path, value in _loads(_dumps(update.get("$set", {}))).items():
+            if path != "$vectorize":  # no embedding service locally (as in insert_one)
+                _set_path(doc, path, value)
+        for path in update.get("$unset", {}):
+            _unset_path(doc, path)
+        modified = _dumps(doc) != before
+        if modified:
+            self._replace(doc)
+        return modified
+
+    def delete_one(self, filter: dict) -> DeleteResult:
+        with self.backend.lock:
+            docs = self._select(filter)
+            if not docs:
+                return DeleteResult(0)
+            self.backend.conn.execute(
+                f'DELETE FROM {self._table} WHERE "_id" = ?', (_dumps(docs[0]["_id"]),)
+            )
+            self.backend.conn.commit()
+        return DeleteResult(1)
+
+
+class FaultInjectingCollection:
+    """
+    Local stand-in for a remote collection: every call sleeps `latency`
+    seconds and fails with ConnectionError at `failure_rate`, so benchmarks
+    see realistic round trips and the resilience layer can be exercised
+    without the cloud.
+    """
+
+    OPERATIONS = ("find", "find_one", "count_documents", "insert_one",
+                  "insert_many", "update_one", "update_many", "delete_one")
+
+    def __init__(self, collection, latency: float = 0.0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.collection = collection
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def __getattr__(self, attr):
+        target = getattr(self.collection, attr)
+        if attr not in self.OPERATIONS:
+            return target
+
+        def call(*args, **kwargs):
+            time.sleep(self.latency)
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                raise ConnectionError(f"Injected fault in {attr} on {self.collection.name}")
+            return target(*args, **kwargs)
+        return call
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    In-process document store on SQLite.
+
+    Documents are stored as JSON, with `_id`, `id` and `user_id` mirrored
+    into indexed columns so profile and per-user note lookups never scan.
+    Use path=":memory:" for a throwaway store (benchmarks, CI), and
+    `latency` (seconds per call) / `failure_rate` to stand in for a remote,
+    unreliable database.
+    """
+
+    name = "sqlite"
+    creates_on_demand = True
+
+    def __init__(self, path: str = ":memory:", latency: float = 0.0, failure_rate: float = 0.0):
+        self.path = path
+        self.latency = latency
+        self.failure_rate = failure_rate
+        # Streamlit runs each session on its own thread; access is serialized by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self._collections: Dict[str, SQLiteCollection] = {}
+
+    def _create_table(self, name: str):
+        table = '"' + name.replace('"', '""') + '"'
+        with self.lock:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                f'"_id" TEXT PRIMARY KEY, "id" TEXT, "user_id" TEXT, "doc" TEXT NOT NULL)'
+            )
+            for field in INDEXED_FIELDS:
+                index = '"' + f"idx_{name}_{field}".replace('"', '""') + '"'
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ("{field}")')
+            for path in SORTED_FIELDS:
+                index = '"' + f"idx_{name}_user_id_{path}".replace('"', '""') + '"'
+                self.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS {index} ON {table} '
+                    f'("user_id", {_sort_expression(path)}, "_id")'
+                )
+            for path in GLOBAL_SORTED_FIELDS:
+                index = '"' + f"idx_{name}_sorted_{path}".replace('"', '""') + '"'
+                self.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({_sort_expression(path)}, "_id")'
+                )
+            self.conn.commit()
+
+    def get_collection(self, name: str) -> SQLiteCollection:
+        with self.lock:
+            if name not in self._collections:
+                # Tables are cheap; create on demand so a fresh file is usable immediately
+                self._create_table(name)
+                collection = SQLiteCollection(self, name)
+                if self.latency or self.failure_rate:
+                    collection = FaultInjectingCollection(collection, self.latency, self.failure_rate)
+                self._collections[name] = collection
+            return self._collections[name]
+
+    def list_collection_names(self) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def ensure_collections(self):
+        for name in (PROFILES_COLLECTION, NOTES_COLLECTION):
+            self._create_table(name)
+            print(f"✓ Collection {name} exists (sqlite: {self.path})")
@@ -3,7 +3,7 @@ Test script to verify AI responses are properly formatted
 Run this to check AI output before using in the app
 """
 
-from ai import ask_ai
+from ai import ask_ai_with_rag
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -47,7 +47,7 @@ for i, question in enumerate(questions, 1):
     print(f"TEST {i}: {question}")
     print(f"{'=' * 80}\n")
     
-    response = ask_ai(test_profile, question)
+    response = ask_ai_with_rag(test_profile, question, profile_id=0)["response"]
     print(response)
     
     # Check for formatting issues
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import budget_engine
+from budget_engine import CATEGORIES, GOALS, RANGES
+
+
+def _random_profiles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        goals = [goal for goal in GOALS if rng.random() < 0.4]
+        yield {
+            "monthly_income": float(rng.choice([rng.uniform(500, 3000), rng.uniform(3000, 50000)])),
+            "current_savings": float(rng.uniform(0, 100000)),
+            "debt_amount": float(rng.choice([0, rng.uniform(0, 200000)])),
+            "dependents": int(rng.integers(0, 6)),
+        }, goals
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_budgets_add_up_to_income_within_every_range(seed):
+    for general, goals in _random_profiles(200, seed):
+        budget = budget_engine.allocate(general, goals)
+        income = general["monthly_income"]
+        assert list(budget) == list(CATEGORIES)
+        assert sum(budget.values()) == round(income)
+        # Whole dollars can move a share by at most a dollar
+        tolerance = 1 / income
+        for category, (low, high) in RANGES.items():
+            assert low - tolerance <= budget[category] / income <= high + tolerance, (category, general, goals)
+        assert 0.15 - tolerance <= budget["savings"] / income <= 0.40 + tolerance
+
+
+def test_allocate_many_matches_single_profiles():
+    profiles = list(_random_profiles(50))
+    inputs = np.array([budget_engine._profile_inputs(general) for general, _ in profiles])
+    flags = [budget_engine.goal_flags(goals) for _, goals in profiles]
+    many = budget_engine.allocate_many(inputs[:, 0], inputs[:, 1], inputs[:, 2], inputs[:, 3], flags)
+    for row, (general, goals) in zip(many, profiles):
+        assert list(row) == list(budget_engine.allocate(general, goals).values())
+
+
+def test_goals_and_debt_raise_savings():
+    general = {"monthly_income": 6000, "current_savings": 50000}
+    base = budget_engine.allocate(general)
+    assert budget_engine.allocate(general, ["Save for Retirement"])["savings"] > base["savings"]
+    assert budget_engine.allocate({**general, "debt_amount": 30000})["savings"] > base["savings"]
+
+
+def test_largest_remainder_rounds_to_the_exact_total():
+    rounded = budget_engine.largest_remainder([[33.4, 33.3, 33.3], [0.5, 0.5, 99.0]], [100, 100])
+    assert rounded.tolist() == [[34, 33, 33], [1, 0, 99]]
+
+
+def test_refine_moves_an_llm_budget_only_into_the_ranges():
+    general = {"monthly_income": 5000}
+    suggestion = {"housing": 2500, "food": 600, "transportation": 600, "savings": 800,
+                  "entertainment": 300, "miscellaneous": 200}
+    refined = budget_engine.refine(general, suggestion)
+    assert sum(refined.values()) == 5000
+    assert refined["housing"] == 1750  # capped at 35%
+    assert all(low * 5000 <= refined[c] <= high * 5000 for c, (low, high) in RANGES.items())
@@ -0,0 +1,50 @@
+import time
+
+from cache import LRUTTLCache, QueryEmbeddingCache, SemanticResponseCache, normalize_query
+
+
+def test_lru_ttl_cache_evicts_expires_and_checks_versions():
+    cache = LRUTTLCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1, version=1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # "b" is least recently used
+    assert cache.get("b") is None and cache.stats()["evictions"] == 1
+    assert cache.get("a", version=2) is None  # written since: stale
+    time.sleep(0.06)
+    assert cache.get("c") is None and cache.stats()["expirations"] == 1
+
+
+def test_normalize_query():
+    assert normalize_query("  How much should I SAVE?! ") == "how much should i save"
+
+
+def test_exact_and_semantic_hits():
+    cache = SemanticResponseCache(threshold=0.95)
+    cache.set(1, "v1", "How much should I save?", {"response": "20%"}, vector=[1.0, 0.0])
+    assert cache.get(1, "v1", "how much should i save") == ({"response": "20%"}, "exact", 1.0)
+    value, kind, similarity = cache.get(1, "v1", "What should I be saving?", vector=[0.99, 0.05])
+    assert (value, kind) == ({"response": "20%"}, "semantic") and similarity >= 0.95
+    assert cache.get(1, "v1", "Should I buy a car?", vector=[0.0, 1.0]) is None
+    # Another profile never sees this profile's answers
+    assert cache.get(2, "v1", "How much should I save?", vector=[1.0, 0.0]) is None
+
+
+def test_new_fingerprint_drops_stale_answers():
+    cache = SemanticResponseCache()
+    cache.set(1, "v1", "q", "old answer")
+    assert cache.get(1, "v2", "q") is None
+    assert cache.get(1, "v1", "q") is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["size"] == 0
+    cache.set(1, "v2", "q", "new answer")
+    cache.invalidate(1)
+    assert cache.get(1, "v2", "q") is None
+
+
+def test_query_embeddings_persist_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.json")
+    cache = QueryEmbeddingCache(path=path, save_every=1)
+    cache.set("How much should I save?", "model-a", [0.5, 0.25])
+    reloaded = QueryEmbeddingCache(path=path)
+    assert reloaded.get("how much should i save", "model-a") == [0.5, 0.25]
+    assert reloaded.get("how much should i save", "model-b") is None
@@ -0,0 +1,39 @@
+import json
+import warnings
+
+import numpy as np
+
+import calculators
+
+
+PROFILE = {"general": {"monthly_income": 5000, "current_savings": 2000, "debt_amount": 10000},
+           "budget": {"savings": 600}}
+
+
+def test_interest_saved_is_nan_when_a_strategy_never_pays_off():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        results = calculators.compare_payoff_strategies([2000, 8000], [0.06, 0.24], [50, 150], [100, 800])
+    saved = results["interest_saved_by_avalanche"]
+    assert np.isnan(saved[0]) and np.isinf(results["avalanche"]["months"][0])
+    assert saved[1] > 0
+
+
+def test_tool_schemas_accept_scenario_arrays():
+    schemas = {tool["function"]["name"]: tool["function"]["parameters"]["properties"] for tool in calculators.TOOLS}
+    assert schemas["future_value"]["years"]["oneOf"] == [
+        {"type": "number"}, {"type": "array", "items": {"type": "number"}}]
+    assert schemas["debt_payoff"]["balances"]["type"] == "array"
+
+
+def test_run_tool_returns_every_scenario():
+    schedule = calculators.run_tool("amortization_schedule", {"annual_rate": [0.05, 0.18], "payment": 600}, PROFILE)
+    assert len(schedule["months"]) == 2 and schedule["months"][0] < schedule["months"][1]
+    assert len(schedule["balance"]) == 2
+    payoff = calculators.run_tool("debt_payoff", json.dumps({
+        "balances": [2000, 8000], "annual_rates": [0.06, 0.24], "minimums": [50, 150], "monthly_budget": [100, 800],
+    }), PROFILE)
+    assert payoff["interest_saved_by_avalanche"][0] is None
+    fund = calculators.run_tool("emergency_fund", {"months_of_expenses": [3, 6]}, PROFILE)
+    assert fund["target"] == [13200.0, 26400.0]
+    json.dumps([schedule, payoff, fund])
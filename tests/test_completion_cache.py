@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+import completion_cache
+from completion_cache import CompletionCache, completion_key
+
+
+def _request(question, **options):
+    return {"model": "m", "messages": [{"role": "user", "content": question}], "temperature": 0.2, **options}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(completion_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_key_covers_the_fields_that_change_the_completion():
+    base = _request("q")
+    assert completion_key(base) == completion_key({**base, "stream": True, "top_p": 0.5})
+    for change in ({"model": "other"}, {"temperature": 0.3}, {"max_tokens": 10},
+                   {"messages": [{"role": "user", "content": "other"}]}):
+        assert completion_key({**base, **change}) != completion_key(base)
+
+
+def test_instances_on_one_file_share_entries(tmp_path):
+    path = str(tmp_path / "completions.db")
+    writer, reader = CompletionCache(path), CompletionCache(path)
+    writer.set(_request("q"), "answer")
+    assert reader.get(_request("q")) == "answer"
+    assert reader.get(_request("other")) is None
+    assert reader.stats()["hits"] == 1 and reader.stats()["misses"] == 1
+
+
+def test_expired_entries_miss_and_are_pruned(tmp_path, clock):
+    cache = CompletionCache(str(tmp_path / "completions.db"), ttl=60)
+    cache.set(_request("q"), "answer")
+    clock.now += 59
+    assert cache.get(_request("q")) == "answer"
+    clock.now += 2
+    assert cache.get(_request("q")) is None
+    cache.prune()
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entries_over_max_entries_are_evicted(tmp_path, clock):
+    cache = CompletionCache(str(tmp_path / "completions.db"), max_entries=2, prune_every=1)
+    cache.set(_request("a"), "A")
+    clock.now += 100
+    cache.set(_request("b"), "B")
+    clock.now += 100
+    assert cache.get(_request("a")) == "A"  # touched: now more recent than "b"
+    clock.now += 100
+    cache.set(_request("c"), "C")  # the third write prunes
+    assert cache.stats()["size"] == 2
+    assert cache.get(_request("b")) is None
+    assert cache.get(_request("a")) == "A" and cache.get(_request("c")) == "C"
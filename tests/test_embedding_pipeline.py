@@ -0,0 +1,92 @@
+import threading
+
+from embedding_pipeline import EmbeddingPipeline
+
+
+def _notes(n):
+    return [{"_id": f"n{i}", "user_id": 1, "text": f"note {i}"} for i in range(n)]
+
+
+def test_notes_are_embedded_in_batches():
+    batches = []
+    pipeline = EmbeddingPipeline(lambda notes: batches.append(len(notes)) and [], batch_size=4, workers=1,
+                                 max_wait=0.05)
+    pipeline.submit(_notes(10))
+    assert pipeline.flush(5)
+    assert sum(batches) == 10 and max(batches) <= 4
+    assert pipeline.stats()["embedded"] == 10 and pipeline.pending() == []
+
+
+def test_failed_notes_are_retried_then_given_up():
+    attempts = {}
+    given_up = []
+
+    def embed(notes):
+        for note in notes:
+            attempts[note["_id"]] = attempts.get(note["_id"], 0) + 1
+        # n0 never embeds, n1 fails its first attempt
+        return [note for note in notes if note["_id"] == "n0" or (note["_id"] == "n1" and attempts["n1"] == 1)]
+
+    pipeline = EmbeddingPipeline(embed, workers=1, max_wait=0, max_attempts=3, base_backoff=0.01,
+                                 on_failed=given_up.extend)
+    pipeline.submit(_notes(3))
+    assert pipeline.flush(5)
+    assert attempts == {"n0": 3, "n1": 2, "n2": 1}
+    assert [note["_id"] for note in given_up] == ["n0"]
+    stats = pipeline.stats()
+    assert (stats["embedded"], stats["retries"], stats["failed"]) == (2, 3, 1)
+
+
+def test_a_raising_batch_fails_every_note_in_it():
+    calls = []
+
+    def embed(notes):
+        calls.append(len(notes))
+        if len(calls) == 1:
+            raise ConnectionError("embedding service down")
+        return []
+
+    pipeline = EmbeddingPipeline(embed, batch_size=8, workers=1, max_wait=0.05, base_backoff=0.01)
+    pipeline.submit(_notes(3))
+    assert pipeline.flush(5)
+    assert calls == [3, 3]
+    assert pipeline.stats()["retries"] == 3 and pipeline.stats()["embedded"] == 3
+
+
+def test_shutdown_errors_are_not_failures():
+    given_up = []
+
+    def embed(notes):
+        raise RuntimeError("cannot schedule new futures after interpreter shutdown")
+
+    pipeline = EmbeddingPipeline(embed, workers=1, max_wait=0, max_attempts=1, on_failed=given_up.extend)
+    pipeline.submit(_notes(2))
+    assert pipeline.flush(5)
+    assert given_up == [] and pipeline.stats()["failed"] == 0
+    # Closed: later notes stay pending in the store for the next process
+    pipeline.submit(_notes(1))
+    assert pipeline.stats()["submitted"] == 2
+
+
+def test_close_drains_before_stopping():
+    release = threading.Event()
+    pipeline = EmbeddingPipeline(lambda notes: release.wait(5) and [], workers=2, max_wait=0)
+    pipeline.submit(_notes(4))
+    assert not pipeline.close(timeout=0.05)
+    # The batch already being embedded still completes
+    release.set()
+    assert pipeline.flush(5)
+    assert pipeline.stats()["embedded"] == 4
+    pipeline.submit(_notes(1))
+    assert pipeline.stats()["submitted"] == 4
+
+
+def test_cancel_drops_a_queued_note():
+    release = threading.Event()
+    pipeline = EmbeddingPipeline(lambda notes: release.wait(5) and [], batch_size=1, workers=1, max_wait=0)
+    pipeline.submit(_notes(3))
+    assert pipeline.cancel("n2")
+    assert not pipeline.cancel("missing")
+    release.set()
+    assert pipeline.flush(5)
+    assert pipeline.stats()["embedded"] == 2
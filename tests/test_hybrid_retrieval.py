@@ -0,0 +1,89 @@
+import pytest
+
+from context_packer import select_notes
+from lexical_index import LexicalIndex, rrf_fuse
+
+
+NOTES = [
+    {"_id": "a", "text": "Paid off the credit card balance in March"},
+    {"_id": "b", "text": "Saving for a house deposit every month"},
+    {"_id": "c", "text": "Credit card interest is 24 percent"},
+]
+
+
+def test_bm25_hits_carry_a_relative_score_not_a_similarity():
+    index = LexicalIndex(lambda user_id: NOTES)
+    hits = index.search(1, "credit card interest", k=3)
+    assert [hit["_id"] for hit in hits] == ["c", "a"]
+    assert hits[0]["$bm25_rel"] == 1.0
+    assert 0 < hits[1]["$bm25_rel"] < 1
+    assert all("$similarity" not in hit for hit in hits)
+
+
+def test_rrf_fuse_sums_reciprocal_ranks():
+    vector = [{"_id": "a", "$similarity": 0.9}, {"_id": "b", "$similarity": 0.8}]
+    keyword = [{"_id": "b", "$bm25": 3.0}, {"_id": "c", "$bm25": 1.0}]
+    fused = rrf_fuse([vector, keyword], limit=3, k=60)
+    assert [doc["_id"] for doc in fused] == ["b", "a", "c"]
+    assert fused[0]["$rrf"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[0]["$similarity"] == 0.8 and fused[0]["$bm25"] == 3.0
+    # Keyword-only hits have no cosine score
+    assert "$similarity" not in fused[2]
+    assert len(rrf_fuse([vector, keyword], limit=1)) == 1
+
+
+def _doc(text, similarity=None, rrf=None):
+    return {"text": text, "similarity_score": similarity, "rrf_score": rrf}
+
+
+def test_fused_notes_are_packed_in_rrf_order():
+    docs = [
+        _doc("vector only note about budgets", similarity=0.9, rrf=1 / 61),
+        _doc("keyword only note about credit cards", rrf=1 / 62),
+        _doc("note found by both searches", similarity=0.7, rrf=1 / 61 + 1 / 63),
+    ]
+    notes, counts = select_notes(docs, min_similarity=0.55)
+    assert [note["text"] for note in notes] == [docs[2]["text"], docs[0]["text"], docs[1]["text"]]
+    assert counts["below_similarity"] == 0
+
+
+def test_mmr_diversifies_fused_results():
+    docs = [
+        _doc("pay the credit card before the car loan this year", similarity=0.9, rrf=1 / 61 + 1 / 61),
+        _doc("pay the credit card before the car loan next year", similarity=0.88, rrf=1 / 62 + 1 / 62),
+        _doc("open a high yield savings account", rrf=1 / 63),
+    ]
+    notes, _ = select_notes(docs, duplicate_threshold=0.9, mmr_lambda=0.5)
+    # The near-duplicate second hit drops below the different third one
+    assert [note["text"] for note in notes] == [docs[0]["text"], docs[2]["text"], docs[1]["text"]]
+
+
+def test_keyword_only_results_are_diversified_on_relative_bm25():
+    docs = [
+        {"text": "credit card interest rate is high", "keyword_score": 1.0},
+        {"text": "credit card interest rate is too high", "keyword_score": 0.95},
+        {"text": "credit limit raised", "keyword_score": 0.6},
+    ]
+    notes, _ = select_notes(docs, duplicate_threshold=0.9, mmr_lambda=0.5)
+    assert [note["text"] for note in notes] == [docs[0]["text"], docs[2]["text"], docs[1]["text"]]
+
+
+def test_similarity_floor_only_applies_to_cosine_scores():
+    docs = [
+        _doc("relevant vector hit", similarity=0.8),
+        _doc("weak vector hit", similarity=0.2),
+        _doc("keyword hit without a cosine score"),
+    ]
+    notes, counts = select_notes(docs, min_similarity=0.55)
+    assert [note["text"] for note in notes] == ["relevant vector hit", "keyword hit without a cosine score"]
+    assert counts["below_similarity"] == 1
+
+
+def test_mmr_reorders_cosine_results_away_from_near_duplicates():
+    docs = [
+        _doc("save money on groceries every week", similarity=0.9),
+        _doc("save money on groceries every month", similarity=0.89),
+        _doc("invest in an index fund", similarity=0.8),
+    ]
+    notes, _ = select_notes(docs, min_similarity=0.5, duplicate_threshold=0.9, mmr_lambda=0.5)
+    assert [note["text"] for note in notes][:2] == [docs[0]["text"], docs[2]["text"]]
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import LLMScheduler, SchedulerTimeoutError, TokenBucket
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(rate=60)  # one unit per second, bursting to 60
+    now = time.monotonic()
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(2, now + 1) == pytest.approx(1.0)
+    # Larger than the whole bucket: wait for a full bucket, not forever
+    assert bucket.wait_time(600, now) == pytest.approx(60.0)
+    bucket.refund(-10)
+    assert bucket.wait_time(1, now + 1) == pytest.approx(10.0)
+    assert TokenBucket(rate=0).wait_time(10 ** 6, now) == 0
+
+
+def _grant_order(scheduler, requests):
+    """
+    Queue `requests` ((user, priority) pairs, in order) behind a held slot
+    and return the order they are granted in
+    """
+    order = []
+    threads = []
+    with scheduler.slot("holder"):
+        for user_id, priority in requests:
+            def call(user_id=user_id, priority=priority):
+                with scheduler.slot(user_id, priority):
+                    order.append(user_id)
+            thread = threading.Thread(target=call)
+            thread.start()
+            threads.append(thread)
+            # Queue in a known order
+            while scheduler.metrics()["queue_depth"] < len(threads):
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_users_take_turns_within_a_priority():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_in_flight=1)
+    order = _grant_order(scheduler, [("a", "standard")] * 3 + [("b", "standard"), ("c", "standard")])
+    assert order == ["a", "b", "c", "a", "a"]
+
+
+def test_interactive_requests_go_first():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_in_flight=1)
+    order = _grant_order(scheduler, [("batch", "batch"), ("standard", "standard"), ("advice", "interactive")])
+    assert order == ["advice", "standard", "batch"]
+    assert scheduler.metrics()["granted"] == {"interactive": 1, "standard": 2, "batch": 1}
+
+
+def test_rate_limits_delay_grants():
+    scheduler = LLMScheduler(requests_per_minute=600, tokens_per_minute=0, max_in_flight=0)
+    scheduler.requests.level = 1  # burst used up: one request now, then one per 0.1 s
+    started = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot():
+            pass
+    assert 0.18 <= time.monotonic() - started < 1.0
+    assert scheduler.metrics()["rate_limited"] >= 2
+
+
+def test_token_limit_uses_reported_usage():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=6000, max_in_flight=0, queue_timeout=0.2)
+    with scheduler.slot(tokens=100) as slot:
+        slot.used(6000)  # the estimate was far too low
+    with pytest.raises(SchedulerTimeoutError):
+        with scheduler.slot(tokens=100):
+            pass
+    assert scheduler.metrics()["timed_out"] == 1
+    assert scheduler.metrics()["queue_depth"] == 0
+
+
+def test_throttle_pauses_every_grant():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0)
+    scheduler.throttle(0.1)
+    started = time.monotonic()
+    with scheduler.slot():
+        pass
+    assert time.monotonic() - started >= 0.09
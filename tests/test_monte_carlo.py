@@ -0,0 +1,59 @@
+import numpy as np
+
+import monte_carlo
+
+
+PROFILE = {
+    "general": {"age": 35, "monthly_income": 5000, "current_savings": 10000},
+    "budget": {"savings": 1000},
+    "goals": ["Save for Retirement", "Buy a Home", "Build Emergency Fund"],
+}
+
+
+def test_pool_matches_in_process_chunks(monkeypatch):
+    monkeypatch.setattr(monte_carlo, "MONTE_CARLO_PARALLEL_PATHS", 1000)
+    args = (5000.0, 300.0, 10, 0.07, 0.15)
+    pooled = monte_carlo.simulate(*args, paths=4001, seed=7, workers=2)
+    seeds = np.random.SeedSequence(7).spawn(2)
+    local = np.concatenate([monte_carlo.simulate_balances(*args, size, seed)
+                            for size, seed in zip((2001, 2000), seeds)])
+    np.testing.assert_array_equal(pooled, local)
+    # Reproducible from the seed
+    np.testing.assert_array_equal(monte_carlo.simulate(*args, paths=4001, seed=7, workers=2), pooled)
+
+
+def test_without_volatility_the_emergency_fund_is_certain_either_way(monkeypatch):
+    for savings, expected in ((2000, 1.0), (100, 0.0)):
+        profile = {**PROFILE, "budget": {"savings": savings}, "goals": ["Build Emergency Fund"]}
+        results = monte_carlo.goal_probabilities(profile, paths=2000, workers=0)
+        assert results["Build Emergency Fund"]["probability"] == expected
+    # With inflation fixed too every path is the same, so even a close call is all or nothing
+    monkeypatch.setattr(monte_carlo, "INFLATION_VOLATILITY", 0.0)
+    profile = {**PROFILE, "budget": {"savings": 1150}, "goals": ["Build Emergency Fund"]}
+    result = monte_carlo.goal_probabilities(profile, paths=2000, workers=0)["Build Emergency Fund"]
+    assert result["p10"] == result["p90"]
+    assert result["probability"] in (0.0, 1.0)
+
+
+def test_goal_targets():
+    targets = monte_carlo.goal_targets(PROFILE)
+    assert targets["Save for Retirement"] == {"target": 25 * 12 * 4000, "years": 30}
+    assert targets["Buy a Home"]["target"] == 0.2 * 4 * 12 * 5000
+    assert targets["Build Emergency Fund"] == {"target": 6 * 4000, "years": 1}
+    assert "Save for Retirement" not in monte_carlo.goal_targets({**PROFILE, "general": {"age": 70}})
+
+
+def test_results_are_cached_per_profile_version(monkeypatch):
+    import profiles
+
+    runs = []
+    real = monte_carlo.goal_probabilities
+    monkeypatch.setattr(monte_carlo, "goal_probabilities",
+                        lambda profile, paths: runs.append(1) or real(profile, paths, workers=0))
+    profile_id = "monte-carlo-test"
+    first = monte_carlo.cached_goal_probabilities(profile_id, PROFILE, paths=500)
+    assert monte_carlo.cached_goal_probabilities(profile_id, PROFILE, paths=500) is first
+    assert len(runs) == 1
+    profiles.profile_versions.bump(profile_id)  # the profile was saved
+    monte_carlo.cached_goal_probabilities(profile_id, PROFILE, paths=500)
+    assert len(runs) == 2
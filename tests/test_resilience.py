@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from resilience import (CallTimeoutError, CircuitOpenError, Dependency, ResilientCollection, is_idempotent,
+                        is_retryable, is_unsent)
+
+
+def _dependency(name, **options):
+    return Dependency(f"test-{name}", **{"timeout": 1.0, "max_retries": 2, "base_delay": 0.001, **options})
+
+
+class _Flaky:
+    """Fails with each of `errors` in turn, then returns "ok" """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _status(code):
+    error = Exception(f"HTTP {code}")
+    error.status_code = code
+    return error
+
+
+def test_error_classification():
+    assert is_retryable(TimeoutError()) and is_retryable(ConnectionResetError())
+    assert is_retryable(_status(503)) and is_retryable(_status(429))
+    assert not is_retryable(_status(400)) and not is_retryable(KeyError("x"))
+    assert not is_retryable(CircuitOpenError())
+    assert is_unsent(ConnectionRefusedError()) and is_unsent(_status(429))
+    assert not is_unsent(ConnectionResetError()) and not is_unsent(CallTimeoutError())
+
+
+def test_retries_transient_errors_only():
+    dependency = _dependency("retries")
+    flaky = _Flaky(ConnectionResetError(), _status(503))
+    assert dependency.call(flaky) == "ok" and flaky.calls == 3
+    bad_request = _Flaky(_status(400))
+    with pytest.raises(Exception, match="HTTP 400"):
+        dependency.call(bad_request)
+    assert bad_request.calls == 1
+    assert dependency.metrics()["retries"] == 2
+
+
+def test_non_idempotent_calls_are_not_retried_once_they_may_have_landed():
+    dependency = _dependency("once")
+    reset = _Flaky(ConnectionResetError())
+    with pytest.raises(ConnectionResetError):
+        dependency.call_once(reset)
+    assert reset.calls == 1
+    refused = _Flaky(ConnectionRefusedError(), _status(429))
+    assert dependency.call_once(refused) == "ok" and refused.calls == 3
+
+
+def test_async_calls_follow_the_same_policy():
+    dependency = _dependency("async")
+
+    async def main():
+        flaky = _Flaky(ConnectionResetError())
+
+        async def attempt():
+            return flaky()
+
+        assert await dependency.acall(attempt) == "ok"
+        once = _Flaky(ConnectionResetError())
+
+        async def write():
+            return once()
+
+        with pytest.raises(ConnectionResetError):
+            await dependency.acall(write, idempotent=False)
+        return flaky.calls, once.calls
+
+    assert asyncio.run(main()) == (2, 1)
+
+
+def test_timeouts_and_the_circuit_breaker():
+    dependency = _dependency("breaker", timeout=0.05, max_retries=0, failure_threshold=2, reset_timeout=0.1)
+    release = threading.Event()
+    for _ in range(2):
+        with pytest.raises(CallTimeoutError):
+            dependency.call(release.wait, 5)
+    assert dependency.metrics()["state"] == "open"
+    fast = _Flaky()
+    with pytest.raises(CircuitOpenError):
+        dependency.call(fast)
+    assert fast.calls == 0
+    release.set()
+    time.sleep(0.1)  # reset_timeout: the next call is a trial
+    assert dependency.call(fast) == "ok"
+    metrics = dependency.metrics()
+    assert metrics["state"] == "closed" and metrics["timeouts"] == 2 and metrics["short_circuited"] == 1
+
+
+def test_collection_writes_pick_the_retry_policy():
+    assert is_idempotent("find_one", ({"_id": 1},), {})
+    assert is_idempotent("update_one", ({"_id": 1}, {"$set": {"a": 1}}), {})
+    assert not is_idempotent("update_one", ({"_id": 1}, {"$inc": {"a": 1}}), {})
+    assert not is_idempotent("update_one", ({"_id": 1},), {"update": {"$push": {"a": 1}}})
+    assert not is_idempotent("insert_one", ({"a": 1},), {})
+
+    inserts = _Flaky(ConnectionResetError())
+    updates = _Flaky(ConnectionResetError())
+    collection = ResilientCollection(SimpleNamespace(insert_one=inserts, update_one=updates),
+                                     _dependency("collection"))
+    with pytest.raises(ConnectionResetError):
+        collection.insert_one({"a": 1})
+    assert collection.update_one({"_id": 1}, {"$set": {"a": 1}}) == "ok"
+    assert (inserts.calls, updates.calls) == (1, 2)
@@ -0,0 +1,37 @@
+import pytest
+
+from router import route_question
+
+
+@pytest.mark.parametrize("question, route, intent", [
+    # Calculations the calculators answer
+    ("How much should I save for emergencies?", "calculator", "emergency_fund"),
+    ("How long until my emergency fund is complete?", "calculator", "emergency_fund"),
+    ("How many months of expenses is my emergency fund?", "calculator", "emergency_fund"),
+    ("How long to pay off my credit card at $300 a month?", "calculator", "debt_payoff"),
+    ("When will I be debt-free?", "calculator", "debt_payoff"),
+    ("Calculate my debt payoff at 18%", "calculator", "debt_payoff"),
+    ("How much will I have in 10 years if I save $500 a month?", "calculator", "savings_projection"),
+    ("What's my savings rate?", "calculator", "savings_rate"),
+    ("How much should I spend on rent?", "calculator", "budget_breakdown"),
+    ("Break down my budget", "calculator", "budget_breakdown"),
+    # Advice, and calculations the calculators don't do
+    ("How long will my emergency fund last if I lose my job?", "llm", "emergency_fund"),
+    ("How long would my savings last without income?", "llm", None),
+    ("Why is an emergency fund important?", "llm", "emergency_fund"),
+    ("Should I invest in index funds or pay off debt?", "llm", "debt_payoff"),
+    ("What are the pros and cons of a Roth IRA?", "llm", None),
+    ("Is crypto a good investment?", "llm", None),
+    ("Give me tips to cut my grocery spending", "llm", None),
+])
+def test_route_question(question, route, intent):
+    routing = route_question(question)
+    assert (routing["route"], routing["intent"]) == (route, intent)
+    assert 0 <= routing["confidence"] <= 1
+
+
+def test_threshold_controls_the_route():
+    question = "How much should I save for emergencies?"
+    confidence = route_question(question)["confidence"]  # rounded to 3 places
+    assert route_question(question, threshold=confidence - 0.001)["route"] == "calculator"
+    assert route_question(question, threshold=confidence + 0.001)["route"] == "llm"
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _concurrently(flights, n, fn):
+    """n threads calling flights.do("key", ...) at once; the call runs fn once all have joined"""
+    release = threading.Event()
+
+    def call():
+        release.wait(5)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(flights.do, "key", call) for _ in range(n)]
+        while flights.stats()["calls"] < n:
+            time.sleep(0.001)
+        release.set()
+    return [future.exception() or future.result() for future in futures]
+
+
+def test_identical_concurrent_calls_run_once_and_get_their_own_copy():
+    flights = SingleFlight("test")
+    runs = []
+    results = _concurrently(flights, 8, lambda: runs.append(1) or {"plan": ["save"]})
+    assert len(runs) == 1
+    assert all(result == {"plan": ["save"]} for result in results)
+    assert len({id(result) for result in results}) == 8
+    results[0]["plan"].append("mutated")
+    assert results[1] == {"plan": ["save"]}
+    assert flights.stats()["collapsed"] == 7 and flights.stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_waiting_caller():
+    flights = SingleFlight("test")
+
+    def fail():
+        raise ConnectionError("store down")
+
+    results = _concurrently(flights, 4, fail)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    # A failed flight isn't remembered: the next call runs again
+    assert flights.do("key", lambda: "ok") == "ok"
+
+
+def test_async_callers_share_flights():
+    flights = SingleFlight("test")
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"n": 1}
+
+    async def main():
+        return await asyncio.gather(*(flights.ado("key", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(runs) == 1 and results == [{"n": 1}] * 5
+
+
+def test_begin_lands_once_and_followers_wait():
+    flights = SingleFlight("test")
+    flight, land = flights.begin("key")
+    follower_flight, follower_land = flights.begin("key")
+    assert follower_land is None and follower_flight is flight
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(flights.follow, flight)
+        land({"answer": "done"})
+        land(error=RuntimeError("too late"))
+        assert follower.result(5) == {"answer": "done"}
+    assert flights.stats()["in_flight"] == 0
+
+    flight, land = flights.begin("key")
+    land(error=RuntimeError("stream closed"))
+    with pytest.raises(RuntimeError, match="stream closed"):
+        flights.follow(flight)
+
+
+@pytest.fixture
+def profile():
+    import profiles
+
+    _, profile = profiles.create_profile(424242)
+    return profile
+
+
+def test_streamed_answers_are_shared_with_identical_calls(profile, monkeypatch):
+    import ai
+
+    monkeypatch.setattr(ai, "RAG_TOOLS", False)
+    question = "Why should I keep an emergency fund, streamed?"
+    leader = ai.ask_ai_with_rag_stream(profile, question, 424242)
+    assert "stream" in leader
+    collapsed = ai.rag_flights.stats()["collapsed"]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        followers = [pool.submit(ai.ask_ai_with_rag_stream, profile, question, 424242) for _ in range(2)]
+        while ai.rag_flights.stats()["collapsed"] < collapsed + 2:
+            time.sleep(0.001)
+        streamed = "".join(leader["stream"])
+        results = [follower.result(5) for follower in followers]
+    assert streamed == leader["response"]
+    assert all(result["response"] == streamed and "stream" not in result for result in results)
+
+
+def test_abandoned_stream_fails_waiting_callers(profile, monkeypatch):
+    import ai
+
+    monkeypatch.setattr(ai, "RAG_TOOLS", False)
+    monkeypatch.setattr(ai, "RAG_CACHE", False)
+    question = "How do I pay down my card, abandoned?"
+    leader = ai.ask_ai_with_rag_stream(profile, question, 424242)
+    next(leader["stream"])
+    collapsed = ai.rag_flights.stats()["collapsed"]
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(ai.ask_ai_with_rag_stream, profile, question, 424242)
+        while ai.rag_flights.stats()["collapsed"] == collapsed:
+            time.sleep(0.001)
+        leader["stream"].close()
+        with pytest.raises(RuntimeError, match="closed before it was complete"):
+            follower.result(5)
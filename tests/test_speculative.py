@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+import speculative
+from speculative import SpeculativeTasks
+
+
+def test_stale_tasks_are_cancelled_if_queued_and_discarded_if_running():
+    tasks = SpeculativeTasks(max_workers=1)
+    gate = threading.Event()
+    running = tasks.start("p1", "running", "v1", gate.wait, 5)
+    queued = tasks.start("p1", "queued", "v1", lambda: "never")
+    assert tasks.start("p1", "queued", "v1", lambda: "again") is queued
+    assert tasks.attach("p1", "queued", "v2") is None
+    assert queued.cancelled()
+    assert tasks.attach("p1", "running", "v2") is None
+    gate.set()
+    assert running.result(5) is True
+    stats = tasks.stats()
+    assert (stats["cancelled"], stats["discarded"], stats["missed"], stats["reused"]) == (1, 1, 2, 1)
+    assert stats["tasks"] == 0
+
+
+def test_attach_returns_the_task_for_matching_inputs():
+    tasks = SpeculativeTasks(max_workers=1)
+    future = tasks.start("p1", "budget", "v1", lambda: {"housing": 1})
+    assert tasks.attach("p1", "budget", "v1") is future
+    assert future.result(5) == {"housing": 1}
+
+
+@pytest.fixture
+def speculation(monkeypatch):
+    import ai
+
+    tasks = SpeculativeTasks(max_workers=1)
+    computed = []
+    monkeypatch.setattr(speculative, "speculation", tasks)
+    monkeypatch.setattr(ai, "get_budget", lambda general, goals, user_id=None: computed.append(
+        dict(general)) or {"income": general["monthly_income"]})
+    return tasks, computed
+
+
+def test_budget_for_uses_the_speculative_budget_while_current(speculation):
+    tasks, computed = speculation
+    profile = {"general": {"monthly_income": 5000}, "goals": ["Buy a Home"]}
+    speculative.speculate_profile(1, profile)
+    assert speculative.budget_for(1, profile) == {"income": 5000}
+    assert len(computed) == 1 and tasks.stats()["attached"] == 1
+
+
+def test_budget_for_falls_back_to_get_budget_after_a_change(speculation):
+    tasks, computed = speculation
+    profile = {"general": {"monthly_income": 5000}, "goals": ["Buy a Home"]}
+    speculative.speculate_profile(1, profile)
+    tasks._executor.submit(lambda: None).result(5)  # the speculative budget has run
+    changed = {**profile, "general": {"monthly_income": 6000}}
+    assert speculative.budget_for(1, changed) == {"income": 6000}
+    assert computed == [{"monthly_income": 5000}, {"monthly_income": 6000}]
+    assert tasks.stats()["discarded"] == 1 and tasks.stats()["missed"] == 1
+
+
+def test_sync_and_async_rag_pack_the_same_speculative_summary(monkeypatch):
+    import asyncio
+    import ai
+
+    monkeypatch.setattr(speculative, "profile_summary", lambda profile_id, profile: "SPECULATIVE SUMMARY")
+    profile = {"general": {"monthly_income": 5000}, "goals": ["Buy a Home"]}
+    question = "What should I prioritise this year?"
+    sync = ai._prepare_rag(profile, question, 987)
+    async_ = asyncio.run(ai._aprepare_rag(profile, question, 987))
+    assert "SPECULATIVE SUMMARY" in sync["augmented_prompt"]
+    assert async_["augmented_prompt"] == sync["augmented_prompt"]
+    assert async_["packing"] == sync["packing"]
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+from storage import SQLiteBackend, matches
+
+
+@pytest.fixture
+def notes():
+    collection = SQLiteBackend(":memory:").get_collection("notes")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    collection.insert_many([
+        {"_id": f"n{i}", "user_id": i % 2, "text": f"note {i}", "priority": i % 3,
+         "metadata": {"injested": start + timedelta(days=i)}}
+        for i in range(10)
+    ])
+    return collection
+
+
+def test_matches_operators():
+    doc = {"a": 5, "b": {"c": "x"}, "tags": "t"}
+    assert matches(doc, {"a": {"$gte": 5, "$lt": 6}})
+    assert matches(doc, {"b.c": "x", "missing": {"$exists": False}})
+    assert matches(doc, {"$or": [{"a": 1}, {"tags": {"$in": ["t", "u"]}}]})
+    assert not matches(doc, {"$and": [{"a": 5}, {"b.c": {"$ne": "x"}}]})
+    assert not matches(doc, {"missing": {"$gt": 0}})
+    with pytest.raises(ValueError):
+        matches(doc, {"$nor": []})
+
+
+def test_find_filters_on_indexed_and_unindexed_fields(notes):
+    found = notes.find({"user_id": 1, "priority": {"$in": [0, 1]}}).to_list()
+    assert sorted(doc["_id"] for doc in found) == ["n1", "n3", "n7", "n9"]
+    assert notes.count_documents({"user_id": 0}) == 5
+    assert notes.find_one({"_id": "n4"}, projection={"text": 1}) == {"_id": "n4", "text": "note 4"}
+
+
+def test_indexed_sort_pages_like_an_in_memory_sort(notes):
+    newest = notes.find({"user_id": 0}, sort={"metadata.injested": -1}, limit=2).to_list()
+    assert [doc["_id"] for doc in newest] == ["n8", "n6"]
+    after = newest[-1]["metadata"]["injested"]
+    older = notes.find({"user_id": 0, "metadata.injested": {"$lt": after}},
+                       sort={"metadata.injested": -1}).to_list()
+    assert [doc["_id"] for doc in older] == ["n4", "n2", "n0"]
+    by_priority = notes.find({}, sort={"priority": 1, "_id": -1}, skip=1, limit=3).to_list()
+    assert [doc["_id"] for doc in by_priority] == ["n6", "n3", "n0"]
+
+
+def test_sort_on_id_uses_the_global_index():
+    profiles = SQLiteBackend(":memory:").get_collection("profiles")
+    profiles.insert_many([{"id": f"{i:03d}"} for i in (5, 1, 9, 3)])
+    page = profiles.find({"id": {"$gt": "001"}}, sort={"id": 1}, limit=2).to_list()
+    assert [doc["id"] for doc in page] == ["003", "005"]
+    plan = profiles.backend.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT doc FROM profiles ORDER BY "
+        "COALESCE(json_extract(doc, '$.id.\"$date\"'), json_extract(doc, '$.id')), \"_id\""
+    ).fetchall()
+    assert any("idx_profiles_sorted_id" in row[-1] for row in plan)
+
+
+def test_insert_many_is_all_or_nothing(notes):
+    with pytest.raises(ValueError):
+        notes.insert_many([{"_id": "new"}, {"_id": "n0"}])
+    assert notes.find_one({"_id": "new"}) is None
+    assert notes.count_documents({}) == 10
+
+
+def test_updates_and_upsert(notes):
+    assert notes.update_one({"_id": "n0"}, {"$set": {"text": "edited"}, "$unset": {"priority": ""}}).modified_count == 1
+    assert notes.find_one({"_id": "n0"})["text"] == "edited"
+    assert "priority" not in notes.find_one({"_id": "n0"})
+    result = notes.update_one({"id": "p1"}, {"$set": {"name": "x"}, "$setOnInsert": {"created": True}}, upsert=True)
+    assert result.upserted_id is not None
+    assert notes.find_one({"id": "p1"}) | {"_id": None} == {"_id": None, "id": "p1", "name": "x", "created": True}
+    assert notes.update_many({"user_id": 1}, {"$set": {"seen": True}}).modified_count == 5
+    assert notes.delete_one({"_id": "n1"}).deleted_count == 1
+    with pytest.raises(ValueError):
+        notes.update_one({"_id": "n2"}, {"$inc": {"priority": 1}})
+
+
+def test_local_collections_resolve_without_a_bootstrap_warning(capsys):
+    db.LazyCollection("fresh_sync").resolve()
+
+    async def resolve():
+        db.LazyAsyncCollection("fresh_async").resolve()
+
+    # asyncio.run makes a new loop (and so a new handle) every time
+    asyncio.run(resolve())
+    asyncio.run(resolve())
+    assert "bootstrap" not in capsys.readouterr().out
+
+
+def test_bootstrap_warning_is_printed_once_per_collection(monkeypatch, capsys):
+    class Remote(SQLiteBackend):
+        creates_on_demand = False
+
+    monkeypatch.setattr(db, "_backend", Remote(":memory:"))
+    monkeypatch.setattr(db, "_existing_collections", None)
+    monkeypatch.setattr(db, "_reported_missing", set())
+    db.warn_if_missing("missing")
+    db.warn_if_missing("missing")
+    assert capsys.readouterr().out.count("python db.py bootstrap") == 1
@@ -0,0 +1,54 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import ai
+from ai import StreamFormatter, format_rag_response
+
+
+ANSWER = (
+    "**Monthly plan:** put $500Monthly into savings, which is $6000.00 peryear.\n\n"
+    "* Rent: $1,200.00 (30%)\n* Food 2+2 = 4 meals permonth\n\n"
+    "Total: $1,700.00 per month."
+)
+
+
+def _formatted(chunks):
+    formatter = StreamFormatter()
+    return "".join(formatter.feed(chunk) for chunk in chunks) + formatter.finish()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunked_formatting_matches_formatting_the_whole_answer(seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(ANSWER)), 12))
+    chunks = [ANSWER[start:stop] for start, stop in zip([0] + cuts, cuts + [len(ANSWER)])]
+    assert _formatted(chunks) == format_rag_response(ANSWER)
+
+
+def test_patterns_split_mid_token_wait_for_the_rest():
+    formatter = StreamFormatter()
+    assert formatter.feed("Save $50") == "Save "
+    assert formatter.feed("0Monthly and ") == "\\$500 Monthly and "
+    assert formatter.feed("**bold") == ""
+    assert formatter.finish() == "**bold"
+    assert _formatted(["per", "month", " $1", "0.00"]) == format_rag_response("permonth $10.00")
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+
+
+def test_error_mid_stream_ends_with_the_error_text(monkeypatch):
+    def broken_stream():
+        yield _chunk("Start saving $10")
+        yield _chunk("0Monthly now")
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(ai, "_open_rag_stream", lambda prompt, user_id, tier: ([], broken_stream()))
+    generation = {}
+    parts = list(ai.stream_rag_response("prompt", None, generation))
+    assert "".join(parts[:-1]) == "Start saving \\$100 Monthly now\n\n"
+    assert parts[-1] == "Error generating response: connection reset"
+    assert generation["model"]
@@ -0,0 +1,83 @@
+import json
+import os
+
+from vector_index import HashingEmbedder, LocalVectorIndex
+
+
+class Store:
+    """Notes per user, standing in for the notes collection"""
+
+    def __init__(self, notes):
+        self.notes = list(notes)
+
+    def load(self, user_id):
+        return [note for note in self.notes if note["user_id"] == user_id]
+
+
+def note(note_id, text, user_id=1):
+    return {"_id": note_id, "text": text, "user_id": user_id}
+
+
+def saved_ids(index, user_id=1):
+    with open(os.path.join(index._path(user_id), "docs.json")) as f:
+        return sorted(json.load(f)["ids"])
+
+
+def ids(index, user_id=1):
+    return sorted(index._user(user_id).ids)
+
+
+def test_changes_are_saved_in_batches_and_on_flush(tmp_path):
+    store = Store([note("a", "emergency fund savings")])
+    index = LocalVectorIndex(HashingEmbedder(64), store.load, directory=str(tmp_path), persist_every=3)
+    index.search(1, ["savings"])
+    assert saved_ids(index) == ["a"]
+
+    index.add(1, [note("b", "credit card balance")])
+    index.remove("a")
+    assert saved_ids(index) == ["a"]
+    assert index._dirty == {1: 2}
+
+    index.add(1, [note("c", "house deposit")])  # third change writes the batch
+    assert index._dirty == {}
+    assert saved_ids(index) == ["b", "c"]
+
+    index.add(1, [note("d", "car loan")])
+    index.flush()
+    assert index._dirty == {}
+    assert saved_ids(index) == ["b", "c", "d"]
+
+
+def test_saved_index_is_reconciled_with_the_store_on_load(tmp_path):
+    store = Store([note("a", "emergency fund savings"), note("b", "credit card balance")])
+    index = LocalVectorIndex(HashingEmbedder(64), store.load, directory=str(tmp_path))
+    assert ids(index) == ["a", "b"]
+
+    # Another process adds one note and deletes another
+    store.notes = [note("b", "credit card balance"), note("c", "house deposit every month")]
+    fresh = LocalVectorIndex(HashingEmbedder(64), store.load, directory=str(tmp_path))
+    assert ids(fresh) == ["b", "c"]
+    assert fresh.search(1, ["house deposit"], k=1)[0][0]["_id"] == "c"
+
+    # The repaired copy was saved, so a third process loads it as is
+    store.notes.append(note("d", "ignored", user_id=2))
+    again = LocalVectorIndex(HashingEmbedder(64), store.load, directory=str(tmp_path))
+    assert ids(again) == ["b", "c"]
+
+
+def test_add_after_load_does_not_embed_reconciled_notes_twice(tmp_path):
+    store = Store([note("a", "emergency fund savings")])
+    LocalVectorIndex(HashingEmbedder(64), store.load, directory=str(tmp_path)).search(1, ["savings"])
+
+    embedded = []
+
+    class CountingEmbedder(HashingEmbedder):
+        def embed(self, texts):
+            embedded.extend(texts)
+            return super().embed(texts)
+
+    store.notes.append(note("b", "credit card balance"))
+    index = LocalVectorIndex(CountingEmbedder(64), store.load, directory=str(tmp_path))
+    index.add(1, [note("b", "credit card balance")])
+    assert embedded == ["credit card balance"]
+    assert ids(index) == ["a", "b"]
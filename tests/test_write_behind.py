@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from write_behind import (WriteBehindQueue, apply_set, diff_paths, merge_set, orphaned_journals,
+                          process_journal_path)
+
+
+def test_diff_paths_sets_only_changed_fields():
+    old = {"general": {"name": "A", "age": 30}, "budget": {"food": 1, "rent": 2}, "goals": ["x"]}
+    new = {"general": {"name": "A", "age": 31}, "budget": {"food": 1}, "goals": ["x", "y"], "notes": 1}
+    assert diff_paths(old, new) == {
+        "general.age": 31,
+        "budget": {"food": 1},  # lost a key: replaced whole
+        "goals": ["x", "y"],
+        "notes": 1,
+    }
+    assert apply_set(old, diff_paths(old, new)) == new
+    assert diff_paths(new, new) == {}
+    assert diff_paths({"a": 1}, {"a": 1.0}) == {"a": 1.0}
+
+
+def test_merge_set_never_leaves_overlapping_paths():
+    pending = {"budget.food": 1, "general.age": 30}
+    merge_set(pending, {"budget": {"rent": 2}})
+    assert pending == {"budget": {"rent": 2}, "general.age": 30}
+    merge_set(pending, {"budget.food": 3, "general.age": 31})
+    assert pending == {"budget": {"rent": 2, "food": 3}, "general.age": 31}
+
+
+def test_submits_coalesce_into_one_write():
+    writes = []
+    queue = WriteBehindQueue(lambda key, updates: writes.append((key, updates)), interval=0.05)
+    queue.submit(1, {"general.age": 30})
+    queue.submit(1, {"general.age": 31, "budget.food": 5})
+    assert queue.pending(1) == {"general.age": 31, "budget.food": 5}
+    assert queue.flush(5)
+    assert writes == [(1, {"general.age": 31, "budget.food": 5})]
+    assert queue.stats()["coalesced"] == 1
+
+
+def test_failed_writes_are_retried():
+    attempts = []
+
+    def flaky(key, updates):
+        attempts.append(updates)
+        if len(attempts) < 3:
+            raise ConnectionError("store down")
+
+    queue = WriteBehindQueue(flaky, interval=0.01, base_backoff=0.01)
+    queue.submit("k", {"a": 1})
+    assert queue.flush(5)
+    assert len(attempts) == 3
+    assert queue.stats()["failures"] == 2
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_replays_only_journals_of_exited_processes(tmp_path):
+    base = str(tmp_path / "journal.json")
+    dead = process_journal_path(base, _dead_pid())
+    live = process_journal_path(base, os.getppid())
+    for path, value in ((dead, 1), (live, 2)):
+        with open(path, "w") as f:
+            json.dump([["p1", {"general.age": value}]], f)
+    assert orphaned_journals(base) == [dead]
+
+    writes = []
+    done = threading.Event()
+    queue = WriteBehindQueue(lambda key, updates: (writes.append((key, updates)), done.set()),
+                             interval=0.01, journal_path=base)
+    assert queue.pending("p1") == {"general.age": 1}
+    assert done.wait(5) and queue.flush(5)
+    assert writes == [("p1", {"general.age": 1})]
+    # The orphan was claimed and removed; the live process's journal is untouched
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(live)]
+
+
+def test_journal_is_removed_once_drained(tmp_path):
+    gate = threading.Event()
+    queue = WriteBehindQueue(lambda key, updates: gate.wait(5), interval=0.01,
+                             journal_path=str(tmp_path / "journal.json"))
+    queue.submit("p1", {"a": 1})
+    with open(queue.journal_path) as f:
+        assert json.load(f) == [["p1", {"a": 1}]]
+    gate.set()
+    assert queue.flush(5)
+    assert not os.path.exists(queue.journal_path)
@@ -0,0 +1,403 @@
+"""
+Local in-process vector retrieval for financial notes
+
+Instead of a server-side $vectorize sort per question, each user's notes are
+held as one NumPy matrix of normalized embeddings and searched with a single
+matrix product. Enable with LOCAL_VECTOR_INDEX=1.
+
+- Embedders are pluggable (anything with embed(texts) -> (n, dim) array).
+  HashingEmbedder is deterministic and dependency-free, for offline use and
+  tests; SentenceTransformerEmbedder wraps a local model when installed.
+- Storage can be float32, float16 or int8 (per-row scale), and persisted
+  per user as .npy files that are memory-mapped on load.
+- The index is updated incrementally as notes are added and deleted.
+  Persisted copies are rewritten every persist_every changes and at exit,
+  and reconciled with the note store when they are loaded.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from resilience import register_exit
+
+
+# ---------------------------------------------------------------------------
+# Embedders
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class HashingEmbedder:
+    """
+    Deterministic feature-hashing embedder: word unigrams and bigrams are
+    hashed (blake2b, stable across processes) into signed buckets.
+    No model download, identical output on every machine.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        tokens = tokenize(text)
+        yield from tokens
+        yield from (f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=64, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def create_embedder(spec: str = "hashing"):
+    """'hashing', 'hashing:<dim>' or 'sentence-transformers:<model>'"""
+    kind, _, arg = spec.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(arg) if arg else 1024)
+    if kind == "sentence-transformers":
+        return SentenceTransformerEmbedder(arg or "all-MiniLM-L6-v2")
+    raise ValueError(f"Unknown embedder '{spec}'")
+
+
+# ---------------------------------------------------------------------------
+# Per-user index
+# ---------------------------------------------------------------------------
+
+DTYPES = ("float32", "float16", "int8")
+SEARCH_BLOCK_ROWS = 8192
+
+
+class UserVectorIndex:
+    """
+    One user's note embeddings as a (capacity, dim) matrix.
+
+    Rows [0, size) are live. Appends grow the buffer geometrically; deletes
+    move the last row into the freed slot, so both are O(dim) amortized.
+    """
+
+    def __init__(self, dim: int, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        self.dim = dim
+        self.dtype = dtype
+        self.size = 0
+        self.ids: List[str] = []
+        self.docs: List[dict] = []
+        self._row: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dim), dtype=np.dtype(dtype))
+        self._scales = np.zeros(0, dtype=np.float32)  # int8 only
+
+    # --- storage -----------------------------------------------------------
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            return quantized, scales.astype(np.float32)
+        return vectors.astype(self.dtype), np.ones(len(vectors), dtype=np.float32)
+
+    def _reserve(self, rows: int):
+        capacity = len(self._matrix)
+        if self.size + rows <= capacity and self._matrix.flags.writeable:
+            return
+        new_capacity = max(self.size + rows, capacity * 2, 16)
+        matrix = np.zeros((new_capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:self.size] = self._matrix[:self.size]
+        scales = np.ones(new_capacity, dtype=np.float32)
+        scales[:self.size] = self._scales[:self.size]
+        self._matrix, self._scales = matrix, scales
+
+    def vectors(self) -> np.ndarray:
+        """Live rows as float32 (dequantized)"""
+        matrix = self._matrix[:self.size].astype(np.float32)
+        if self.dtype == "int8":
+            matrix *= self._scales[:self.size, None]
+        return matrix
+
+    # --- updates -----------------------------------------------------------
+
+    def add(self, ids: List[str], vectors: np.ndarray, docs: List[dict]):
+        fresh = [i for i, note_id in enumerate(ids) if note_id not in self._row]
+        for i, note_id in enumerate(ids):
+            if note_id in self._row:  # re-embedded note: overwrite in place
+                row = self._row[note_id]
+                quantized, scales = self._quantize(vectors[i:i + 1])
+                self._reserve(0)
+                self._matrix[row], self._scales[row] = quantized[0], scales[0]
+                self.docs[row] = docs[i]
+        if not fresh:
+            return
+        quantized, scales = self._quantize(vectors[fresh])
+        self._reserve(len(fresh))
+        self._matrix[self.size:self.size + len(fresh)] = quantized
+        self._scales[self.size:self.size + len(fresh)] = scales
+        for offset, i in enumerate(fresh):
+            self._row[ids[i]] = self.size + offset
+            self.ids.append(ids[i])
+            self.docs.append(docs[i])
+        self.size += len(fresh)
+
+    def remove(self, note_id: str) -> bool:
+        row = self._row.pop(note_id, None)
+        if row is None:
+            return False
+        self._reserve(0)
+        last = self.size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._scales[row] = self._scales[last]
+            self.ids[row] = self.ids[last]
+            self.docs[row] = self.docs[last]
+            self._row[self.ids[row]] = row
+        self.ids.pop()
+        self.docs.pop()
+        self.size -= 1
+        return True
+
+    # --- search ------------------------------------------------------------
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, cosine) per query row, for a batch of normalized queries"""
+        if self.size == 0:
+            return [[] for _ in range(len(queries))]
+        queries = queries.astype(np.float32)
+        scores = np.empty((len(queries), self.size), dtype=np.float32)
+        # Dequantize block by block so peak memory stays small for big indexes
+        for start in range(0, self.size, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, self.size)
+            scores[:, start:end] = queries @ self._matrix[start:end].astype(np.float32).T
+        if self.dtype == "int8":
+            scores *= self._scales[:self.size]
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for q in range(len(queries)):
+            rows = top[q][np.argsort(-scores[q, top[q]])]
+            results.append([(int(r), float(scores[q, r])) for r in rows])
+        return results
+
+    # --- persistence -------------------------------------------------------
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self._matrix[:self.size])
+        np.save(os.path.join(directory, "scales.npy"), self._scales[:self.size])
+        with open(os.path.join(directory, "docs.json"), "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "ids": self.ids, "docs": self.docs},
+                      f, default=str)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "UserVectorIndex":
+        with open(os.path.join(directory, "docs.json")) as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], meta["dtype"])
+        mode = "r" if mmap else None
+        # Memory-mapped and read-only until the first update copies it
+        index._matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mode)
+        index._scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode=mode)
+        index.ids = meta["ids"]
+        index.docs = meta["docs"]
+        index.size = len(index.ids)
+        index._row = {note_id: row for row, note_id in enumerate(index.ids)}
+        return index
+
+
+# ---------------------------------------------------------------------------
+# Index over all users
+# ---------------------------------------------------------------------------
+
+class LocalVectorIndex:
+    """
+    Per-user indexes, built lazily from the note store on a user's first
+    search and kept current by add/remove.
+
+    loader(user_id) returns that user's notes (dicts with _id and text).
+    With a directory, each user's index is saved after persist_every
+    changes and by flush() (also run at exit); a saved index is brought up
+    to date with the store when loaded, so notes written by another process
+    are embedded and deleted ones dropped.
+    """
+
+    def __init__(self, embedder, loader: Callable[[int], List[dict]],
+                 dtype: str = "float16", directory: Optional[str] = None,
+                 persist_every: int = 64):
+        self.embedder = embedder
+        self.loader = loader
+        self.dtype = dtype
+        self.directory = directory
+        self.persist_every = max(1, persist_every)
+        self._users: Dict[int, UserVectorIndex] = {}
+        self._owner: Dict[str, int] = {}
+        self._dirty: Dict[int, int] = {}  # user -> changes not yet saved
+        self._lock = threading.RLock()
+        if directory:
+            register_exit(self.flush)
+
+    def _path(self, user_id) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, self.embedder.name, self.dtype, str(user_id))
+
+    def _saved(self, user_id) -> bool:
+        path = self._path(user_id)
+        return bool(path) and os.path.exists(os.path.join(path, "docs.json"))
+
+    def _user(self, user_id) -> UserVectorIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                return index
+            notes = [n for n in self.loader(user_id) if n.get("text")]
+            if self._saved(user_id):
+                index = UserVectorIndex.load(self._path(user_id))
+                self._reconcile(user_id, index, notes)
+            else:
+                index = UserVectorIndex(self.embedder.dim, self.dtype)
+                if notes:
+                    self._add(index, notes)
+                self._persist(user_id, index)
+            self._users[user_id] = index
+            for note_id in index.ids:
+                self._owner[note_id] = user_id
+            return index
+
+    def _add(self, index: UserVectorIndex, notes: List[dict]):
+        vectors = self.embedder.embed([n["text"] for n in notes])
+        index.add(
+            [str(n["_id"]) for n in notes],
+            vectors,
+            [{"_id": str(n["_id"]), "text": n["text"], "metadata": n.get("metadata", {})} for n in notes],
+        )
+
+    def _reconcile(self, user_id, index: UserVectorIndex, notes: List[dict]):
+        """Embed stored notes the saved index lacks and drop the ones no longer stored"""
+        stored = {str(n["_id"]) for n in notes}
+        missing = [n for n in notes if str(n["_id"]) not in index._row]
+        stale = [note_id for note_id in index.ids if note_id not in stored]
+        if missing:
+            self._add(index, missing)
+        for note_id in stale:
+            index.remove(note_id)
+        if missing or stale:
+            print(f"[VECTOR INDEX] User {user_id}: saved index was stale "
+                  f"({len(missing)} added, {len(stale)} removed)")
+            self._persist(user_id, index)
+
+    def _persist(self, user_id, index: UserVectorIndex):
+        path = self._path(user_id)
+        if path:
+            index.save(path)
+        self._dirty.pop(user_id, None)
+
+    def _changed(self, user_id, count: int = 1):
+        """Record unsaved changes; the index is written once enough have built up"""
+        if not self.directory:
+            return
+        self._dirty[user_id] = self._dirty.get(user_id, 0) + count
+        if self._dirty[user_id] >= self.persist_every:
+            self._persist(user_id, self._users[user_id])
+
+    def flush(self):
+        """Save every index with unsaved changes"""
+        with self._lock:
+            for user_id in list(self._dirty):
+                self._persist(user_id, self._users[user_id])
+
+    def add(self, user_id, notes: List[dict]):
+        """Index newly stored notes (embedded as one batch)"""
+        notes = [n for n in notes if n.get("text")]
+        if not notes:
+            return
+        with self._lock:
+            if user_id not in self._users and not self._saved(user_id):
+                # Not built yet: the first search reads these from the store
+                return
+            loaded = user_id in self._users
+            index = self._user(user_id)
+            if not loaded:
+                # Loading reconciled the index with the store, which already has them
+                notes = [n for n in notes if str(n["_id"]) not in index._row]
+                if not notes:
+                    return
+            self._add(index, notes)
+            for note in notes:
+                self._owner[str(note["_id"])] = user_id
+            self._changed(user_id, len(notes))
+
+    def remove(self, note_id, user_id=None) -> bool:
+        """Drop a note; pass user_id so a saved, not yet loaded index is updated too"""
+        note_id = str(note_id)
+        with self._lock:
+            user_id = self._owner.pop(note_id, user_id)
+            if user_id is None:
+                return False
+            if user_id not in self._users:
+                if not self._saved(user_id):
+                    return False
+                self._user(user_id)
+                self._owner.pop(note_id, None)
+            removed = self._users[user_id].remove(note_id)
+            if removed:
+                self._changed(user_id)
+            return removed
+
+    def search(self, user_id, queries: List[str], k: int = 5) -> List[List[dict]]:
+        """Top-k notes per query as documents with a $similarity score"""
+        return self.search_vectors(user_id, self.embedder.embed(queries), k)
+
+    def search_vectors(self, user_id, query_vectors: np.ndarray, k: int = 5) -> List[List[dict]]:
+        """search() for queries that are already embedded"""
+        index = self._user(user_id)
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        with self._lock:
+            hits = index.search(query_vectors, k)
+            return [
+                [{**index.docs[row], "$similarity": score} for row, score in query_hits]
+                for query_hits in hits
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "vectors": sum(index.size for index in self._users.values()),
+                "bytes": sum(index.size * index._matrix.itemsize * index.dim
+                             for index in self._users.values()),
+            }
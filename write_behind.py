@@ -0,0 +1,318 @@
+"""
+Write-behind queue for profile updates.
+
+Saves are reduced to the dotted paths that actually changed ($set only the
+dirty fields), coalesced per document in memory, and flushed by a single
+background thread about one flush interval later. Pending writes are
+journaled to disk so a failed flush is retried with backoff - across
+restarts too - until the store accepts it.
+
+Each process keeps its own journal (the configured path with the host
+name and pid added), so server processes never overwrite each other's
+entries. On start a process replays only journals of processes on its
+host that are no longer running, claiming each with an atomic rename so
+exactly one live process replays it.
+"""
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import copy
+import glob
+import json
+import os
+import socket
+import threading
+import time
+
+from resilience import register_exit
+
+
+def diff_paths(old: Any, new: Any, prefix: str = "") -> Dict[str, Any]:
+    """
+    Dotted $set paths that turn `old` into `new`.
+
+    Nested dicts are compared field by field. A dict that lost keys is set
+    as a whole, so the stored document ends up exactly equal to `new`.
+    """
+    if isinstance(old, dict) and isinstance(new, dict) and prefix:
+        if set(old) - set(new):
+            return {prefix: copy.deepcopy(new)}
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = {}
+        for key, value in new.items():
+            path = f"{prefix}.{key}" if prefix else key
+            if key not in old:
+                changes[path] = copy.deepcopy(value)
+            else:
+                changes.update(diff_paths(old[key], value, path))
+        return changes
+    if old == new and type(old) is type(new):
+        return {}
+    return {prefix: copy.deepcopy(new)}
+
+
+def set_path(doc: dict, path: str, value: Any):
+    """Assign `value` at a dotted path, creating intermediate dicts"""
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    target[parts[-1]] = value
+
+
+def apply_set(doc: dict, updates: Dict[str, Any]) -> dict:
+    """Apply a $set document to `doc` in place and return it"""
+    for path, value in updates.items():
+        set_path(doc, path, copy.deepcopy(value))
+    return doc
+
+
+def merge_set(pending: Dict[str, Any], updates: Dict[str, Any]):
+    """
+    Fold `updates` into `pending` so one $set carries both, later values winning.
+
+    Paths never overlap in the result (the Data API rejects a $set that
+    contains both "budget" and "budget.food").
+    """
+    for path, value in updates.items():
+        value = copy.deepcopy(value)
+        for existing in [p for p in pending if p.startswith(path + ".")]:
+            del pending[existing]
+        parent = next((p for p in pending if path.startswith(p + ".")), None)
+        if parent is not None and isinstance(pending[parent], dict):
+            set_path(pending[parent], path[len(parent) + 1:], value)
+        else:
+            pending[path] = value
+
+
+def process_journal_path(base: str, pid: Optional[int] = None) -> str:
+    """This process's journal: `base` with the host name and pid before the extension"""
+    stem, ext = os.path.splitext(base)
+    return f"{stem}.{socket.gethostname()}.{os.getpid() if pid is None else pid}{ext}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def orphaned_journals(base: str) -> List[str]:
+    """Journals left by processes on this host that are no longer running"""
+    stem, ext = os.path.splitext(base)
+    prefix = f"{stem}.{socket.gethostname()}."
+    orphans = [base] if os.path.exists(base) else []   # from before journals were per process
+    for path in glob.glob(glob.escape(prefix) + "*" + glob.escape(ext)):
+        pid = path[len(prefix):len(path) - len(ext)]
+        if pid.isdigit() and (int(pid) == os.getpid() or not _process_alive(int(pid))):
+            orphans.append(path)
+    return orphans
+
+
+class WriteBehindQueue:
+    """
+    Coalescing background writer.
+
+    flush_fn(key, updates) performs one $set for a document; it is always
+    called from the single writer thread, so writes to a key stay ordered.
+    journal_path is the base name of the per-process journals.
+    """
+
+    def __init__(self, flush_fn: Callable[[Hashable, Dict[str, Any]], Any],
+                 interval: float = 0.5, journal_path: Optional[str] = None,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.journal_base = journal_path
+        self.journal_path = process_journal_path(journal_path) if journal_path else None
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._pending: Dict[Hashable, Dict[str, Any]] = {}
+        self._generation: Dict[Hashable, int] = {}
+        self._attempts: Dict[Hashable, int] = {}
+        self._retry_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+        self._loaded = False
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.failures = 0
+
+    # --- public API --------------------------------------------------------
+
+    def submit(self, key: Hashable, updates: Dict[str, Any]):
+        """Queue a $set for `key`; returns immediately"""
+        if not updates:
+            return
+        with self._lock:
+            self._load_journal()
+            if key in self._pending:
+                self.coalesced += 1
+            merge_set(self._pending.setdefault(key, {}), updates)
+            self._generation[key] = self._generation.get(key, 0) + 1
+            self.submitted += 1
+            self._write_journal()
+            self._start()
+            self._wakeup.notify()
+
+    def pending(self, key: Hashable) -> Dict[str, Any]:
+        """Updates queued for `key` but not yet acknowledged by the store"""
+        with self._lock:
+            self._load_journal()
+            return copy.deepcopy(self._pending.get(key, {}))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued write is stored (or timeout); True if drained"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._load_journal()
+            self._retry_at.clear()
+            self._wakeup.notify()
+            while self._pending:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "flushed": self.flushed,
+                "failures": self.failures,
+                "retrying": len(self._retry_at),
+            }
+
+    # --- journal -----------------------------------------------------------
+
+    def _claim(self, path: str) -> Optional[list]:
+        """Entries of an orphaned journal, or None if another process claimed it first"""
+        claimed = f"{path}.claimed-{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return None
+        try:
+            with open(claimed) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WRITE-BEHIND] Could not read journal {path}: {e}")
+            return None
+
+    def _load_journal(self):
+        """Replay writes left over by processes that have exited (lock held)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.journal_base:
+            return
+        claimed = []
+        for path in orphaned_journals(self.journal_base):
+            entries = self._claim(path)
+            if entries is None:
+                continue
+            claimed.append(path)
+            for key, updates in entries:
+                merge_set(self._pending.setdefault(key, {}), updates)
+                self._generation[key] = self._generation.get(key, 0) + 1
+        if not claimed:
+            return
+        # The entries live in this process's journal from now on
+        self._write_journal()
+        for path in claimed:
+            try:
+                os.remove(f"{path}.claimed-{os.getpid()}")
+            except OSError:
+                pass
+        if self._pending:
+            print(f"[WRITE-BEHIND] Replaying {len(self._pending)} pending write(s) from {len(claimed)} journal(s)")
+            self._start()
+
+    def _write_journal(self):
+        """Persist pending writes atomically (lock held)"""
+        if not self.journal_path:
+            return
+        tmp_path = f"{self.journal_path}.tmp"
+        try:
+            if not self._pending:
+                # Nothing left to replay: don't leave a file per process behind
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                return
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._pending.items()), f, default=str)
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            print(f"[WRITE-BEHIND] Could not write journal {self.journal_path}: {e}")
+
+    # --- writer thread -----------------------------------------------------
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            register_exit(lambda: self.flush(5.0))
+
+    def _due(self):
+        """Keys whose write is due now, and how long until the next retry (lock held)"""
+        now = time.monotonic()
+        due, wait = [], None
+        for key in self._pending:
+            retry_at = self._retry_at.get(key, 0)
+            if retry_at <= now:
+                due.append(key)
+            else:
+                wait = retry_at - now if wait is None else min(wait, retry_at - now)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due, wait = self._due()
+                while not due:
+                    self._wakeup.wait(wait)
+                    due, wait = self._due()
+            # Let rapid successive saves coalesce for up to one interval
+            time.sleep(self.interval)
+            with self._lock:
+                due, _ = self._due()
+                batch = [(key, copy.deepcopy(self._pending[key]), self._generation[key]) for key in due]
+            for key, updates, generation in batch:
+                self._flush_one(key, updates, generation)
+
+    def _flush_one(self, key: Hashable, updates: Dict[str, Any], generation: int):
+        try:
+            self.flush_fn(key, updates)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                attempts = self._attempts.get(key, 0) + 1
+                self._attempts[key] = attempts
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+                self._retry_at[key] = time.monotonic() + delay
+            print(f"[WRITE-BEHIND] Write for {key!r} failed (attempt {attempts}), retrying in {delay:.1f}s: {e}")
+            return
+
+        with self._lock:
+            self.flushed += 1
+            self._attempts.pop(key, None)
+            self._retry_at.pop(key, None)
+            # Saves that arrived during the write stay queued for the next round
+            if self._generation.get(key) == generation:
+                del self._pending[key]
+                del self._generation[key]
+            self._write_journal()
+            if not self._pending:
+                self._idle.notify_all()